@@ -0,0 +1,154 @@
+# Module for running many simulations of the same day with randomly varied conditions (Monte Carlo), to see how
+# mileage, finishing times and missed deadlines spread out. Used for capacity planning.
+import os
+import random
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import Constraints
+import DataStructures
+import InputCache
+import Package
+import Sim
+import SimClock
+import Truck
+
+# State kept by each worker process between simulations: the shared memory block holding the parsed input files, the
+# settings needed to build a simulation from it, and the distance matrix, which reads straight from the shared memory
+# and is kept (with its neighbor indexes) for every simulation the worker runs, and a route cache shared by those
+# simulations. Set up once per worker by initializeWorker.
+_worker = {}
+
+
+# Class that runs a batch of simulations across a pool of worker processes. The input files are parsed once, in the
+# parent process, and the parsed data is put in a block of shared memory that every worker reads from, so the files
+# are never parsed again and the data is not copied to each worker through a pipe. Each simulation in the batch varies:
+# 1. truck speed, by up to speed_variation (0.1 = +/- 10%) around speed
+# 2. late arrival times at the depot, pushed back by up to max_arrival_delay minutes
+# 3. address correction times, pushed back by up to max_correction_delay minutes
+# 4. traffic, as a multiplier between 1 and 1 + traffic_variation applied to every distance. The distances themselves
+# are never changed: the trucks are slowed down by the same factor, and the reported miles scaled up by it.
+# The random values for every simulation are drawn up front from seed, so the same seed always gives the same batch no
+# matter how the work is split between processes.
+class BatchRunner:
+    def __init__(self, filename_packages, filename_distances, filename_addresslist, num_addresses,
+                 filename_constraints=None, num_trucks=2, capacity=16, speed=18, speed_variation=0.1,
+                 max_arrival_delay=30, max_correction_delay=30, traffic_variation=0.2, max_workers=None):
+        self.filename_packages = filename_packages
+        self.filename_distances = filename_distances
+        self.filename_addresslist = filename_addresslist
+        self.num_addresses = num_addresses
+        self.filename_constraints = filename_constraints
+        self.num_trucks = num_trucks
+        self.capacity = capacity
+        self.speed = speed
+        self.speed_variation = speed_variation
+        self.max_arrival_delay = max_arrival_delay
+        self.max_correction_delay = max_correction_delay
+        self.traffic_variation = traffic_variation
+        self.max_workers = max_workers or os.cpu_count()
+
+    # Returns the varied conditions for num_simulations simulations, as a list of dictionaries
+    def createScenarios(self, num_simulations, seed=None):
+        generator = random.Random(seed)
+        scenarios = []
+        for number in range(num_simulations):
+            scenarios.append({
+                'number': number,
+                'speed': self.speed * generator.uniform(1 - self.speed_variation, 1 + self.speed_variation),
+                'arrival_delay': round(generator.uniform(0, self.max_arrival_delay) * 60),
+                'correction_delay': round(generator.uniform(0, self.max_correction_delay) * 60),
+                'traffic': generator.uniform(1, 1 + self.traffic_variation),
+            })
+        return scenarios
+
+    # Runs num_simulations simulations and returns (results, summary). results has one dictionary per simulation, in
+    # order; summary holds the statistics over all of them (see summarizeResults).
+    def run(self, num_simulations, seed=None):
+        packages = Package.PackagesToBeDelivered(self.filename_packages, self.filename_distances,
+                                                 self.filename_addresslist, self.num_addresses, use_cache=True)
+        snapshot = InputCache.buildSnapshot(packages, self.num_addresses)
+        scenarios = self.createScenarios(num_simulations, seed)
+        settings = {
+            'files': (self.filename_packages, self.filename_distances, self.filename_addresslist),
+            'num_addresses': self.num_addresses,
+            'filename_constraints': self.filename_constraints,
+            'num_trucks': self.num_trucks,
+            'capacity': self.capacity,
+        }
+        shared = shared_memory.SharedMemory(create=True, size=len(snapshot))
+        try:
+            shared.buf[:len(snapshot)] = snapshot
+            # hand each worker a few scenarios at a time, so the pool isn't dominated by messaging
+            chunk_size = max(1, num_simulations // (self.max_workers * 4))
+            with ProcessPoolExecutor(self.max_workers, initializer=initializeWorker,
+                                     initargs=(shared.name, settings)) as executor:
+                results = list(executor.map(runScenario, scenarios, chunksize=chunk_size))
+        finally:
+            shared.close()
+            shared.unlink()
+        return results, summarizeResults(results)
+
+
+# Sets up a worker process: attaches to the shared memory holding the parsed input files, loads the rules file, and
+# creates the route cache. The distances are the same in every simulation of the batch (traffic only changes the
+# speed), so a route worked out once can be reused by every later simulation on the worker.
+def initializeWorker(shared_memory_name, settings):
+    _worker['shared'] = shared_memory.SharedMemory(name=shared_memory_name)
+    _worker['settings'] = settings
+    _worker['constraints'] = Constraints.ConstraintRules(settings['filename_constraints'])
+    _worker['route_cache'] = DataStructures.RouteCache()
+
+
+# Runs one simulation in a worker process with the conditions given in scenario, and returns its results
+def runScenario(scenario):
+    settings = _worker['settings']
+    packages = Package.PackagesToBeDelivered(*settings['files'], settings['num_addresses'],
+                                             snapshot=_worker['shared'].buf)
+    if 'matrix' in _worker:
+        packages.address_matrix = _worker['matrix']
+    else:
+        _worker['matrix'] = packages.address_matrix
+    constraints = _worker['constraints'].returnDelayedCopy(scenario['arrival_delay'], scenario['correction_delay'])
+    # driving distance * traffic at speed takes as long as driving distance at speed / traffic
+    fleet = Truck.Fleet(settings['num_trucks'], settings['capacity'], scenario['speed'] / scenario['traffic'])
+    simulation = Sim.Simulation(*settings['files'], settings['num_addresses'], settings['capacity'], fleet=fleet,
+                                packages=packages, constraints=constraints, route_cache=_worker['route_cache'])
+    simulation.loadAndDeliver()
+    return summarizeSimulation(simulation, scenario)
+
+
+# Returns the results of a finished simulation: total miles, the time the last truck finished, and the number of
+# packages that were delivered late or not at all
+def summarizeSimulation(simulation, scenario):
+    store = simulation.new_packages.package_store
+    missed = len(store) - store.countRows('status', Package.STATUS_DELIVERED) + len(store.returnLateRows())
+    result = dict(scenario)
+    result['miles'] = simulation.total_distance_traveled * scenario['traffic']
+    result['finish_time'] = max(truck.truck_time for truck in simulation.fleet)
+    result['deadline_misses'] = missed
+    return result
+
+
+# Returns summary statistics for a batch of results: mean, standard deviation, minimum, median, 95th percentile and
+# maximum of the miles, finish times (seconds since midnight, plus the same values as HH:MM:SS) and deadline misses,
+# and how many simulations missed at least one deadline
+def summarizeResults(results):
+    summary = {'runs': len(results), 'runs_with_misses': sum(1 for result in results if result['deadline_misses'])}
+    for field in ('miles', 'finish_time', 'deadline_misses'):
+        values = sorted(result[field] for result in results)
+        if not values:
+            continue
+        summary[field] = {
+            'mean': statistics.fmean(values),
+            'stdev': statistics.stdev(values) if len(values) > 1 else 0.0,
+            'min': values[0],
+            'median': statistics.median(values),
+            'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+            'max': values[-1],
+        }
+    if 'finish_time' in summary:
+        summary['finish_time_display'] = {name: SimClock.toTimeString(value)
+                                          for name, value in summary['finish_time'].items() if name != 'stdev'}
+    return summary
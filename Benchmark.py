@@ -0,0 +1,200 @@
+# Module for measuring how the simulation performs as the number of packages and addresses grows. The sample files only
+# have 40 packages and 27 addresses, so synthetic input files of any size are generated here, in the same format as
+# packages.csv, addresslist.csv and distances.csv. Addresses are random points in a square, and distances are the
+# straight line distances between them, so they behave like real distances (the triangle inequality holds, up to
+# rounding to a tenth of a mile).
+# Each benchmark times loading the files, hash table and distance matrix lookups, routing, and a full simulated day,
+# and the results are written as JSON so runs can be compared against each other.
+#
+# Run from the command line, e.g.
+# python Benchmark.py --sizes 100x27,1000x100,10000x1000 --output report.json
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import DistanceStore
+import Package
+import RouteOptimizer
+import Sim
+import SimClock
+import Truck
+
+# (packages, addresses) sizes benchmarked when none are given
+DEFAULT_SIZES = ((100, 27), (1000, 100), (10000, 1000))
+# Width and height of the square the addresses are placed in, in miles
+AREA_SIZE = 12.0
+# Deadlines given to the time sensitive packages
+DEADLINES = ('9:00 AM', '10:30 AM', '12:00 PM')
+
+
+# Writes packages.csv, addresslist.csv and distances.csv for a synthetic day into directory. The hub is address 0 and
+# sits in the middle of the area. deadline_fraction of the packages get a deadline before the end of the day. Returns
+# the three file paths.
+def generateInputFiles(directory, num_packages, num_addresses, seed=0, deadline_fraction=0.2):
+    generator = random.Random(seed)
+    points = [(AREA_SIZE / 2, AREA_SIZE / 2)]
+    points.extend((generator.uniform(0, AREA_SIZE), generator.uniform(0, AREA_SIZE))
+                  for _ in range(num_addresses - 1))
+    addresses = ['HUB'] + [f"{number} Benchmark St" for number in range(1, num_addresses)]
+    filename_packages = os.path.join(directory, 'packages.csv')
+    filename_addresslist = os.path.join(directory, 'addresslist.csv')
+    filename_distances = os.path.join(directory, 'distances.csv')
+
+    with open(filename_addresslist, 'w', encoding='utf-8') as writer:
+        writer.writelines(f'"{address}"\n' for address in addresses)
+
+    with open(filename_distances, 'w', encoding='utf-8') as writer:
+        for row, (x, y) in enumerate(points):
+            writer.write(','.join(f"{math.hypot(x - other_x, y - other_y):.1f}"
+                                  for other_x, other_y in points[:row + 1]))
+            writer.write('\n')
+
+    with open(filename_packages, 'w', encoding='utf-8') as writer:
+        for package_id in range(1, num_packages + 1):
+            address = addresses[generator.randrange(1, num_addresses)]
+            if generator.random() < deadline_fraction:
+                deadline = generator.choice(DEADLINES)
+            else:
+                deadline = 'EOD'
+            zip = 84100 + generator.randrange(100)
+            writer.write(f"{package_id},{address},Salt Lake City,UT,{zip},{deadline},{generator.randint(1, 80)}\n")
+    return filename_packages, filename_distances, filename_addresslist
+
+
+# Runs function repeat times and returns (fastest time in seconds, result of the last call)
+def timeCall(function, repeat=1):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+# Benchmarks one set of input files. The fleet is sized at one truck for every packages_per_truck packages (at least
+# two), so every size finishes in about a working day. Returns a dictionary of results; times are in seconds.
+def benchmarkInputFiles(filenames, num_packages, num_addresses, repeat=1, packages_per_truck=40, capacity=16):
+    result = {'packages': num_packages, 'addresses': num_addresses}
+    result['load_seconds'], packages = timeCall(
+        lambda: Package.PackagesToBeDelivered(*filenames, num_addresses), repeat)
+
+    package_ids = packages.returnPackageIndices()
+    result['hash_lookup_seconds'], _ = timeCall(
+        lambda: [packages.packageHash.findDataInHashTable(package_id) for package_id in package_ids], repeat)
+
+    matrix = packages.address_matrix
+    generator = random.Random(0)
+    pairs = [(generator.randrange(num_addresses), generator.randrange(num_addresses)) for _ in range(100000)]
+    result['distance_lookups'] = len(pairs)
+    result['distance_lookup_seconds'], _ = timeCall(
+        lambda: [matrix.lookupDistance(source, dest) for source, dest in pairs], repeat)
+    result['matrix_bytes'] = len(matrix.array) * matrix.array.itemsize
+
+    # the same distances in a packed, memory mapped distance store file
+    store_path = os.path.join(os.path.dirname(filenames[0]), 'distances.tdsdist')
+    result['distance_store_build_seconds'], store = timeCall(
+        lambda: DistanceStore.buildDistanceFile(store_path, num_addresses, packages.loadDistanceFile, filenames[1]))
+    store.close()
+    result['distance_store_open_seconds'], store = timeCall(lambda: DistanceStore.openDistanceFile(store_path))
+    result['distance_store_bytes'] = os.path.getsize(store_path)
+    result['distance_store_lookup_seconds'], _ = timeCall(
+        lambda: [store.lookupDistance(source, dest) for source, dest in pairs], repeat)
+    store.close()
+
+    # built once and kept by the matrix, so the routing below doesn't include it
+    result['neighbor_index_seconds'], _ = timeCall(matrix.returnNeighborIndex)
+    location_codes = list(range(1, num_addresses))
+    optimizer = RouteOptimizer.RouteOptimizer(matrix)
+    result['nearest_neighbor_seconds'], route = timeCall(
+        lambda: optimizer.nearestNeighborRoute(0, location_codes), repeat)
+    result['nearest_neighbor_miles'] = optimizer.routeLength(0, route)
+    result['optimized_route_seconds'], route = timeCall(lambda: optimizer.optimizeRoute(0, location_codes), repeat)
+    result['optimized_route_miles'] = optimizer.routeLength(0, route)
+
+    num_trucks = max(2, math.ceil(num_packages / packages_per_truck))
+    result['trucks'] = num_trucks
+
+    def runDay():
+        simulation = Sim.Simulation(*filenames, num_addresses, capacity, fleet=Truck.Fleet(num_trucks, capacity),
+                                    packages=Package.PackagesToBeDelivered(*filenames, num_addresses))
+        start = time.perf_counter()
+        simulation.loadAndDeliver()
+        return time.perf_counter() - start, simulation
+
+    # loading the files again for every day is not part of the simulation time
+    days = [runDay() for _ in range(repeat)]
+    result['simulation_seconds'] = min(seconds for seconds, _ in days)
+    simulation = days[-1][1]
+    store = simulation.new_packages.package_store
+    delivered = store.returnRows('status', Package.STATUS_DELIVERED)
+    result['simulation_miles'] = simulation.total_distance_traveled
+    result['delivered'] = len(delivered)
+    result['late'] = len(store.returnLateRows())
+    result['finish_time'] = SimClock.toTimeString(max(truck.truck_time for truck in simulation.fleet))
+    return result
+
+
+# Generates input files for every (packages, addresses) size and benchmarks them. The files are written to directory,
+# or to a temporary directory that is removed afterwards. Returns the report as a dictionary.
+def runBenchmarks(sizes=DEFAULT_SIZES, seed=0, repeat=1, directory=None):
+    report = {
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'repeat': repeat,
+        'results': [],
+    }
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        for num_packages, num_addresses in sizes:
+            size_directory = os.path.join(directory or temporary_directory, f"{num_packages}x{num_addresses}")
+            os.makedirs(size_directory, exist_ok=True)
+            generation_seconds, filenames = timeCall(
+                lambda: generateInputFiles(size_directory, num_packages, num_addresses, seed))
+            result = benchmarkInputFiles(filenames, num_packages, num_addresses, repeat)
+            result['generation_seconds'] = generation_seconds
+            report['results'].append(result)
+    return report
+
+
+# Turns "100x27,1000x100" into ((100, 27), (1000, 100))
+def parseSizes(text):
+    sizes = []
+    for size in text.split(','):
+        num_packages, _, num_addresses = size.strip().lower().partition('x')
+        if not num_addresses or int(num_addresses) < 2:
+            raise argparse.ArgumentTypeError(f"sizes must look like PACKAGESxADDRESSES with at least 2 addresses, "
+                                             f"not '{size}'")
+        sizes.append((int(num_packages), int(num_addresses)))
+    return tuple(sizes)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark the delivery simulation on synthetic input files.')
+    parser.add_argument('--sizes', type=parseSizes, default=DEFAULT_SIZES,
+                        help='comma separated PACKAGESxADDRESSES sizes, e.g. 100x27,1000x100')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the generated files')
+    parser.add_argument('--repeat', type=int, default=1, help='times each step is run; the fastest time is kept')
+    parser.add_argument('--directory', help='keep the generated files in this directory')
+    parser.add_argument('--output', help='write the JSON report to this file instead of standard output')
+    options = parser.parse_args(arguments)
+    report = runBenchmarks(options.sizes, options.seed, options.repeat, options.directory)
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as writer:
+            json.dump(report, writer, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
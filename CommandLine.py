@@ -0,0 +1,307 @@
+# Module for running simulations from the command line without the menu, for use in scripts, cron jobs and pipelines.
+# Every setting is given as an option, the full day is simulated once per run, and the state at each pause time is
+# written out as CSV or JSON Lines, to standard output or a file. Several runs with different settings can be given in
+# a batch file: one JSON object per line, each holding the options that differ from the command line ones, e.g.
+# {"trucks": 3, "capacity": 12, "pause": ["09:00", "12:00"]}
+#
+# e.g. python main.py --pause 09:00 --pause 12:03 --format jsonl --output status.jsonl
+import argparse
+import csv
+import json
+import sys
+
+import DataStructures
+import Package
+import ParallelPlanner
+import ReportWriter
+import RouteAssigner
+import RouteOptimizer
+import RunHistory
+import Sim
+import SimClock
+import Truck
+
+# Kinds of report that can be written. "packages" has a row per package per pause time, "summary" a row per pause
+# time.
+PACKAGE_FIELDS = ('run', 'pause_time') + ReportWriter.PACKAGE_FIELDS
+SUMMARY_FIELDS = ('run', 'pause_time', 'total_miles', 'truck_miles', 'delivered', 'late', 'not_delivered')
+REPORT_FIELDS = {'packages': PACKAGE_FIELDS, 'summary': SUMMARY_FIELDS}
+
+# Options that also apply to the interactive menu. Setting any other option runs without the menu (see
+# isNonInteractive).
+MENU_OPTIONS = ('profile', 'history')
+# Options that can be set per run in a batch file
+RUN_SETTINGS = ('packages', 'distances', 'addresses', 'num_addresses', 'constraints', 'trucks', 'drivers', 'capacity',
+                'speed', 'pause', 'routing', 'workers', 'distance_store')
+
+
+# Returns the argument parser for main.py. Options other than MENU_OPTIONS switch main.py to non-interactive mode (see
+# isNonInteractive).
+def buildParser():
+    parser = argparse.ArgumentParser(description='WGUPS package delivery simulation. Without options the interactive '
+                                                 'menu is shown.')
+    parser.add_argument('--profile', action='store_true',
+                        help='time the phases of the simulation, count lookups, and print a cProfile report on exit')
+    parser.add_argument('--headless', action='store_true',
+                        help='run without the menu (implied by setting any other option except --profile and '
+                             '--history)')
+    parser.add_argument('--packages', default='packages.csv', help='package file (default packages.csv)')
+    parser.add_argument('--distances', default='distances.csv', help='distance file (default distances.csv)')
+    parser.add_argument('--distance-store', dest='distance_store',
+                        help='keep the distances in this memory mapped file, built from the distance file the first '
+                             'time (for very large address sets; see DistanceStore)')
+    parser.add_argument('--addresses', default='addresslist.csv', help='address file (default addresslist.csv)')
+    parser.add_argument('--num-addresses', dest='num_addresses', type=parsePositiveInteger,
+                        help='number of addresses (default: the number of lines in the address file)')
+    parser.add_argument('--constraints', default='constraints.csv',
+                        help="special handling rules file (default constraints.csv, 'none' for no rules)")
+    parser.add_argument('--trucks', type=parsePositiveInteger, default=2, help='number of trucks (default 2)')
+    parser.add_argument('--drivers', type=parsePositiveInteger,
+                        help='number of drivers; a truck only leaves the depot when one is free (default: one per '
+                             'truck)')
+    parser.add_argument('--capacity', type=parsePositiveInteger, default=16, help='packages each truck holds (default 16)')
+    parser.add_argument('--speed', type=parsePositiveNumber, default=18, help='truck speed in miles per hour (default 18)')
+    parser.add_argument('--pause', action='append', type=parsePause,
+                        help='time to report the state at, HH:MM; may be repeated or comma separated '
+                             '(default: the end of the day)')
+    parser.add_argument('--routing', choices=('planned', 'nearest'), default='planned',
+                        help='planned: savings assignment and deadline aware routes (default); '
+                             'nearest: nearest neighbor')
+    parser.add_argument('--workers', type=parseCount, default=0,
+                        help='with planned routing, plan the trucks\' routes in parallel on this many worker processes '
+                             '(default 0: one truck after another in this process)')
+    parser.add_argument('--report', choices=tuple(REPORT_FIELDS), default='packages',
+                        help='a row per package (default), or a summary row per pause time')
+    parser.add_argument('--fields', type=parseFields,
+                        help='comma separated fields to write, in order (default: every field of the report)')
+    parser.add_argument('--order', choices=ReportWriter.ORDERS, default='id',
+                        help='order of the package rows at each pause time: by package id (default), by truck and '
+                             'delivery order, or as loaded')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv', help='output format (default csv)')
+    parser.add_argument('--output', help='file to write to (default standard output)')
+    parser.add_argument('--history', help='SQLite database to record every run in (see RunHistory)')
+    parser.add_argument('--batch', help='JSON Lines file with one run per line; each line overrides the options above')
+    return parser
+
+
+# Turns "package_id,status" into ('package_id', 'status')
+def parseFields(text):
+    return tuple(field.strip() for field in text.split(',') if field.strip())
+
+
+# Checks a --pause value (one or more comma separated HH:MM times), for argparse. Returns it unchanged.
+def parsePause(text):
+    try:
+        returnPauseTimes(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+    return text
+
+
+# Turns an option value into a whole number of at least minimum, for argparse
+def parseInteger(text, minimum):
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}' is not a whole number")
+    if value < minimum:
+        raise argparse.ArgumentTypeError(f"{value} is less than {minimum}")
+    return value
+
+
+def parsePositiveInteger(text):
+    return parseInteger(text, 1)
+
+
+def parseCount(text):
+    return parseInteger(text, 0)
+
+
+# Turns an option value into a number greater than zero, for argparse
+def parsePositiveNumber(text):
+    try:
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}' is not a number")
+    if not value > 0:
+        raise argparse.ArgumentTypeError(f"{text} is not greater than 0")
+    return value
+
+
+# Returns the fields to write for the options: the ones asked for with --fields, or every field of the report
+def returnFields(options):
+    fields = REPORT_FIELDS[options.report]
+    if not options.fields:
+        return fields
+    unknown = [field for field in options.fields if field not in fields]
+    if unknown:
+        raise ValueError(f"unknown {options.report} report fields {unknown}, expected some of {', '.join(fields)}")
+    return options.fields
+
+
+# True if the options ask for a run without the menu: --headless, or any report or simulation option set to something
+# other than its default
+def isNonInteractive(options):
+    defaults = vars(buildParser().parse_args([]))
+    return any(value != defaults[name] for name, value in vars(options).items() if name not in MENU_OPTIONS)
+
+
+# Returns the settings for every run, as (where the run came from, settings) pairs: one run from the options, or one
+# per line of the batch file. Raises ValueError, naming the line, for a batch line that isn't a JSON object, has
+# settings that don't exist, or has pause times that can't be read.
+def returnRunSettings(options):
+    base = {name: getattr(options, name) for name in RUN_SETTINGS}
+    if not options.batch:
+        return [('the command line', base)]
+    runs = []
+    with open(options.batch, encoding='utf-8') as reader:
+        for line_number, line in enumerate(reader, start=1):
+            if not line.strip():
+                continue
+            source = f"{options.batch} line {line_number}"
+            try:
+                overrides = json.loads(line)
+            except ValueError as error:
+                raise ValueError(f"{source}: not valid JSON ({error})")
+            if not isinstance(overrides, dict):
+                raise ValueError(f"{source}: expected a JSON object of settings")
+            unknown = set(overrides) - set(RUN_SETTINGS)
+            if unknown:
+                raise ValueError(f"{source}: unknown settings {sorted(unknown)}")
+            try:
+                returnPauseTimes(overrides.get('pause'))
+            except ValueError as error:
+                raise ValueError(f"{source}: {error}")
+            settings = dict(base)
+            settings.update(overrides)
+            runs.append((source, settings))
+    return runs
+
+
+# Returns the pause times of a run in seconds, in order. Times may be given as a list, comma separated, or both, as
+# HH:MM or HH:MM:SS. Raises ValueError for a time that can't be read or isn't a time of day.
+def returnPauseTimes(pause):
+    if not pause:
+        return [SimClock.SIMULATION_END]
+    if isinstance(pause, str):
+        pause = [pause]
+    times = []
+    for value in pause:
+        times.extend(parsePauseTime(part) for part in str(value).split(',') if part.strip())
+    return sorted(times)
+
+
+# Turns one HH:MM or HH:MM:SS pause time into seconds since midnight
+def parsePauseTime(text):
+    parts = text.strip().split(':')
+    if len(parts) in (2, 3) and all(part.isdigit() for part in parts):
+        hour, minute, second = (int(part) for part in parts + ['0'] * (3 - len(parts)))
+        if hour < 24 and minute < 60 and second < 60:
+            return hour * 3600 + minute * 60 + second
+    raise ValueError(f"invalid pause time '{text.strip()}', expected HH:MM between 00:00 and 23:59")
+
+
+# Returns the number of addresses in an address file
+def countAddresses(filename):
+    with open(filename, newline='', encoding='utf-8-sig') as reader:
+        return sum(1 for row in csv.reader(reader) if row)
+
+
+# Builds the simulation for one run's settings and runs the whole day
+def runDay(settings, route_cache=None):
+    num_addresses = settings['num_addresses'] or countAddresses(settings['addresses'])
+    constraints = settings['constraints']
+    if constraints is not None and constraints.lower() == 'none':
+        constraints = None
+    fleet = Truck.Fleet(settings['trucks'], settings['capacity'], settings['speed'], drivers=settings.get('drivers'))
+    packages = Package.PackagesToBeDelivered(settings['packages'], settings['distances'], settings['addresses'],
+                                             num_addresses, use_cache=True,
+                                             distance_store=settings.get('distance_store'))
+    simulation = Sim.Simulation(settings['packages'], settings['distances'], settings['addresses'], num_addresses,
+                                settings['capacity'], use_cache=True, fleet=fleet, filename_of_constraints=constraints,
+                                packages=packages, route_cache=route_cache)
+    if settings['routing'] == 'planned':
+        distance_matrix = simulation.new_packages.address_matrix
+        simulation.route_assigner = RouteAssigner.SavingsAssigner(distance_matrix)
+        simulation.deadline_router = RouteOptimizer.DeadlineRouter(distance_matrix)
+        if settings.get('workers'):
+            simulation.route_planner = ParallelPlanner.ParallelPlanner(distance_matrix, settings['workers'])
+    try:
+        simulation.loadAndDeliver()
+    finally:
+        if simulation.route_planner is not None:
+            simulation.route_planner.close()
+    return simulation
+
+
+# Returns a row for every package, as it was at pause_time, holding the given package fields, in the given order (see
+# ReportWriter.ORDERS)
+def returnPackageRows(simulation, run, pause_time, fields=ReportWriter.PACKAGE_FIELDS, order='id'):
+    store = simulation.timeline.returnPackagesAt(pause_time)
+    extra = {'run': run, 'pause_time': SimClock.toTimeString(pause_time)}
+    return ReportWriter.generatePackageRows(store, fields, order, extra)
+
+
+# Returns the summary row for a run at pause_time
+def returnSummaryRow(simulation, run, pause_time):
+    timeline = simulation.timeline
+    store = timeline.returnPackagesAt(pause_time)
+    delivered = store.returnRows('status', Package.STATUS_DELIVERED)
+    return {
+        'run': run,
+        'pause_time': SimClock.toTimeString(pause_time),
+        'total_miles': round(timeline.returnTotalMilesAt(pause_time), 1),
+        'truck_miles': {str(truck.truck_number): round(timeline.returnTruckMilesAt(truck.truck_number, pause_time), 1)
+                        for truck in simulation.fleet},
+        'delivered': len(delivered),
+        'late': len(store.returnLateRows()),
+        'not_delivered': len(store) - len(delivered),
+    }
+
+
+# Returns every report row for all runs (see returnRunSettings), one run at a time. Package rows only hold the package
+# fields in fields. If a RunHistory is given every run is recorded in it as well. Runs that use the same distances
+# share a route cache, so routes already worked out by an earlier run of the batch are not worked out again.
+# A run that can't be simulated (a missing file, or settings the rules can't be met with) is skipped: the reason is
+# written to standard error and added to failures, and the other runs carry on.
+def returnRows(runs, report, fields=PACKAGE_FIELDS, order='id', history=None, failures=None):
+    package_fields = [field for field in fields if field in ReportWriter.PACKAGE_FIELDS]
+    route_caches = {}
+    for run, (source, settings) in enumerate(runs, start=1):
+        distances = (settings['distances'], settings['addresses'], settings['num_addresses'],
+                     settings.get('distance_store'))
+        route_cache = route_caches.setdefault(distances, DataStructures.RouteCache())
+        try:
+            simulation = runDay(settings, route_cache)
+        except (OSError, ValueError) as error:
+            message = f"run {run} ({source}) skipped: {error}"
+            print(message, file=sys.stderr)
+            if failures is not None:
+                failures.append(message)
+            continue
+        if history is not None:
+            history.recordRun(simulation, settings)
+        for pause_time in returnPauseTimes(settings['pause']):
+            if report == 'summary':
+                yield returnSummaryRow(simulation, run, pause_time)
+            else:
+                yield from returnPackageRows(simulation, run, pause_time, package_fields, order)
+
+
+# Runs the simulations asked for by the options and writes the report, through a buffered sink, to the output file or
+# standard output. Runs are recorded in the --history database if one is given. Returns the messages for the runs that
+# failed and were skipped (see returnRows). Raises ValueError (or OSError) before anything is run if the fields or the
+# batch file are wrong.
+def run(options):
+    runs = returnRunSettings(options)
+    fields = returnFields(options)
+    failures = []
+    history = RunHistory.RunHistory(options.history) if options.history else None
+    try:
+        rows = returnRows(runs, options.report, fields, options.order, history, failures)
+        with ReportWriter.openSink(options.format, fields, options.output) as sink:
+            sink.writeRows(rows)
+    finally:
+        if history is not None:
+            history.close()
+    return failures
@@ -0,0 +1,113 @@
+# Module to manage the special handling rules for packages. Rules are read from a CSV file, one rule per line, in the
+# form package id, rule, value(s). The supported rules are:
+# 1. truck - the package can only go on the given truck. e.g. 3,truck,2
+# 2. group - packages with the same group name must be delivered together, so they all go on the same truck.
+# e.g. 13,group,A
+# 3. available - the package doesn't arrive at the depot until the given time. e.g. 6,available,09:05
+# 4. deadline - replaces the deadline given in the package file. e.g. 15,deadline,9:00 AM
+# 5. address - the package's address is wrong. The correct address is known from the given time, and the package can't
+# be delivered before then. e.g. 9,address,10:20,410 S State St,Salt Lake City,84111
+# 6. cancel - the package is cancelled at the given time, and is not delivered if it hasn't been already.
+# e.g. 27,cancel,11:00
+import csv
+
+import SimClock
+
+
+# Class that holds the rules for a day's packages. The rules are compiled into dictionaries keyed by package id when the
+# file is loaded, so checking whether a package has a rule is O(1). If no file is given there are no rules.
+class ConstraintRules:
+    def __init__(self, filename_rules=None):
+        self.file = filename_rules
+        self.truck_by_package = {}  # package id -> truck number
+        self.group_by_package = {}  # package id -> group name
+        self.members_by_group = {}  # group name -> list of package ids
+        self.available_by_package = {}  # package id -> time it arrives at the depot (seconds since midnight)
+        self.deadline_by_package = {}  # package id -> deadline, in the same format as the package file
+        self.correction_by_package = {}  # package id -> (time, address, city, zip)
+        self.cancellation_by_package = {}  # package id -> time it is cancelled (seconds since midnight)
+        if filename_rules is not None:
+            self.loadRulesFile()
+
+    # Load the rules from the CSV file. Lines with an unknown rule or missing values are collected, and reported
+    # together in a ValueError.
+    def loadRulesFile(self):
+        problems = []
+        with open(self.file, newline='', encoding='utf-8-sig') as reader:
+            rules_file = csv.reader(reader, delimiter=',')
+            for line_number, row in enumerate(rules_file, start=1):
+                row = [cell.strip() for cell in row]
+                if not any(row):
+                    continue
+                try:
+                    self.addRule(int(row[0]), row[1].lower(), row[2:])
+                except (IndexError, ValueError) as error:
+                    problems.append(f"line {line_number}: {error}")
+        if problems:
+            raise ValueError(f"Malformed rules file {self.file}:\n" + "\n".join(problems))
+
+    # Adds a single rule for a package. values are the fields that follow the rule name.
+    def addRule(self, package_id, rule, values):
+        if rule == 'truck':
+            self.truck_by_package[package_id] = int(values[0])
+        elif rule == 'group':
+            group = values[0]
+            self.group_by_package[package_id] = group
+            self.members_by_group.setdefault(group, []).append(package_id)
+        elif rule == 'available':
+            self.available_by_package[package_id] = SimClock.toSeconds(values[0])
+        elif rule == 'deadline':
+            SimClock.deadlineToSeconds(values[0])
+            self.deadline_by_package[package_id] = values[0]
+        elif rule == 'address':
+            if len(values) < 4:
+                raise ValueError("address rules need a time, address, city and zip")
+            self.correction_by_package[package_id] = (SimClock.toSeconds(values[0]), values[1], values[2], values[3])
+        elif rule == 'cancel':
+            self.cancellation_by_package[package_id] = SimClock.toSeconds(values[0])
+        else:
+            raise ValueError(f"unknown rule '{rule}'")
+
+    # Returns the truck a package must go on, or None if it can go on any truck
+    def returnTruckRestriction(self, package_id):
+        return self.truck_by_package.get(package_id)
+
+    # Returns the group a package belongs to, or None if it isn't in a group
+    def returnGroup(self, package_id):
+        return self.group_by_package.get(package_id)
+
+    # Returns the ids of all packages in a group
+    def returnGroupMembers(self, group):
+        return self.members_by_group.get(group, [])
+
+    # Returns the time a package arrives at the depot, or None if it is there from the start of the day
+    def returnAvailableTime(self, package_id):
+        return self.available_by_package.get(package_id)
+
+    # Returns the deadline that replaces the one in the package file, or None if there isn't one
+    def returnDeadline(self, package_id):
+        return self.deadline_by_package.get(package_id)
+
+    # Returns the (time, address, city, zip) correction for a package, or None if its address is correct
+    def returnAddressCorrection(self, package_id):
+        return self.correction_by_package.get(package_id)
+
+    # Returns the time a package is cancelled, or None if it isn't
+    def returnCancellation(self, package_id):
+        return self.cancellation_by_package.get(package_id)
+
+    # Returns a copy of the rules with every late arrival pushed back by available_delay seconds and every address
+    # correction pushed back by correction_delay seconds. Used to try out "what if things run late" scenarios.
+    def returnDelayedCopy(self, available_delay=0, correction_delay=0):
+        delayed = ConstraintRules()
+        delayed.file = self.file
+        delayed.truck_by_package = self.truck_by_package
+        delayed.group_by_package = self.group_by_package
+        delayed.members_by_group = self.members_by_group
+        delayed.deadline_by_package = self.deadline_by_package
+        delayed.cancellation_by_package = self.cancellation_by_package
+        delayed.available_by_package = {package_id: available_time + available_delay
+                                         for package_id, available_time in self.available_by_package.items()}
+        delayed.correction_by_package = {package_id: (correction[0] + correction_delay,) + correction[1:]
+                                         for package_id, correction in self.correction_by_package.items()}
+        return delayed
@@ -1,138 +1,496 @@
 # Module for managing data structures throughout the application
 
-import Package
+import heapq
+from array import array
+from collections import OrderedDict
+from itertools import accumulate
+from operator import itemgetter
 
+import Package
 
-# Class to manage a node object. Nodes are used by the Linked List class, and are subsequently used as a component of
-# the Hashtable class. Each Node consists of data, and a next "pointer" which will point to the next element in the list
-# Helper functions are provided to return Node data and the next item.
-class Node:
-    def __init__(self, data=None):
-        self.data = data
-        self.next = None
 
-    # Return the data associated with a node
-    def returnData(self):
-        return self.data
+# Markers for hash table slots that have never been used, and for slots whose entry has been removed. A removed slot
+# can't simply be marked empty, because a later key may have probed past it when it was inserted.
+_EMPTY = object()
+_DELETED = object()
 
-    # Return the next item
-    def returnNext(self):
-        return self.next
+# Number of distances NeighborIndex asks the matrix for at a time (see returnRows)
+ROW_BLOCK_VALUES = 1 << 20
 
 
-# Class to manage the LinkedList class. Each linked list consists of a head element that is a node initially.
-class LinkedList:
-    def __init__(self):
-        self.head = Node()
-
-    # Add a new object to an existing Linked List, at the end of the list
-    def addToLinkedList(self, data):
-        iterate = self.head
-        if iterate.data is None:
-            new_item = Node(data)
-            self.head = new_item
-        # list exists
-        else:
-            while iterate.next is not None:
-                iterate = iterate.next
-            new_item = Node(data)
-            iterate.next = new_item
-            new_item.next = None
-
-    # Prints all items in a particular linked list to the screen
-    def printAllLinkedList(self):
-        iterate = self.head
-        while iterate is not None:
-            print(iterate.data)
-            iterate = iterate.next
-
-    # Helper function that returns linked list data
-    def returnLinkedListData(self):
-        return self.head.returnData()
-
-    # Helper function that returns the next object in the Linked lis
-    def returnLinkedListNext(self):
-        return self.head.returnNext()
-
-
-# Managing the Hash Table object. Initialization creates an emtpy hash table of 100 elements with index 0-99, if another
-# number of hash table elements are not provided. Each slot in the created list (array) has a linked list attached to
-# it. In most cases, where the number of packages are less than 100, there are no collisions, and the linked list will
-# not be needed. But this implementation allows for growth over time, and eventual use of a larger data set if needed.
+# Managing the Hash Table object. The table uses open addressing: keys and values are kept in two parallel lists, and
+# a key that collides with an occupied slot is placed in the next free slot (linear probing). The number of slots is
+# always a power of two so the index is a bit mask rather than a division, and the table doubles in size whenever it
+# becomes more than max_load_factor full, so probe sequences stay short no matter how many packages are added.
+# Insert, lookup and removal are O(1) on average. size is the initial number of slots.
 class HashTable:
-    def __init__(self, size=100):
-        self.size = size
-        self.array = [LinkedList() for i in range(self.size)]
+    def __init__(self, size=128, max_load_factor=0.7):
+        self.size = 8
+        while self.size < size:
+            self.size = self.size * 2
+        self.max_load_factor = max_load_factor
+        self.keys = [_EMPTY] * self.size
+        self.values = [None] * self.size
+        self.count = 0  # number of keys stored
+        self.used = 0  # number of slots that are not empty (stored keys plus removed ones)
 
     # Calculate the index to use given the key value
     def calculateIndex(self, key):
-        index = key % 100
-        return index
+        return hash(key) & (self.size - 1)
 
-    # Adds a new key / value pair to the hash table. Uses a linked list to avoid collisions where they might occur
+    # Returns the slot that holds the key, or -1 if the key is not in the table
+    def findSlot(self, key):
+        mask = self.size - 1
+        index = hash(key) & mask
+        keys = self.keys
+        while True:
+            slot_key = keys[index]
+            if slot_key is _EMPTY:
+                return -1
+            if slot_key is not _DELETED and slot_key == key:
+                return index
+            index = (index + 1) & mask
+
+    # Adds a new key / value pair to the hash table. If the key already exists its value is replaced.
     def addToHashTable(self, key, value):
-        index = self.calculateIndex(key)
-        if self.array[index].returnLinkedListData() is None:
-            self.array[index].addToLinkedList(value)
-        else:
-            existing_list = self.array[index]
-            existing_list.addToLinkedList(value)
+        mask = self.size - 1
+        index = hash(key) & mask
+        keys = self.keys
+        free_slot = -1
+        while True:
+            slot_key = keys[index]
+            if slot_key is _EMPTY:
+                break
+            if slot_key is _DELETED:
+                if free_slot < 0:
+                    free_slot = index
+            elif slot_key == key:
+                self.values[index] = value
+                return
+            index = (index + 1) & mask
+        if free_slot < 0:
+            free_slot = index
+            self.used = self.used + 1
+        keys[free_slot] = key
+        self.values[free_slot] = value
+        self.count = self.count + 1
+        if self.used > self.size * self.max_load_factor:
+            self.resize(self.size * 2 if self.count > self.size * self.max_load_factor / 2 else self.size)
+
+    # Rebuilds the table with the given number of slots. Removed entries are dropped along the way.
+    def resize(self, new_size):
+        old_keys = self.keys
+        old_values = self.values
+        self.size = new_size
+        self.keys = [_EMPTY] * self.size
+        self.values = [None] * self.size
+        self.count = 0
+        self.used = 0
+        for index, key in enumerate(old_keys):
+            if key is not _EMPTY and key is not _DELETED:
+                self.addToHashTable(key, old_values[index])
+
+    # Removes a key from the hash table. Returns the value that was stored, or None if the key was not found
+    def removeFromHashTable(self, key):
+        index = self.findSlot(key)
+        if index < 0:
+            return None
+        value = self.values[index]
+        self.keys[index] = _DELETED
+        self.values[index] = None
+        self.count = self.count - 1
+        return value
 
     # Prints all hash table items if they exist
     def printAllHashTableContents(self):
-        for i in range(len(self.array)):
-            if self.array[i].returnLinkedListData() is not None:
-                self.array[i].printAllLinkedList()
-
-    # Look for an item in the hash table given it's unique index. Returns data of that entry
-    def findDataInHashTable(self, index):
-        key = self.calculateIndex(index)
-        temp = self.array[key].head
-        while temp.next:
-            if index == temp.data.id:
-                return temp.data
-            else:
-                temp = temp.next
-        # otherwise one one list member
-        return temp.data
-
-
-# is a list that includes the distances to all points from a given point
-class AdjacencyList:
-    def __init__(self, size):
-        self.size = size
-        self.list = [[] for i in range(self.size)]
+        for value in self.returnValues():
+            print(value)
+
+    # Look for an item in the hash table given it's unique key. Returns data of that entry, or None if there is no
+    # entry for the key
+    def findDataInHashTable(self, key):
+        index = self.findSlot(key)
+        if index < 0:
+            return None
+        return self.values[index]
+
+    # Returns the value for a key, or default if the key is not in the table
+    def get(self, key, default=None):
+        index = self.findSlot(key)
+        if index < 0:
+            return default
+        return self.values[index]
+
+    # Returns a list of all the values in the table, in slot order
+    def returnValues(self):
+        keys = self.keys
+        return [value for index, value in enumerate(self.values)
+                if keys[index] is not _EMPTY and keys[index] is not _DELETED]
+
+    # Returns a list of (key, value) pairs, in slot order
+    def returnItems(self):
+        values = self.values
+        return [(key, values[index]) for index, key in enumerate(self.keys)
+                if key is not _EMPTY and key is not _DELETED]
+
+    def __getitem__(self, key):
+        index = self.findSlot(key)
+        if index < 0:
+            raise KeyError(key)
+        return self.values[index]
+
+    def __setitem__(self, key, value):
+        self.addToHashTable(key, value)
+
+    def __delitem__(self, key):
+        index = self.findSlot(key)
+        if index < 0:
+            raise KeyError(key)
+        self.removeFromHashTable(key)
+
+    def __contains__(self, key):
+        return self.findSlot(key) >= 0
+
+    def __len__(self):
+        return self.count
+
+    # Iterates over the keys in the table, in slot order
+    def __iter__(self):
+        for key in self.keys:
+            if key is not _EMPTY and key is not _DELETED:
+                yield key
+
+
+# Keeps a single copy of each distinct string and hands out a small integer code for it. Many packages share the same
+# city, zip, deadline or address, so storing the code instead of the string saves memory, and comparing codes is
+# cheaper than comparing strings.
+class StringTable:
+    def __init__(self):
+        self.strings = []
+        self.codes = {}
+
+    # Returns the code for a string, adding the string to the table if it hasn't been seen before
+    def intern(self, string):
+        code = self.codes.get(string)
+        if code is None:
+            code = len(self.strings)
+            self.strings.append(string)
+            self.codes[string] = code
+        return code
+
+    # Returns the string for a code
+    def lookup(self, code):
+        return self.strings[code]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+# Class that remembers routes that have already been worked out, so routing the same set of stops again is a single
+# lookup. Keys are (starting location, frozenset of location codes, settings), where settings is anything hashable that
+# describes how the route was built; values are (route, length). The cache holds at most max_entries routes: each
+# lookup moves the route to the back of an ordered dictionary, and when the cache is full the route at the front (the
+# least recently used) is dropped. hits, misses and evictions count how the cache is doing.
+# Routes are only valid for the distance matrix they were worked out on, so each cache should only be used with one
+# matrix.
+class RouteCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.routes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Returns the key for a route from starting_location through location_codes, built with the given settings
+    def buildKey(self, starting_location, location_codes, settings=None):
+        return starting_location, frozenset(location_codes), settings
+
+    # Returns (route, length) stored under key, or None if there is none
+    def findRoute(self, key):
+        entry = self.routes.get(key)
+        if entry is None:
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        self.routes.move_to_end(key)
+        return entry
+
+    # Stores a route (a sequence of location codes) and its length under key
+    def addRoute(self, key, route, length):
+        self.routes[key] = (tuple(route), length)
+        self.routes.move_to_end(key)
+        while len(self.routes) > self.max_entries:
+            self.routes.popitem(last=False)
+            self.evictions = self.evictions + 1
+
+    # Returns the counters as a dictionary
+    def returnStats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self.routes), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        self.routes.clear()
+
+    def __len__(self):
+        return len(self.routes)
 
-    # Add a single distance to the adjacency list
-    def addDistanceToAdacencyList(self, distance):
-        self.list.insert(distance.location, distance.distance)
 
-    # prints the entire adjacency list
-    def printAdjacencyList(self):
-        for i in range(len(self.list)):
-            print(self.list[i])
+# Priority queue of timed events, backed by a binary heap. Events come out in time order. Events at the same time come
+# out in order of priority (lower first), and then in the order they were added. Adding and removing an event are
+# O(log n).
+class EventQueue:
+    def __init__(self):
+        self.heap = []
+        self.sequence = 0  # increases with every event added, so equal events keep their insertion order
+
+    # Adds an event. kind identifies what happens, data is anything the handler for that kind of event needs.
+    def addEvent(self, time, kind, data=None, priority=0):
+        heapq.heappush(self.heap, (time, priority, self.sequence, kind, data))
+        self.sequence = self.sequence + 1
+
+    # Removes and returns the next event as a (time, kind, data) tuple
+    def popEvent(self):
+        time, _, _, kind, data = heapq.heappop(self.heap)
+        return time, kind, data
+
+    # Returns the time of the next event without removing it
+    def peekTime(self):
+        return self.heap[0][0]
 
-    # returns a distance from the adjacency list
-    def returnDistance(self, dest_index):
-        return self.list[dest_index]
+    def __len__(self):
+        return len(self.heap)
 
 
-# class to manage the matrix that tracks distances between locations. Each position in the array represents a
-# destination. For each destination there is an adjacency list which describes the distance to each location
-# it is adjacent to
+# class to manage the matrix that tracks distances between locations. The matrix is stored as a single contiguous
+# array of doubles (row major, size x size). distances.csv only provides the lower triangle, so every value added is
+# mirrored into the upper triangle as well. This means a lookup is a single index calculation with no branching, and a
+# full row of distances from one location can be handed out without copying.
+# values is an optional buffer of size x size doubles to use instead of a new array, e.g. a view of a matrix in shared
+# memory; it is only read from.
 class DistanceMatrix:
-    def __init__(self, size):
+    def __init__(self, size, values=None):
+        self.size = size
+        self.array = array('d', bytes(8 * self.size * self.size)) if values is None else values
+        self.neighbor_indexes = {}  # neighbor count -> NeighborIndex, built the first time each is asked for
+
+    # Adds one row of the lower triangle to the matrix: distances holds the distances from location row_index to
+    # locations 0 to row_index. The values are written into the row, and mirrored down the matching column, with one
+    # slice assignment each.
+    def addRowToMatrix(self, row_index, distances):
+        values = array('d', distances)
+        start = row_index * self.size
+        self.array[start:start + len(values)] = values
+        self.array[row_index:row_index + len(values) * self.size:self.size] = values
+
+    # Returns the distance between two points. The inputs are both integers, that represent an address.
+    def lookupDistance(self, source_index, dest_index):
+        return self.array[source_index * self.size + dest_index]
+
+    # Returns a read only view of all distances from a single location. Indexing the view by a location code gives the
+    # distance to that location. No copy of the underlying data is made.
+    def returnRow(self, source_index):
+        start = source_index * self.size
+        return memoryview(self.array)[start:start + self.size].toreadonly()
+
+    # Returns the rows of locations start to stop - 1, one after another, as a single read only view. No copy of the
+    # underlying data is made.
+    def returnRows(self, start, stop):
+        return memoryview(self.array)[start * self.size:stop * self.size].toreadonly()
+
+    # Given a location code and a list of candidate location codes, returns the position in the list of the candidate
+    # that is closest. Ties are resolved in favour of the earlier candidate. The distances are gathered in a single
+    # call; finding the minimum still steps through the candidates in python, calling the key once for each.
+    def findClosest(self, source_index, location_codes):
+        if len(location_codes) == 1:
+            return 0
+        distances = itemgetter(*location_codes)(self.returnRow(source_index))
+        return min(range(len(distances)), key=distances.__getitem__)
+
+    # Returns the NeighborIndex holding the neighbor_count closest locations to every location. It is built the first
+    # time it is asked for and kept, so the matrix must be complete by then.
+    def returnNeighborIndex(self, neighbor_count=16):
+        neighbor_index = self.neighbor_indexes.get(neighbor_count)
+        if neighbor_index is None:
+            neighbor_index = NeighborIndex(self, neighbor_count)
+            self.neighbor_indexes[neighbor_count] = neighbor_index
+        return neighbor_index
+
+
+# Class that holds the same distances as DistanceMatrix in a quarter of the memory. Distances are symmetric, so only
+# the lower triangle is kept, packed row after row (row n holds the distances from location n to locations 0 to n, the
+# same as a row of distances.csv), as 4 byte floats: size * (size + 1) / 2 values in all, instead of size * size
+# doubles. Float values hold about 7 significant digits, far more than the tenth of a mile the distances are given in.
+# A lookup swaps its arguments so the larger location is the row, then finds the value with one index calculation.
+# Rows are not stored whole: a row is its packed part followed by one value from each later row, so returnRow builds
+# it, and keeps the most recently used row_cache_size rows. The offset of every packed row is kept in row_starts, so
+# the values from the later rows are gathered in one call. To go through every row, returnRows builds a block of rows
+# at a time, with one slice copy per location instead of one lookup per distance.
+# values is an optional buffer of size * (size + 1) / 2 floats to use instead of a new array, e.g. a memory mapped
+# file (see DistanceStore), which is then the file's path. close releases the buffer and the file.
+class PackedDistanceMatrix(DistanceMatrix):
+    def __init__(self, size, values=None, path=None, mapping=None, row_cache_size=64):
         self.size = size
-        self.array = [AdjacencyList(self.size) for i in range(self.size)]
+        self.array = array('f', bytes(4 * returnPackedLength(size))) if values is None else values
+        self.path = path
+        self.mapping = mapping  # the mmap holding values, if they come from a file
+        self.neighbor_indexes = {}
+        self.row_cache_size = row_cache_size
+        self.rows = OrderedDict()  # location code -> full row of distances, most recently used last
+        self.row_starts = array('q', accumulate(range(size)))  # location code -> offset of its packed row
 
-    # Adds an individual value to a matrix.
-    def addToMatrix(self, source_index, distance_obj):
-        self.array[source_index].addDistanceToAdacencyList(distance_obj)
+    # Adds one row of the lower triangle: distances holds the distances from location row_index to locations 0 to
+    # row_index, which is exactly the packed row, so it is written with one slice assignment
+    def addRowToMatrix(self, row_index, distances):
+        values = array('f', distances)
+        start = row_index * (row_index + 1) // 2
+        self.array[start:start + len(values)] = values
+        self.rows.clear()
 
     # Returns the distance between two points. The inputs are both integers, that represent an address.
     def lookupDistance(self, source_index, dest_index):
-        # determine the larger index
-        if source_index > dest_index:
-            return self.array[source_index].returnDistance(dest_index)
-        else:
-            return self.array[dest_index].returnDistance(source_index)
+        if source_index < dest_index:
+            source_index, dest_index = dest_index, source_index
+        return self.array[source_index * (source_index + 1) // 2 + dest_index]
+
+    # Returns a read only view of all distances from a single location, built from the packed row and the matching
+    # value of every later row
+    def returnRow(self, source_index):
+        row = self.rows.get(source_index)
+        if row is not None:
+            self.rows.move_to_end(source_index)
+            return row
+        values = self.array
+        start = self.row_starts[source_index]
+        distances = array('f', values[start:start + source_index + 1])
+        later_rows = self.row_starts[source_index + 1:]
+        if later_rows:
+            # the extra index 0 makes itemgetter return a tuple even when there is only one later row
+            distances.extend(itemgetter(0, *map(source_index.__add__, later_rows))(values)[1:])
+        row = memoryview(distances).toreadonly()
+        self.rows[source_index] = row
+        while len(self.rows) > self.row_cache_size:
+            self.rows.popitem(last=False)
+        return row
+
+    # Returns the rows of locations start to stop - 1, one after another, as a single read only view. The packed part of
+    # each row is copied with one slice, and the rest is filled in from the later rows: the values row n holds for
+    # locations start to stop - 1 sit next to each other, so each later row fills its column of the block with one
+    # slice copy too.
+    def returnRows(self, start, stop):
+        size = self.size
+        values = memoryview(self.array)
+        rows = memoryview(array('f', bytes(4 * size * (stop - start))))
+        for source_index in range(start, stop):
+            row_start = self.row_starts[source_index]
+            offset = (source_index - start) * size
+            rows[offset:offset + source_index + 1] = values[row_start:row_start + source_index + 1]
+        for dest_index in range(start + 1, size):
+            count = min(stop, dest_index) - start
+            row_start = self.row_starts[dest_index] + start
+            rows[dest_index:dest_index + count * size:size] = values[row_start:row_start + count]
+        return rows.toreadonly()
+
+    # Given a location code and a list of candidate location codes, returns the position in the list of the candidate
+    # that is closest. Ties are resolved in favour of the earlier candidate. Only the candidates are looked up, rather
+    # than building the whole row.
+    def findClosest(self, source_index, location_codes):
+        if len(location_codes) == 1:
+            return 0
+        lookup = self.lookupDistance
+        distances = [lookup(source_index, location_code) for location_code in location_codes]
+        return min(range(len(distances)), key=distances.__getitem__)
+
+    # Releases the values, and the file they are mapped from if there is one. The matrix can't be used afterwards.
+    def close(self):
+        self.rows.clear()
+        self.neighbor_indexes.clear()
+        if isinstance(self.array, memoryview):
+            self.array.release()
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+
+
+# Returns the number of values in the packed lower triangle of a size x size matrix
+def returnPackedLength(size):
+    return size * (size + 1) // 2
+
+
+# Class that keeps, for every location, the codes of its closest other locations, closest first. It is built once from
+# the distance matrix (O(n^2 log k) for n locations and k neighbors), reading the rows a block at a time (see
+# returnRows), and stored in one flat array with k entries per location. Finding the nearest location still to be
+# visited then walks a short list instead of scanning every candidate: with the candidates kept in a RemainingSet, the
+# walk stops at the first neighbor still in the set. Only when all k neighbors have been visited does it fall back to
+# scanning what is left.
+class NeighborIndex:
+    def __init__(self, distance_matrix, neighbor_count=16):
+        self.distance_matrix = distance_matrix
+        size = distance_matrix.size
+        self.neighbor_count = max(0, min(neighbor_count, size - 1))
+        self.neighbors = array('l')
+        locations = range(size)
+        block_rows = max(1, ROW_BLOCK_VALUES // max(size, 1))
+        for start in range(0, size, block_rows):
+            stop = min(start + block_rows, size)
+            rows = distance_matrix.returnRows(start, stop)
+            for source in range(start, stop):
+                offset = (source - start) * size
+                row = rows[offset:offset + size]
+                closest = heapq.nsmallest(self.neighbor_count + 1, locations, key=row.__getitem__)
+                if source in closest:
+                    closest.remove(source)
+                self.neighbors.extend(closest[:self.neighbor_count])
+
+    # Returns the closest locations to source, closest first, as a read only view
+    def returnNeighbors(self, source):
+        start = source * self.neighbor_count
+        return memoryview(self.neighbors)[start:start + self.neighbor_count].toreadonly()
+
+    # Returns the location in remaining (a RemainingSet) closest to source, or None if remaining is empty
+    def findNearest(self, source, remaining):
+        if not remaining:
+            return None
+        flags = remaining.flags
+        for location_code in self.returnNeighbors(source):
+            if flags[location_code]:
+                return location_code
+        location_codes = remaining.returnLocationCodes()
+        return location_codes[self.distance_matrix.findClosest(source, location_codes)]
+
+
+# Class that tracks a set of location codes as a bitmap, one byte per location in the matrix, so adding, removing and
+# checking a location is a single index operation. The codes that were added are also kept in a list, so the set can
+# be listed without scanning the whole bitmap; removed codes are dropped from that list the next time it is read.
+class RemainingSet:
+    def __init__(self, size, location_codes=()):
+        self.flags = bytearray(size)
+        self.count = 0
+        self.location_codes = []
+        for location_code in location_codes:
+            self.add(location_code)
+
+    def add(self, location_code):
+        if not self.flags[location_code]:
+            self.flags[location_code] = 1
+            self.count = self.count + 1
+            self.location_codes.append(location_code)
+
+    def discard(self, location_code):
+        if self.flags[location_code]:
+            self.flags[location_code] = 0
+            self.count = self.count - 1
+
+    # Returns the location codes still in the set, in the order they were added
+    def returnLocationCodes(self):
+        if len(self.location_codes) != self.count:
+            flags = self.flags
+            self.location_codes = [location_code for location_code in dict.fromkeys(self.location_codes)
+                                   if flags[location_code]]
+        return self.location_codes
+
+    def __contains__(self, location_code):
+        return self.flags[location_code] == 1
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,133 @@
+# Module for keeping the distance matrix in a file, for address sets too large to hold as a full matrix in memory. The
+# file holds the packed lower triangle of 4 byte floats used by DataStructures.PackedDistanceMatrix, and is memory
+# mapped rather than read: opening it costs nothing however large it is, pages are only read from disk when a distance
+# on them is looked up, and every process that opens the same file shares one copy of those pages.
+# The file is built from distances.csv once, streaming the rows straight into the mapped file. The header records
+# which csv it was built from (its full path, size and modification time), and the file is rebuilt whenever those no
+# longer match, so a store is never read for a different or changed csv.
+#
+# File layout:
+# 1. MAGIC
+# 2. the number of addresses, as an 8 byte unsigned integer, the byte order of the values ('<' or '>'), and the length
+# of the source description, as a 4 byte unsigned integer
+# 3. the source description: JSON holding the path, size and mtime_ns of the csv (see returnSource), or null
+# 4. padding up to a multiple of 8 bytes, so the values start on an aligned offset
+# 5. size * (size + 1) / 2 floats, row after row of the lower triangle
+import json
+import mmap
+import os
+import struct
+import sys
+
+import DataStructures
+
+MAGIC = b'TDSDIST2'
+HEADER_FORMAT = '<8sQcI'
+BYTE_ORDER = b'<' if sys.byteorder == 'little' else b'>'
+
+
+# Returns the offset of the values in a distance file whose source description is source_length bytes long
+def returnValuesOffset(source_length):
+    return -(-(struct.calcsize(HEADER_FORMAT) + source_length) // 8) * 8
+
+
+# Returns the number of bytes in a distance file for size addresses
+def returnFileSize(size, source_length):
+    return returnValuesOffset(source_length) + 4 * DataStructures.returnPackedLength(size)
+
+
+# Returns the description of a distance csv recorded in the files built from it: its full path, size and modification
+# time. None if filename_distances is None or not there.
+def returnSource(filename_distances):
+    if filename_distances is None:
+        return None
+    try:
+        stat = os.stat(filename_distances)
+    except OSError:
+        return None
+    return {'path': os.path.abspath(filename_distances), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+# Returns (number of addresses, source description, offset of the values) of a distance file, or None if it is
+# missing, damaged, or not a distance file written on a machine with this byte order
+def readHeader(path):
+    fixed_length = struct.calcsize(HEADER_FORMAT)
+    try:
+        with open(path, 'rb') as reader:
+            header = reader.read(fixed_length)
+            if len(header) < fixed_length:
+                return None
+            magic, size, byte_order, source_length = struct.unpack(HEADER_FORMAT, header)
+            if magic != MAGIC or byte_order != BYTE_ORDER:
+                return None
+            source = json.loads(reader.read(source_length))
+        if os.path.getsize(path) != returnFileSize(size, source_length):
+            return None
+    except (OSError, ValueError):
+        return None
+    return size, source, returnValuesOffset(source_length)
+
+
+# Returns the number of addresses in a distance file, or None if it is missing or not a distance file written on a
+# machine with this byte order
+def readSize(path):
+    header = readHeader(path)
+    return None if header is None else header[0]
+
+
+# True if the distance file at path holds size addresses and was built from filename_distances as it is now (the same
+# path, size and modification time). If filename_distances is not there the file is all there is, and only its size is
+# checked.
+def isUpToDate(path, size, filename_distances=None):
+    header = readHeader(path)
+    if header is None or header[0] != size:
+        return False
+    source = returnSource(filename_distances)
+    return source is None or header[1] == source
+
+
+# Opens the distance file at path read only. Returns a PackedDistanceMatrix reading from the mapped file.
+def openDistanceFile(path):
+    header = readHeader(path)
+    if header is None:
+        raise ValueError(f"{path} is not a distance file")
+    size, _, offset = header
+    with open(path, 'rb') as reader:
+        mapping = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+    values = memoryview(mapping)[offset:].cast('f')
+    return DataStructures.PackedDistanceMatrix(size, values, path, mapping)
+
+
+# Creates an empty distance file for size addresses at path (replacing any file there), recording source (see
+# returnSource) as what it is built from, and returns a PackedDistanceMatrix writing to it. Rows added with
+# addRowToMatrix go straight into the file; close the matrix when done.
+def createDistanceFile(path, size, source=None):
+    source_bytes = json.dumps(source, sort_keys=True).encode('utf-8')
+    offset = returnValuesOffset(len(source_bytes))
+    with open(path, 'wb') as writer:
+        header = struct.pack(HEADER_FORMAT, MAGIC, size, BYTE_ORDER, len(source_bytes)) + source_bytes
+        writer.write(header.ljust(offset, b'\0'))
+        writer.truncate(returnFileSize(size, len(source_bytes)))
+    with open(path, 'r+b') as file:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_WRITE)
+    values = memoryview(mapping)[offset:].cast('f')
+    return DataStructures.PackedDistanceMatrix(size, values, path, mapping)
+
+
+# Builds the distance file at path from filename_distances, calling load_rows with a matrix writing to a temporary
+# file, which replaces path once load_rows has finished without error. The csv is described in the header as it was
+# before loading started, so a csv changed during the build makes the file out of date straight away. Returns the
+# finished file, opened read only.
+def buildDistanceFile(path, size, load_rows, filename_distances=None):
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    matrix = createDistanceFile(temporary_path, size, returnSource(filename_distances))
+    try:
+        load_rows(matrix)
+        matrix.mapping.flush()
+    except BaseException:
+        matrix.close()
+        os.remove(temporary_path)
+        raise
+    matrix.close()
+    os.replace(temporary_path, path)
+    return openDistanceFile(path)
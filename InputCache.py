@@ -0,0 +1,171 @@
+# Module for caching the parsed input files. Parsing packages.csv, addresslist.csv and distances.csv is by far the
+# slowest part of starting a simulation, and the files rarely change, so the parsed data is written to a binary
+# snapshot the first time it is loaded and read back on later runs. A snapshot is only used if it was built from the
+# same input files: the key stored with it records the path, size and modification time of each file (plus the number
+# of addresses), and a snapshot with a different key is rebuilt.
+#
+# Snapshot layout:
+# 1. MAGIC
+# 2. 4 byte length of the header, followed by the header as JSON. The header holds the key, the interned strings, the
+# location index, and the type code and length of each array that follows.
+# 3. The raw bytes of each package column, then the raw bytes of the distance matrix. When the distances are kept in a
+# distance store file (see DistanceStore) the matrix is left out, and the key records the store file in place of the
+# distance csv.
+import hashlib
+import json
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = b'TDSSNAP1'
+CACHE_DIRECTORY = '__simcache__'
+
+# Snapshots already read (or written) by this process, by snapshot path. Each entry is (key, snapshot bytes), so
+# repeated simulations in the same process don't even need to read the file again.
+_loaded_snapshots = {}
+
+
+# Returns the key that identifies a set of input files. Any change to a file's size or modification time changes the
+# key.
+def buildKey(filenames, num_addresses):
+    files = []
+    for filename in filenames:
+        stat = os.stat(filename)
+        files.append([os.path.abspath(filename), stat.st_size, stat.st_mtime_ns])
+    return {'files': files, 'num_addresses': num_addresses, 'byteorder': sys.byteorder}
+
+
+# Returns the path of the snapshot for a set of input files (see returnInputFiles). The snapshot is kept in a cache
+# directory next to the package file, and named after the package file plus a hash of the full paths of all the files,
+# so runs that share a package file but use different distance or address files each keep their own snapshot.
+def snapshotPath(filenames):
+    filename_packages = filenames[0]
+    directory = os.path.join(os.path.dirname(os.path.abspath(filename_packages)), CACHE_DIRECTORY)
+    paths = '\n'.join(os.path.abspath(filename) for filename in filenames)
+    digest = hashlib.sha1(paths.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directory, f"{os.path.basename(filename_packages)}.{digest}.snapshot")
+
+
+# Returns the input files a PackagesToBeDelivered object is built from
+def returnInputFiles(packages):
+    distances = packages.file_distances if packages.distance_store is None else packages.distance_store
+    return packages.file, distances, packages.file_addresslist
+
+
+# Fills an empty PackagesToBeDelivered object from its snapshot. Returns True if a snapshot matching the current input
+# files was found and loaded, or False if the files need to be parsed.
+def loadSnapshot(packages, num_addresses):
+    filenames = returnInputFiles(packages)
+    try:
+        key = buildKey(filenames, num_addresses)
+    except OSError:
+        return False
+    path = snapshotPath(filenames)
+    cached = _loaded_snapshots.get(path)
+    if cached is None or cached[0] != key:
+        try:
+            with open(path, 'rb') as reader:
+                data = reader.read()
+        except OSError:
+            return False
+        cached = (readHeader(data)[0].get('key'), data)
+        _loaded_snapshots[path] = cached
+        if cached[0] != key:
+            return False
+    try:
+        fillFromSnapshot(packages, cached[1])
+    except ValueError:
+        # a damaged snapshot is rebuilt from the files, like one that doesn't match
+        del _loaded_snapshots[path]
+        return False
+    return True
+
+
+# Fills an empty PackagesToBeDelivered object from snapshot data (bytes, or any other buffer such as shared memory).
+# The data is copied, so the buffer can be reused or released afterwards. If share_matrix is True the distance matrix
+# is not copied but read in place, through a read only view of the buffer, which then has to outlive the object.
+# Raises ValueError, before anything is filled in, if the snapshot is damaged: an unreadable header, or less data than
+# the header lists.
+def fillFromSnapshot(packages, snapshot, share_matrix=False):
+    header, offset = readHeader(snapshot)
+    data = memoryview(snapshot)
+    try:
+        columns = [(name, array(type_code), int(length)) for name, type_code, length in header['columns']]
+        strings = list(header['strings'])
+        location_index = dict(header['location_index'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('snapshot header is damaged')
+    if offset + sum(column.itemsize * length for _, column, length in columns) > len(data):
+        raise ValueError('snapshot is shorter than its header says')
+    store = packages.package_store
+    for name, column, length in columns:
+        end = offset + length * column.itemsize
+        if name == 'matrix' and share_matrix:
+            column = data[offset:end].toreadonly().cast(column.typecode)
+        else:
+            column.frombytes(data[offset:end])
+        offset = end
+        if name == 'matrix':
+            packages.address_matrix.array = column
+        else:
+            setattr(store, name, column)
+    store.strings.strings = strings
+    store.strings.codes = {string: code for code, string in enumerate(strings)}
+    store.rebuildIndexes()
+    packages.location_index = location_index
+    for row, package_id in enumerate(store.ids):
+        packages.packageHash.addToHashTable(package_id, row)
+
+
+# Splits the header off the front of a snapshot. Returns the header and the offset where the array data starts. An
+# unreadable snapshot (wrong MAGIC, cut short, or a damaged header) gives an empty header, which never matches a key.
+def readHeader(data):
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        return {}, 0
+    start = len(MAGIC) + 4
+    data = memoryview(data)
+    try:
+        (header_length,) = struct.unpack('<I', data[len(MAGIC):start])
+        header = json.loads(bytes(data[start:start + header_length]))
+    except (struct.error, ValueError):
+        return {}, 0
+    if not isinstance(header, dict):
+        return {}, 0
+    return header, start + header_length
+
+
+# Returns the snapshot data for a PackagesToBeDelivered object, as bytes
+def buildSnapshot(packages, num_addresses):
+    filenames = returnInputFiles(packages)
+    store = packages.package_store
+    columns = [(name, getattr(store, name)) for name in store.COLUMNS]
+    if packages.distance_store is None:
+        columns.append(('matrix', packages.address_matrix.array))
+    header = {
+        'key': buildKey(filenames, num_addresses),
+        'strings': store.strings.strings,
+        'location_index': packages.location_index,
+        'columns': [[name, column.typecode, len(column)] for name, column in columns],
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    parts = [MAGIC, struct.pack('<I', len(header_bytes)), header_bytes]
+    parts.extend(column.tobytes() for _, column in columns)
+    return b''.join(parts)
+
+
+# Writes the snapshot for a freshly parsed PackagesToBeDelivered object
+def saveSnapshot(packages, num_addresses):
+    data = buildSnapshot(packages, num_addresses)
+    path = snapshotPath(returnInputFiles(packages))
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so a half written snapshot is never picked up
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'wb') as writer:
+            writer.write(data)
+        os.replace(temporary_path, path)
+    except OSError:
+        # the cache is only an optimization, so a read only directory just means the files are parsed every time
+        return
+    _loaded_snapshots[path] = (readHeader(data)[0]['key'], data)
@@ -0,0 +1,221 @@
+# Module for measuring where time goes inside a simulation. Instrumentation is opt in: nothing is measured, and the
+# simulation code runs exactly as written, until enable is called. enable wraps the methods listed in PHASES and
+# COUNTERS with versions that record into a Stats object, and disable puts the original methods back, so there is no
+# cost at all when it is off. Optionally the whole run is also captured with cProfile.
+#
+# Use from code:
+#     with Instrumentation.instrument(profile=True) as stats:
+#         simulation.loadAndDeliver()
+#     stats.printReport()
+# or from the command line with python main.py --profile
+import cProfile
+import io
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+
+import DataStructures
+import InputCache
+import Package
+import RouteAssigner
+import RouteOptimizer
+import Sim
+
+# Methods timed as phases: (owner, method name, phase name). Phases are inclusive, so a phase that calls another (the
+# event loop calling arrivals, say) includes the other's time as well.
+PHASES = (
+    (Package.PackagesToBeDelivered, 'loadPackageFile', 'load packages file'),
+    (Package.PackagesToBeDelivered, 'loadDistanceFile', 'load distances file'),
+    (Package.PackagesToBeDelivered, 'createLocationIndex', 'load address file'),
+    (InputCache, 'loadSnapshot', 'load snapshot'),
+    (InputCache, 'saveSnapshot', 'save snapshot'),
+    (Sim.Simulation, 'loadAndDeliver', 'simulation'),
+    (Sim.Simulation, 'runEvents', 'event loop'),
+    (Sim.Simulation, 'handleArrival', 'arrivals'),
+    (Sim.Simulation, 'loadRemainingSpace', 'truck loading'),
+    (Sim.Simulation, 'discoverShortestPathList', 'routing'),
+    (Sim.Simulation, 'planTruckRoute', 'deadline routing'),
+    (RouteOptimizer.RouteOptimizer, 'improveTour', 'local search'),
+    (RouteAssigner.SavingsAssigner, 'assignPackages', 'savings assignment'),
+    (DataStructures.NeighborIndex, '__init__', 'neighbor index build'),
+)
+
+# Methods counted: (owner, method name, counter name). Each call adds one to the counter.
+COUNTERS = (
+    (DataStructures.DistanceMatrix, 'lookupDistance', 'distance lookups'),
+    (DataStructures.DistanceMatrix, 'returnRow', 'distance row views'),
+    (DataStructures.PackedDistanceMatrix, 'lookupDistance', 'distance lookups'),
+    (DataStructures.PackedDistanceMatrix, 'returnRow', 'distance row views'),
+    (DataStructures.NeighborIndex, 'findNearest', 'route steps'),
+    (RouteOptimizer.DeadlineRouter, 'insertStop', 'deadline insertions'),
+    (DataStructures.EventQueue, 'popEvent', 'events'),
+    (Sim.Simulation, 'deliverPackage', 'deliveries'),
+)
+
+# The Stats object being recorded into, and the original methods that were replaced, while instrumentation is on
+_active_stats = None
+_originals = []
+
+
+# Class that holds what was measured: total seconds and number of calls for every phase, the counters, and the
+# cProfile capture if there was one. Counters other than plain call counts:
+# 1. distances compared: candidates checked by DistanceMatrix.findClosest
+# 2. hash lookups / hash probes: lookups and inserts on a HashTable, and the slots they looked at to find the key (or
+# an empty slot). Probes per lookup shows how well the table is spread.
+class Stats:
+    def __init__(self):
+        self.phase_seconds = {}
+        self.phase_calls = {}
+        self.counters = {}
+        self.profiler = None
+
+    # Adds amount to a counter
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Adds one timed call of a phase
+    def addPhase(self, name, seconds):
+        self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + seconds
+        self.phase_calls[name] = self.phase_calls.get(name, 0) + 1
+
+    # Times the code inside a with block as a phase
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addPhase(name, time.perf_counter() - start)
+
+    # Returns the cProfile capture as text, the limit most expensive functions by cumulative time, or None if there
+    # is no capture
+    def returnProfileText(self, limit=25):
+        if self.profiler is None:
+            return None
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+    # Returns the phases and counters as a dictionary
+    def returnReport(self):
+        return {
+            'phases': {name: {'seconds': seconds, 'calls': self.phase_calls[name]}
+                       for name, seconds in self.phase_seconds.items()},
+            'counters': dict(self.counters),
+        }
+
+    # Prints the phases (slowest first), the counters, and the cProfile capture if there is one
+    def printReport(self, file=None, profile_limit=25):
+        file = file or sys.stdout
+        print("Phase timings (inclusive):", file=file)
+        for name, seconds in sorted(self.phase_seconds.items(), key=lambda item: item[1], reverse=True):
+            print(f"  {name:<24} {seconds * 1000:12.3f} ms {self.phase_calls[name]:10d} calls", file=file)
+        print("Counters:", file=file)
+        for name, value in sorted(self.counters.items()):
+            print(f"  {name:<24} {value:12d}", file=file)
+        profile_text = self.returnProfileText(profile_limit)
+        if profile_text is not None:
+            print(profile_text, file=file)
+
+
+# Turns instrumentation on, recording into stats (a new Stats if none is given), and returns the Stats. If profile is
+# True the run is also captured with cProfile until disable is called.
+def enable(stats=None, profile=False):
+    global _active_stats
+    if _active_stats is not None:
+        disable()
+    _active_stats = stats or Stats()
+    for owner, method_name, phase_name in PHASES:
+        replaceMethod(owner, method_name, timedMethod(getattr(owner, method_name), phase_name))
+    for owner, method_name, counter_name in COUNTERS:
+        replaceMethod(owner, method_name, countedMethod(getattr(owner, method_name), counter_name))
+    for matrix_class in (DataStructures.DistanceMatrix, DataStructures.PackedDistanceMatrix):
+        replaceMethod(matrix_class, 'findClosest', comparedMethod(matrix_class.findClosest))
+    for method_name in ('findSlot', 'addToHashTable'):
+        replaceMethod(DataStructures.HashTable, method_name,
+                      probedMethod(getattr(DataStructures.HashTable, method_name)))
+    if profile:
+        _active_stats.profiler = cProfile.Profile()
+        _active_stats.profiler.enable()
+    return _active_stats
+
+
+# Turns instrumentation off and puts the original methods back. Returns the Stats that was recorded into.
+def disable():
+    global _active_stats
+    stats = _active_stats
+    if stats is not None and stats.profiler is not None:
+        stats.profiler.disable()
+    while _originals:
+        owner, method_name, original = _originals.pop()
+        setattr(owner, method_name, original)
+    _active_stats = None
+    return stats
+
+
+# Turns instrumentation on for the code inside a with block, and gives the Stats being recorded into
+@contextmanager
+def instrument(stats=None, profile=False):
+    stats = enable(stats, profile)
+    try:
+        yield stats
+    finally:
+        disable()
+
+
+# Returns the Stats being recorded into, or None if instrumentation is off
+def returnActiveStats():
+    return _active_stats
+
+
+# Replaces a method (or module function), remembering the original so disable can put it back
+def replaceMethod(owner, method_name, replacement):
+    _originals.append((owner, method_name, owner.__dict__[method_name]))
+    setattr(owner, method_name, replacement)
+
+
+def timedMethod(method, phase_name):
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _active_stats.addPhase(phase_name, time.perf_counter() - start)
+    return timed
+
+
+def countedMethod(method, counter_name):
+    def counted(*args, **kwargs):
+        _active_stats.count(counter_name)
+        return method(*args, **kwargs)
+    return counted
+
+
+def comparedMethod(method):
+    def compared(matrix, source_index, location_codes):
+        _active_stats.count('distances compared', len(location_codes))
+        return method(matrix, source_index, location_codes)
+    return compared
+
+
+# Wraps a HashTable method that takes a key first, counting the slots probed for that key before calling it
+def probedMethod(method):
+    def probed(table, key, *args):
+        _active_stats.count('hash lookups')
+        _active_stats.count('hash probes', countProbes(table, key))
+        return method(table, key, *args)
+    return probed
+
+
+# Returns the number of slots a lookup of key looks at: every slot from the key's home slot up to and including the
+# one holding the key, or the first empty one
+def countProbes(table, key):
+    mask = table.size - 1
+    index = hash(key) & mask
+    keys = table.keys
+    probes = 1
+    while keys[index] is not DataStructures._EMPTY and keys[index] != key:
+        index = (index + 1) & mask
+        probes = probes + 1
+    return probes
@@ -1,10 +1,16 @@
 # Module for displaying the main menu, and managing it's functionality.
+import ReportWriter
+import RouteAssigner
+import RouteOptimizer
+import RunHistory
 import Sim
+import SimClock
 
 
-# class for displaying the main menu, and providing functionality that allows the user to control the simulation
+# class for displaying the main menu, and providing functionality that allows the user to control the simulation.
+# If history_path is given, the day's run is recorded in that SQLite database (see RunHistory) once it has been run.
 class MainMenu:
-    def __init__(self):
+    def __init__(self, history_path=None):
         self.title = "Welcome to the WGUPS Delivery Program!"
         self.divider = "---------------------------------------------------------------------------------------------" \
                        "-----------"
@@ -12,6 +18,8 @@ class MainMenu:
         self.option_2 = "[2] Pause the simulation at a given time"
         self.option_3 = "[3] View statistics"
         self.option_4 = "[4] Exit the program "
+        self.simulation = None  # the full day, run once and then reused for every option
+        self.history_path = history_path
 
     # prints the main menu to the screen
     def printMainMenu(self):
@@ -22,31 +30,47 @@ class MainMenu:
         print(self.option_4)
         print(self.divider)
 
+    # Returns the simulation of the full day. It is run the first time it is needed; after that every pause time is
+    # answered from its timeline, rather than by running the day again. Trucks are loaded by the savings assigner and
+    # follow routes planned around the package deadlines.
+    def returnSimulation(self):
+        if self.simulation is None:
+            self.simulation = Sim.Simulation('packages.csv', 'distances.csv', 'addresslist.csv', 27, 16, use_cache=True,
+                                             filename_of_constraints='constraints.csv')
+            distance_matrix = self.simulation.new_packages.address_matrix
+            self.simulation.route_assigner = RouteAssigner.SavingsAssigner(distance_matrix)
+            self.simulation.deadline_router = RouteOptimizer.DeadlineRouter(distance_matrix)
+            self.simulation.loadAndDeliver()
+            if self.history_path:
+                with RunHistory.RunHistory(self.history_path) as history:
+                    history.recordRun(self.simulation, {'constraints': 'constraints.csv'})
+        return self.simulation
+
     # runs a simulation. Prints out the Results to the screen
-    def runSimulation(self, time='19:00'):
-        sim = Sim.Simulation('packages.csv', 'distances.csv', 'addresslist.csv', 27, 16)
-        sim.loadAndDeliver(time)
+    def runSimulation(self, time=SimClock.SIMULATION_END):
+        sim = self.returnSimulation()
+        seconds = SimClock.toSeconds(time)
 
         # If simulation had a pause, print that info
-        if time != '19:00':
+        if seconds != SimClock.SIMULATION_END:
             print(f"Simulation paused at {time}")
 
         print("Current Status of All Packages:")
         print(self.divider)
-        sim.new_packages.printAllPackages()
+        ReportWriter.writePackageReport(sim.timeline.returnPackagesAt(seconds), 'text')
         print("\n")
-        print(f"Total Miles traveled: {sim.total_distance_traveled}")
+        print(f"Total Miles traveled: {sim.timeline.returnTotalMilesAt(seconds)}")
 
     def showStats(self):
-        sim = Sim.Simulation('packages.csv', 'distances.csv', 'addresslist.csv', 27, 16)
-        sim.loadAndDeliver()
+        sim = self.returnSimulation()
         print("Simulation Statistics: ")
         print(self.divider)
-        print(f"Total number of miles traveled by both trucks: {sim.total_distance_traveled}")
-        print(f"Total miles driven by Truck 1: {sim.truck1.miles}")
-        print(f"Total miles driven by Truck 2: {sim.truck2.miles}")
-        print(f"Truck 1 finished delivering packages at: {sim.truck1.truck_time}")
-        print(f"Truck 2 finished delivering packages at: {sim.truck2.truck_time}")
+        print(f"Total number of miles traveled by all trucks: {sim.total_distance_traveled}")
+        for truck in sim.fleet:
+            print(f"Total miles driven by Truck {truck.truck_number}: {truck.miles}")
+        for truck in sim.fleet:
+            print(f"Truck {truck.truck_number} finished delivering packages at: {truck.returnTruckTime()}")
+        for package_id, (truck_number, arrival) in sim.planned_misses.items():
+            print(f"Package {package_id} on Truck {truck_number} could not be routed in time, planned arrival: "
+                  f"{SimClock.toTimeString(arrival)}")
         print(self.divider)
-
-
@@ -1,34 +1,286 @@
 # Module to manage individual package and packages
 import DataStructures
+import DistanceStore
+import InputCache
+import ReportWriter
+import SimClock
 import csv
+from array import array
+
+# Status codes stored for each package. The status shown to the user is built from the code, plus the time and truck
+# number recorded with it. STATUS_OTHER is used for any other status text, which is kept in the string table.
+STATUS_AT_HUB = 0
+STATUS_IN_TRANSIT = 1
+STATUS_LOADED = 2
+STATUS_DELIVERED = 3
+STATUS_OTHER = 4
+STATUS_CANCELLED = 5
+
+
+# Class that holds the data for all packages in columns rather than as one object per package. Each package is a row,
+# and each field is a typed array with one entry per row, so a package costs a few machine words instead of a full
+# python object with its own dictionary and strings. Text fields (address, city, zip, deadline) are stored as codes
+# into a shared StringTable, so each distinct string is only kept once no matter how many packages use it.
+# Rows are handed out as Package objects, which are lightweight views onto a single row.
+# The store also keeps secondary indexes, so questions like "which packages are still at the hub" or "which packages
+# go to 84115" are answered without looking at every row. Each index maps a value to the rows that have it, and is
+# updated whenever a row is added or its status, address or deadline changes, so a query costs O(number of rows
+# returned). The indexes are (with the value each row is filed under):
+# 1. status: status code
+# 2. location: location code
+# 3. zip: string code of the zip
+# 4. deadline: deadline in seconds since midnight. There are only a few distinct deadlines, so "due by" queries walk
+# the deadlines rather than the rows.
+# 5. truck: the truck number recorded with the status. Rows with no truck are not filed.
+# The rows for a value are kept in a dictionary used as an ordered set, so adding and removing a row are O(1) and rows
+# come back in the order they were filed.
+class PackageStore:
+    # names of the array attributes that hold the package data, one entry per row
+    COLUMNS = ('ids', 'address_codes', 'city_codes', 'zip_codes', 'deadline_codes', 'deadline_seconds', 'weights',
+               'location_codes', 'status_codes', 'status_times', 'status_trucks', 'status_text_codes')
+    # names of the secondary indexes, and the column each one is built from
+    INDEXES = {'status': 'status_codes', 'location': 'location_codes', 'zip': 'zip_codes',
+               'deadline': 'deadline_seconds', 'truck': 'status_trucks'}
+
+    def __init__(self):
+        self.strings = DataStructures.StringTable()
+        self.ids = array('q')
+        self.address_codes = array('l')
+        self.city_codes = array('l')
+        self.zip_codes = array('l')
+        self.deadline_codes = array('l')
+        self.deadline_seconds = array('l')
+        self.weights = array('d')
+        self.location_codes = array('l')
+        self.status_codes = array('b')
+        self.status_times = array('l')  # time of the status change, in seconds since midnight (-1 if not recorded)
+        self.status_trucks = array('l')  # truck the status refers to (-1 if none)
+        self.status_text_codes = array('l')  # string code of the status text, for STATUS_OTHER
+        self.indexes = {name: {} for name in self.INDEXES}  # index name -> {value: {row: None}}
+
+    # Adds a package to the store. Returns the row number of the new package.
+    def addPackage(self, id, address, deadline, city, zip, weight, location_code=0):
+        intern = self.strings.intern
+        self.ids.append(id)
+        self.address_codes.append(intern(address))
+        self.city_codes.append(intern(city))
+        self.zip_codes.append(intern(zip))
+        self.deadline_codes.append(intern(deadline))
+        self.deadline_seconds.append(SimClock.deadlineToSeconds(deadline))
+        self.weights.append(float(weight))
+        self.location_codes.append(location_code)
+        self.status_codes.append(STATUS_AT_HUB)
+        self.status_times.append(-1)
+        self.status_trucks.append(-1)
+        self.status_text_codes.append(-1)
+        row = len(self.ids) - 1
+        for name in self.INDEXES:
+            self.fileRow(name, row)
+        return row
+
+    # Records a new status for the package in the given row
+    def setStatus(self, row, status_code, status_time=-1, truck_number=-1, status_text=None):
+        if self.status_codes[row] != status_code:
+            self.moveRow('status', row, self.status_codes[row], status_code)
+            self.status_codes[row] = status_code
+        if self.status_trucks[row] != truck_number:
+            self.moveRow('truck', row, self.status_trucks[row], truck_number)
+            self.status_trucks[row] = truck_number
+        self.status_times[row] = status_time
+        self.status_text_codes[row] = -1 if status_text is None else self.strings.intern(status_text)
+
+    # Changes the destination of the package in the given row
+    def setAddress(self, row, address, city, zip, location_code):
+        intern = self.strings.intern
+        self.address_codes[row] = intern(address)
+        self.city_codes[row] = intern(city)
+        zip_code = intern(zip)
+        self.moveRow('zip', row, self.zip_codes[row], zip_code)
+        self.zip_codes[row] = zip_code
+        self.setLocationCode(row, location_code)
+
+    # Changes the location code of the package in the given row
+    def setLocationCode(self, row, location_code):
+        self.moveRow('location', row, self.location_codes[row], location_code)
+        self.location_codes[row] = location_code
+
+    # Changes the deadline of the package in the given row
+    def setDeadline(self, row, deadline):
+        deadline_seconds = SimClock.deadlineToSeconds(deadline)
+        self.moveRow('deadline', row, self.deadline_seconds[row], deadline_seconds)
+        self.deadline_codes[row] = self.strings.intern(deadline)
+        self.deadline_seconds[row] = deadline_seconds
+
+    # Files a row in an index under the row's current value
+    def fileRow(self, name, row):
+        value = getattr(self, self.INDEXES[name])[row]
+        if name != 'truck' or value >= 0:
+            self.indexes[name].setdefault(value, {})[row] = None
+
+    # Moves a row from one value to another in an index
+    def moveRow(self, name, row, old_value, new_value):
+        if old_value == new_value:
+            return
+        index = self.indexes[name]
+        rows = index.get(old_value)
+        if rows is not None:
+            rows.pop(row, None)
+            if not rows:
+                del index[old_value]
+        if name != 'truck' or new_value >= 0:
+            index.setdefault(new_value, {})[row] = None
+
+    # Rebuilds every index from the columns. Needed after the columns have been replaced wholesale.
+    def rebuildIndexes(self):
+        self.indexes = {name: {} for name in self.INDEXES}
+        for name in self.INDEXES:
+            for row in range(len(self.ids)):
+                self.fileRow(name, row)
+
+    # Returns the rows filed under value in an index, in the order they were filed
+    def returnRows(self, name, value):
+        return list(self.indexes[name].get(value, ()))
+
+    # Returns the number of rows filed under value in an index
+    def countRows(self, name, value):
+        return len(self.indexes[name].get(value, ()))
+
+    # Returns the rows whose deadline is at or before the given time (seconds since midnight), earliest deadline first
+    def returnRowsDueBy(self, time):
+        rows = []
+        deadlines = self.indexes['deadline']
+        for deadline in sorted(deadlines):
+            if deadline > time:
+                break
+            rows.extend(deadlines[deadline])
+        return rows
+
+    # Returns the delivered rows whose delivery time is after their deadline, in the order they were delivered
+    def returnLateRows(self):
+        return [row for row in self.returnRows('status', STATUS_DELIVERED)
+                if self.status_times[row] > self.deadline_seconds[row]]
+
+    # Builds the status text for the package in the given row
+    def returnStatusText(self, row):
+        status_code = self.status_codes[row]
+        if status_code == STATUS_AT_HUB:
+            return 'at the hub'
+        if status_code == STATUS_IN_TRANSIT:
+            return 'Awaiting package at hub - in Transit'
+        if status_code == STATUS_LOADED:
+            return f"Loaded on truck {self.status_trucks[row]} for delivery"
+        if status_code == STATUS_DELIVERED:
+            return f"Delivered at {SimClock.toTimeString(self.status_times[row])}, On Truck {self.status_trucks[row]}"
+        if status_code == STATUS_CANCELLED:
+            return 'Cancelled'
+        return self.strings.lookup(self.status_text_codes[row])
+
+    # Returns a Package for every row, in row order
+    def returnAllPackages(self):
+        return [Package(self, row) for row in range(len(self.ids))]
+
+    # Returns a copy of the store. The columns are copied, so changes to the copy don't affect the original. The string
+    # table is shared, which is safe because strings are only ever added to it.
+    def copy(self):
+        new_store = PackageStore()
+        new_store.strings = self.strings
+        for name in self.COLUMNS:
+            setattr(new_store, name, array(getattr(self, name).typecode, getattr(self, name)))
+        new_store.indexes = {name: {value: dict(rows) for value, rows in index.items()}
+                             for name, index in self.indexes.items()}
+        return new_store
+
+    def __len__(self):
+        return len(self.ids)
+
 
 # Package is a class designed to handle the management of an individual package object. It includes several lookup
 # functions that allow lookup by a parameter, and update functions to update information that may be need to be updated
-# during the business day.
-# Parameters:
+# during the business day. A Package is a view onto one row of a PackageStore: it holds no data of its own, so any
+# number of Package objects for the same row see the same (current) values, and two Packages for the same row compare
+# equal. Attributes:
 # 1. id - integer id. Is expected to be unique
 # 2. address
-# 3. deadline - time by which package must be delivered
+# 3. deadline - time by which package must be delivered, as given in the package file. The same deadline in seconds
+# since midnight is kept in deadline_seconds, which is what the simulation compares against.
 # 4. city - delivery city
 # 5. zip - zipcode
 # 6. weight - weight of package
 # 7. status - current status of the package. By default all packages will start at the hub unless another status is
 # indicated
-# 8. location code - this is a code that maps the
+# 8. location code - this is a code that maps the address to its row and column in the distance matrix
 class Package:
-    def __init__(self, id, address, deadline, city, zip, weight, status='at the hub', location_code=0):
-        self.id = id
-        self.address = address
-        self.deadline = deadline
-        self.city = city
-        self.zip = zip
-        self.weight = weight
-        self.status = status
-        self.location_code = location_code
-
-    # Updates the delivery status of a package
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    @property
+    def id(self):
+        return self.store.ids[self.row]
+
+    @property
+    def address(self):
+        return self.store.strings.lookup(self.store.address_codes[self.row])
+
+    @property
+    def deadline(self):
+        return self.store.strings.lookup(self.store.deadline_codes[self.row])
+
+    @property
+    def deadline_seconds(self):
+        return self.store.deadline_seconds[self.row]
+
+    @property
+    def city(self):
+        return self.store.strings.lookup(self.store.city_codes[self.row])
+
+    @property
+    def zip(self):
+        return self.store.strings.lookup(self.store.zip_codes[self.row])
+
+    @property
+    def weight(self):
+        return f"{self.store.weights[self.row]:g}"
+
+    @property
+    def status(self):
+        return self.store.returnStatusText(self.row)
+
+    @property
+    def location_code(self):
+        return self.store.location_codes[self.row]
+
+    @location_code.setter
+    def location_code(self, location_code):
+        self.store.setLocationCode(self.row, location_code)
+
+    def __eq__(self, other):
+        return isinstance(other, Package) and self.row == other.row and self.store is other.store
+
+    def __hash__(self):
+        return hash(self.row)
+
+    # Updates the delivery status of a package to any status text
     def updateDeliveryStatus(self, status):
-        self.status = status
+        self.store.setStatus(self.row, STATUS_OTHER, status_text=status)
+
+    # Marks the package as not yet available at the hub
+    def markInTransit(self):
+        self.store.setStatus(self.row, STATUS_IN_TRANSIT)
+
+    # Marks the package as loaded on the given truck
+    def markLoaded(self, truck_number):
+        self.store.setStatus(self.row, STATUS_LOADED, truck_number=truck_number)
+
+    # Marks the package as delivered by the given truck at the given time (seconds since midnight)
+    def markDelivered(self, delivery_time, truck_number):
+        self.store.setStatus(self.row, STATUS_DELIVERED, delivery_time, truck_number)
+
+    # Marks the package as cancelled. It will not be delivered.
+    def markCancelled(self):
+        self.store.setStatus(self.row, STATUS_CANCELLED)
 
     # print the info for a single package
     def printPackageInfo(self):
@@ -43,22 +295,15 @@ class Package:
     def returnLocationCode(self):
         return self.location_code
 
-    # Updates the packages destination address
-    def updateAddress(self, new_address, new_city, new_zip, new_location_code):
-        self.address = new_address
-        self.city = new_city
-        self.zip = new_zip
-        self.location_code = new_location_code
-
-
-
-# Class to manage data related to a distance between points. All distance objects consist of a location code (integer)
-# and a distance. In this case, the location code represents the location code of the destination.
-class Distance:
-    def __init__(self, locationCode, distance):
-        self.location = locationCode
-        self.distance = distance
+    # Updates the time by which the package must be delivered
+    def updateDeadline(self, new_deadline):
+        self.store.setDeadline(self.row, new_deadline)
 
+    # Updates the packages destination address. If no location code is given the current one is kept.
+    def updateAddress(self, new_address, new_city, new_zip, new_location_code=None):
+        if new_location_code is None:
+            new_location_code = self.location_code
+        self.store.setAddress(self.row, new_address, new_city, new_zip, new_location_code)
 
 
 # Class to manage the group of packages to be delivered. Parameters: filename_packages = file name that contains the
@@ -67,31 +312,46 @@ class Distance:
 # number (order on the list) and the full physical address. Upon creation this class loads the packages, and addresses.
 # It creates a mapping between the addresses and the packages, storing the address index to the package record. A
 # lookup matrix is created so that distances between any two points can be easily determined in constant time O(1)
+# The package data itself is kept in a PackageStore. The hash table maps each package id to its row in the store.
+# If use_cache is True, the parsed files are saved to a binary snapshot (see InputCache) and later instances built from
+# the same, unchanged files load the snapshot instead of parsing the files again. If snapshot is given (snapshot data
+# as built by InputCache.buildSnapshot, for example in shared memory) the packages are loaded from it and the files are
+# not read at all.
+# If distance_store is given (a file path), the distances are kept in that file as a packed, memory mapped matrix (see
+# DistanceStore) instead of in memory. The file is built from filename_distances the first time, and opened as it is
+# after that, so the distance csv is not parsed again until it changes.
 class PackagesToBeDelivered:
-    def __init__(self, filename_packages, filename_distances, filename_addresslist, num_addresses):
+    def __init__(self, filename_packages, filename_distances, filename_addresslist, num_addresses, use_cache=False,
+                 snapshot=None, distance_store=None):
+        self.package_store = PackageStore()
         self.packageHash = DataStructures.HashTable()
         self.file = filename_packages
         self.file_distances = filename_distances
         self.file_addresslist = filename_addresslist
         self.location_index = {}
-        self.address_matrix = DataStructures.DistanceMatrix(num_addresses)
+        self.distance_store = distance_store
+        if snapshot is not None:
+            # the matrix is read in place from the snapshot, so no matrix of its own is allocated
+            self.address_matrix = DataStructures.DistanceMatrix(num_addresses, array('d'))
+            InputCache.fillFromSnapshot(self, snapshot, share_matrix=True)
+            return
+        if distance_store is None:
+            self.address_matrix = DataStructures.DistanceMatrix(num_addresses)
+        else:
+            self.address_matrix = self.openDistanceStore(num_addresses)
+        if use_cache and InputCache.loadSnapshot(self, num_addresses):
+            return
         self.loadPackageFile()
         self.createLocationIndex()
-        self.loadDistanceFile()
+        if distance_store is None:
+            self.loadDistanceFile()
         self.populateLocationCodes(self.location_index)
+        if use_cache:
+            InputCache.saveSnapshot(self, num_addresses)
 
-    # Prints all packages in the given hash table
+    # Prints all packages, in package id order. The lines are written in large blocks rather than one print per package.
     def printAllPackages(self):
-        for i in range(len(self.packageHash.array)):
-            if self.packageHash.array[i].returnLinkedListData() is None:
-                i = i + 1
-            else:
-                temp = self.packageHash.array[i]
-                temp.returnLinkedListData().printPackageInfo()
-                # iterate through the list if there are other values
-                while temp.returnLinkedListNext() is not None:
-                    temp = temp.next
-                    temp.data.printPackageInfo()
+        ReportWriter.writePackageReport(self.package_store, 'text')
 
     # Returns the location index (dictionary). Used for generating location codes.
     def returnLocationIndex(self):
@@ -100,69 +360,119 @@ class PackagesToBeDelivered:
     # Populate all the data members of the hash table with a location code. This is reliant on a key dictionary to be
     # present, which is created during the instantiation of the object
     def populateLocationCodes(self, key_dictionary):
-        for i in range(len(self.packageHash.array)):
-            if self.packageHash.array[i].returnLinkedListData() is None:
-                i = i + 1
-            else:
-                street_address = self.packageHash.array[i].returnLinkedListData().returnAddress()
-                index = key_dictionary[street_address]
-                self.packageHash.array[i].returnLinkedListData().location_code = index
-
+        store = self.package_store
+        # look up each distinct address once, rather than once per package
+        location_by_address_code = {}
+        for row, address_code in enumerate(store.address_codes):
+            location_code = location_by_address_code.get(address_code)
+            if location_code is None:
+                location_code = key_dictionary[store.strings.lookup(address_code)]
+                location_by_address_code[address_code] = location_code
+            store.setLocationCode(row, location_code)
 
     # Return the package numbers of all the packages
     def returnPackageIndices(self):
-        package_list = []
-        for i in range(len(self.packageHash.array)):
-            if self.packageHash.array[i].returnLinkedListData() is None:
-                i = i + 1
-            else:
-                package_list.append(self.packageHash.array[i].returnLinkedListData().id)
-        return package_list
-
-    # Returns a list of all the packages in the hash table
+        return list(self.package_store.ids)
+
+    # Returns a list of all the packages, in the order they were loaded
     def returnAllPackages(self):
-        package_list = []
-        for i in range(len(self.packageHash.array)):
-            if self.packageHash.array[i].returnLinkedListData() is None:
-                i = i + 1
-            else:
-                package_list.append(self.packageHash.array[i].returnLinkedListData())
-        return package_list
-
-    # return a package object. Look up uses the package id which is passed by parameter
+        return self.package_store.returnAllPackages()
+
+    # return a package object. Look up uses the package id which is passed by parameter. Returns None if there is no
+    # package with that id
     def returnPackageByID(self, id):
-        return self.packageHash.findDataInHashTable(id)
+        row = self.packageHash.findDataInHashTable(id)
+        if row is None:
+            return None
+        return Package(self.package_store, row)
+
+    # Returns the packages with the given status code (see STATUS_AT_HUB and the other codes)
+    def returnPackagesByStatus(self, status_code):
+        return self.returnPackagesForRows(self.package_store.returnRows('status', status_code))
+
+    # Returns the packages going to the given location code
+    def returnPackagesByLocation(self, location_code):
+        return self.returnPackagesForRows(self.package_store.returnRows('location', location_code))
+
+    # Returns the packages going to the given zip
+    def returnPackagesByZip(self, zip):
+        zip_code = self.package_store.strings.codes.get(str(zip))
+        if zip_code is None:
+            return []
+        return self.returnPackagesForRows(self.package_store.returnRows('zip', zip_code))
+
+    # Returns the packages that must be delivered by the given time (seconds since midnight or a military time
+    # string), earliest deadline first
+    def returnPackagesDueBy(self, time):
+        return self.returnPackagesForRows(self.package_store.returnRowsDueBy(SimClock.toSeconds(time)))
+
+    # Returns the packages whose status refers to the given truck (loaded on it or delivered by it)
+    def returnPackagesOnTruck(self, truck_number):
+        return self.returnPackagesForRows(self.package_store.returnRows('truck', truck_number))
+
+    # Returns a Package for each row
+    def returnPackagesForRows(self, rows):
+        return [Package(self.package_store, row) for row in rows]
 
     # Return location Code
     def returnLocationCode(self, index):
-        package_data = self.packageHash.findDataInHashTable(index)
-        return package_data.location_code
-
+        return self.package_store.location_codes[self.packageHash[index]]
 
     # Load the packages in from a CSV file
     def loadPackageFile(self):
         with open(self.file, newline='', encoding='utf-8-sig') as reader:
             package_file = csv.reader(reader, delimiter=',')
             for row in package_file:
-                newPackage = Package(int(row[0]), row[1], row[5], row[2], row[4], row[6])
-                self.packageHash.addToHashTable(int(row[0]), newPackage)
+                package_id = int(row[0])
+                store_row = self.package_store.addPackage(package_id, row[1], row[5], row[2], row[4], row[6])
+                self.packageHash.addToHashTable(package_id, store_row)
 
 
-    # Load the distances between points from a CSV file
-    def loadDistanceFile(self):
+    # Load the distances between points from a CSV file. The file holds the lower triangle of the matrix: row n has the
+    # distances from location n to locations 0 to n, so it has n + 1 values (trailing empty cells are ignored). Each
+    # row is parsed once, in order, straight into the matrix. The file must have one row per address; blank rows (such
+    # as a trailing empty line) are skipped and not counted. Rows of the wrong length or with values that are not
+    # numbers are collected, and reported together in a ValueError. The rows go into matrix, which is the address
+    # matrix unless another is given.
+    def loadDistanceFile(self, matrix=None):
+        if matrix is None:
+            matrix = self.address_matrix
+        size = matrix.size
+        problems = []
+        row_count = 0
         with open(self.file_distances, newline='', encoding='utf-8-sig') as reader:
             distance_file = csv.reader(reader, delimiter=',')
-            index = 0
-            row_index = 0
             for row in distance_file:
-                for cell in row:
-                    # represents the "destination", x axis of the matrix
-                    position = row.index(cell)
-                    distance_num = float(cell)
-                    new_distance = Distance(position, distance_num)
-                    self.address_matrix.addToMatrix(row_index, new_distance)
-                row_index = row_index + 1
-                index = index+1
+                while row and not row[-1].strip():
+                    row.pop()
+                if not row:
+                    continue
+                row_index = row_count
+                row_count = row_count + 1
+                if row_index >= size:
+                    problems.append(f"row {row_count}: only {size} addresses are expected")
+                    continue
+                if len(row) != row_count:
+                    problems.append(f"row {row_count}: expected {row_count} distances, found {len(row)}")
+                    continue
+                try:
+                    distances = [float(cell) for cell in row]
+                except ValueError:
+                    problems.append(f"row {row_count}: contains a value that is not a number")
+                    continue
+                matrix.addRowToMatrix(row_index, distances)
+        if row_count < size:
+            problems.append(f"expected {size} rows, found {row_count}")
+        if problems:
+            raise ValueError(f"Malformed distance file {self.file_distances}:\n" + "\n".join(problems))
+
+    # Opens the distance store file, building it from the distance file first if it is missing, holds a different
+    # number of addresses, or was built from a different or changed distance file
+    def openDistanceStore(self, num_addresses):
+        if DistanceStore.isUpToDate(self.distance_store, num_addresses, self.file_distances):
+            return DistanceStore.openDistanceFile(self.distance_store)
+        return DistanceStore.buildDistanceFile(self.distance_store, num_addresses, self.loadDistanceFile,
+                                               self.file_distances)
 
     # Load the location index. This is used to map addresses to their numerical values used for the distance matrix
     def createLocationIndex(self):
@@ -175,7 +485,6 @@ class PackagesToBeDelivered:
 
     # Update the status string for a given package id
     def updateStatusByPackageID(self, package_id, status_string):
-        key = self.packageHash.calculateIndex(package_id)
-        self.packageHash.array[key].head.data.updateDeliveryStatus(status_string)
+        self.returnPackageByID(package_id).updateDeliveryStatus(status_string)
 
 
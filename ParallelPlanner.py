@@ -0,0 +1,127 @@
+# Module for working out the routes of many trucks at the same time. Once the trucks have been loaded their routes don't
+# depend on each other, so each one can be planned in a separate process. Workers only ever receive location codes (and
+# deadlines) as compact arrays, never packages, and read distances from one copy of the distance matrix in shared
+# memory, so a job costs a few bytes per stop to send no matter how large the matrix is.
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import DataStructures
+import DistanceStore
+import RouteOptimizer
+
+# State kept by each worker process: the shared memory block (if the matrix is in shared memory), and the router and
+# optimizer built on the matrix. Set up once per worker by initializeWorker.
+_worker = {}
+
+
+# Class that plans truck routes on a pool of worker processes. The distance matrix is copied into shared memory once,
+# when the pool is first used; workers read it in place and never change it, so it must be complete (all files loaded)
+# before the planner is used. A matrix kept in a distance store file is not copied at all: each worker maps the same
+# file, so the pages are shared by the operating system. Each worker builds its own neighbor index from the matrix the
+# first time it needs one.
+# Parameters:
+# 1. distance_matrix: a DataStructures.DistanceMatrix (or PackedDistanceMatrix)
+# 2. max_workers: number of worker processes (default: one per CPU)
+# 3. optimizer: a RouteOptimizer.RouteOptimizer whose settings the workers use for optimizeRoutes (default settings if
+# not given)
+# 4. min_jobs: fewer jobs than this are run in this process, where starting the pool would cost more than it saves
+# Use in a with block, or call close when done, so the worker processes and the shared memory are released.
+class ParallelPlanner:
+    def __init__(self, distance_matrix, max_workers=None, optimizer=None, min_jobs=2):
+        self.distance_matrix = distance_matrix
+        self.max_workers = max_workers or os.cpu_count()
+        self.optimizer = optimizer or RouteOptimizer.RouteOptimizer(distance_matrix)
+        self.router = RouteOptimizer.DeadlineRouter(distance_matrix)
+        self.min_jobs = min_jobs
+        self.shared = None
+        self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    # Plans deadline aware routes (see RouteOptimizer.DeadlineRouter.planRoute). Each job is (starting location, start
+    # time, speed, location codes, deadlines, end location), with the location codes and deadlines as array('l').
+    # Returns the route of every job, in order, as a list of location codes not including the starting location.
+    def planRoutes(self, jobs):
+        if len(jobs) < self.min_jobs:
+            return [planJob(self.router, job) for job in jobs]
+        return list(self.returnExecutor().map(planWorkerJob, jobs))
+
+    # Optimizes routes for distance only (see RouteOptimizer.RouteOptimizer.optimizeRoute). Each job is (starting
+    # location, location codes), with the location codes as array('l'). Returns the route of every job, in order.
+    def optimizeRoutes(self, jobs):
+        if len(jobs) < self.min_jobs:
+            return [self.optimizer.optimizeRoute(starting_location, list(location_codes))
+                    for starting_location, location_codes in jobs]
+        return list(self.returnExecutor().map(optimizeWorkerJob, jobs))
+
+    # Returns the pool, starting it (and copying the matrix into shared memory) the first time
+    def returnExecutor(self):
+        if self.executor is None:
+            matrix = self.distance_matrix
+            packed = isinstance(matrix, DataStructures.PackedDistanceMatrix)
+            if packed and matrix.path is not None:
+                source = ('file', matrix.path)
+            else:
+                values = memoryview(matrix.array).cast('B')
+                self.shared = shared_memory.SharedMemory(create=True, size=max(len(values), 1))
+                self.shared.buf[:len(values)] = values
+                source = ('shared', self.shared.name, packed)
+            optimizer = self.optimizer
+            settings = {'use_two_opt': optimizer.use_two_opt, 'use_or_opt': optimizer.use_or_opt,
+                        'neighbor_count': optimizer.neighbor_count, 'time_limit': optimizer.time_limit,
+                        'max_iterations': optimizer.max_iterations}
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=initializeWorker,
+                                                initargs=(source, matrix.size, settings))
+        return self.executor
+
+    # Stops the worker processes and frees the shared memory
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.shared is not None:
+            self.shared.close()
+            self.shared.unlink()
+            self.shared = None
+
+
+# Runs once in each worker process. Attaches to the matrix, either ('file', path) for a distance store file or
+# ('shared', shared memory name, packed) for a copy in shared memory, and builds the router and optimizer on it.
+def initializeWorker(source, size, optimizer_settings):
+    if source[0] == 'file':
+        matrix = DistanceStore.openDistanceFile(source[1])
+    else:
+        _, shared_name, packed = source
+        shared = shared_memory.SharedMemory(name=shared_name)
+        _worker['shared'] = shared
+        if packed:
+            values = shared.buf[:4 * DataStructures.returnPackedLength(size)].cast('f')
+            matrix = DataStructures.PackedDistanceMatrix(size, values)
+        else:
+            values = shared.buf[:8 * size * size].cast('d')
+            matrix = DataStructures.DistanceMatrix(size, values)
+    _worker['router'] = RouteOptimizer.DeadlineRouter(matrix)
+    _worker['optimizer'] = RouteOptimizer.RouteOptimizer(matrix, **optimizer_settings)
+
+
+# Plans one deadline aware route with the given router
+def planJob(router, job):
+    starting_location, start_time, speed, location_codes, deadlines, end_location = job
+    return router.planRoute(starting_location, start_time, speed, location_codes, deadlines, end_location)
+
+
+# Plans one deadline aware route in a worker process. Returns the route as array('l') so it is sent back compactly.
+def planWorkerJob(job):
+    return array('l', planJob(_worker['router'], job))
+
+
+# Optimizes one route in a worker process
+def optimizeWorkerJob(job):
+    starting_location, location_codes = job
+    return array('l', _worker['optimizer'].optimizeRoute(starting_location, list(location_codes)))
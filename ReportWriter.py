@@ -0,0 +1,184 @@
+# Module for writing package status reports. Rows are produced one at a time by a generator straight from the columns of
+# a PackageStore, and written through a sink that collects them in memory and writes them out in large blocks, so a
+# report of any size costs one write call per buffer_rows rows instead of one print per package. Reports can be
+# written as CSV, as JSON Lines, or as the pipe separated text shown by the menu, to a file or to standard output.
+import csv
+import io
+import json
+import sys
+from contextlib import contextmanager
+
+import Package
+import SimClock
+
+# Fields that can be included in a package report, in the default order
+PACKAGE_FIELDS = ('package_id', 'address', 'city', 'zip', 'deadline', 'weight', 'status', 'truck', 'delivery_time')
+# Fields shown by the text format, which matches Package.printPackageInfo
+TEXT_FIELDS = ('package_id', 'address', 'city', 'zip', 'weight', 'deadline', 'status')
+# Orders a report can be sorted in. id: by package id. truck: by truck, then in the order the truck delivered its
+# packages (packages not yet delivered last, by id); packages without a truck come last. row: the order the packages
+# were loaded in.
+ORDERS = ('id', 'truck', 'row')
+# Number of rows a sink collects before writing them out
+BUFFER_ROWS = 1024
+
+
+# Returns a function that gives the value of a field for a row of the store
+def returnFieldGetter(store, field):
+    lookup = store.strings.lookup
+    if field == 'package_id':
+        return store.ids.__getitem__
+    if field == 'address':
+        return lambda row: lookup(store.address_codes[row])
+    if field == 'city':
+        return lambda row: lookup(store.city_codes[row])
+    if field == 'zip':
+        return lambda row: lookup(store.zip_codes[row])
+    if field == 'deadline':
+        return lambda row: lookup(store.deadline_codes[row])
+    if field == 'weight':
+        return lambda row: f"{store.weights[row]:g}"
+    if field == 'status':
+        return store.returnStatusText
+    if field == 'truck':
+        return lambda row: store.status_trucks[row] if store.status_trucks[row] >= 0 else None
+    if field == 'delivery_time':
+        return lambda row: SimClock.toTimeString(store.status_times[row]) \
+            if store.status_codes[row] == Package.STATUS_DELIVERED else None
+    raise ValueError(f"unknown report field '{field}', expected one of {', '.join(PACKAGE_FIELDS)}")
+
+
+# Returns the rows of the store in the given order (see ORDERS)
+def returnOrderedRows(store, order='id'):
+    rows = range(len(store))
+    if order == 'row':
+        return rows
+    if order == 'id':
+        return sorted(rows, key=store.ids.__getitem__)
+    if order == 'truck':
+        no_truck = float('inf')
+
+        def truckOrder(row):
+            truck = store.status_trucks[row]
+            delivered = store.status_codes[row] == Package.STATUS_DELIVERED
+            return (truck if truck >= 0 else no_truck, not delivered,
+                    store.status_times[row] if delivered else 0, store.ids[row])
+        return sorted(rows, key=truckOrder)
+    raise ValueError(f"unknown report order '{order}', expected one of {', '.join(ORDERS)}")
+
+
+# Generates a dictionary for every package in the store, holding the given fields (all of PACKAGE_FIELDS by default),
+# in the given order. extra holds fields with the same value on every row (a run number, say), which come first.
+def generatePackageRows(store, fields=None, order='id', extra=None):
+    fields = tuple(fields or PACKAGE_FIELDS)
+    getters = [(field, returnFieldGetter(store, field)) for field in fields]
+    extra = dict(extra or {})
+    for row in returnOrderedRows(store, order):
+        record = dict(extra)
+        for field, getter in getters:
+            record[field] = getter(row)
+        yield record
+
+
+# Base class for sinks. Rows are formatted into an in-memory buffer, which is written to the stream every buffer_rows
+# rows and when the sink is closed. Subclasses implement formatRow (and writeHeader if they have one).
+class Sink:
+    def __init__(self, stream, fields, buffer_rows=BUFFER_ROWS):
+        self.stream = stream
+        self.fields = tuple(fields)
+        self.buffer_rows = buffer_rows
+        self.buffer = io.StringIO()
+        self.buffered = 0
+        self.rows_written = 0
+        self.writeHeader()
+
+    def writeHeader(self):
+        pass
+
+    # Adds one row (a dictionary) to the output
+    def writeRow(self, row):
+        self.formatRow(row)
+        self.buffered = self.buffered + 1
+        self.rows_written = self.rows_written + 1
+        if self.buffered >= self.buffer_rows:
+            self.flush()
+
+    # Adds every row from an iterable to the output. Returns the number of rows written.
+    def writeRows(self, rows):
+        for row in rows:
+            self.writeRow(row)
+        return self.rows_written
+
+    # Writes out whatever is in the buffer
+    def flush(self):
+        self.stream.write(self.buffer.getvalue())
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        self.stream.flush()
+
+
+# Sink that writes CSV with a header line. Values that aren't strings or numbers (dictionaries, lists) are written as
+# JSON.
+class CsvSink(Sink):
+    def writeHeader(self):
+        self.writer = csv.writer(self.buffer, lineterminator='\n')
+        self.writer.writerow(self.fields)
+
+    def formatRow(self, row):
+        values = []
+        for field in self.fields:
+            value = row.get(field)
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value)
+            values.append(value)
+        self.writer.writerow(values)
+
+
+# Sink that writes one JSON object per line
+class JsonLinesSink(Sink):
+    def formatRow(self, row):
+        self.buffer.write(json.dumps({field: row.get(field) for field in self.fields}))
+        self.buffer.write('\n')
+
+
+# Sink that writes the values separated by " | ", the way the menu shows packages
+class TextSink(Sink):
+    def formatRow(self, row):
+        self.buffer.write(' | '.join(str(row.get(field, '')) for field in self.fields))
+        self.buffer.write('\n')
+
+
+SINKS = {'csv': CsvSink, 'jsonl': JsonLinesSink, 'text': TextSink}
+
+
+# Opens a sink of the given format ('csv', 'jsonl' or 'text') writing to path, or to standard output if path is None
+# or '-'. Use in a with block; the sink is flushed (and the file closed) at the end of it.
+@contextmanager
+def openSink(output_format, fields, path=None, buffer_rows=BUFFER_ROWS):
+    sink_class = SINKS.get(output_format)
+    if sink_class is None:
+        raise ValueError(f"unknown report format '{output_format}', expected one of {', '.join(SINKS)}")
+    if path is None or path == '-':
+        sink = sink_class(sys.stdout, fields, buffer_rows)
+        try:
+            yield sink
+        finally:
+            sink.close()
+        return
+    with open(path, 'w', newline='', encoding='utf-8') as stream:
+        sink = sink_class(stream, fields, buffer_rows)
+        try:
+            yield sink
+        finally:
+            sink.close()
+
+
+# Writes a status report for every package in the store. Returns the number of rows written.
+def writePackageReport(store, output_format='csv', path=None, fields=None, order='id'):
+    fields = tuple(fields or (TEXT_FIELDS if output_format == 'text' else PACKAGE_FIELDS))
+    with openSink(output_format, fields, path) as sink:
+        return sink.writeRows(generatePackageRows(store, fields, order))
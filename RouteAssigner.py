@@ -0,0 +1,181 @@
+# Module for deciding which packages go on which truck. Good routes can only be built from good loads: a truck that is
+# given packages spread all over the city drives far more than one given a tight cluster, no matter what order it
+# delivers them in. Like RouteOptimizer, the work is done on location codes, so packages for the same address are
+# always kept together where capacity allows.
+import heapq
+
+import DataStructures
+
+
+# Class that splits packages between trucks using the Clarke-Wright savings method, a standard way of building
+# capacitated vehicle routes:
+# 1. Every stop starts on its own route (depot -> stop -> depot). Packages already on a truck (restricted packages,
+# groups, time sensitive packages) make up a fixed route for that truck instead, and new packages for a location that
+# truck already visits go straight onto it, since they cost no extra driving.
+# 2. For each pair of stops the saving of serving both on one route instead of two is
+# d(depot, a) + d(depot, b) - d(a, b). Pairs are taken in order of largest saving, and the routes the two stops are on
+# are joined end to end if both stops are at an end of their route, the joined load fits on a truck, and the two routes
+# don't both already belong to different trucks.
+# 3. Each truck gets its own route. Trucks that had nothing loaded get the largest routes that fit. Routes that don't
+# fit on any truck now are returned as leftovers, route by route, for the next trip from the depot.
+# Parameters:
+# 1. distance_matrix: a DataStructures.DistanceMatrix
+# 2. neighbor_count: savings are only worked out between each stop and this many of its closest stops, which keeps
+# the number of pairs linear in the number of stops. Joining far apart stops saves little, so this loses almost
+# nothing. The closest stops come from the distance matrix's neighbor index where it holds enough of them. None works
+# out every pair.
+class SavingsAssigner:
+    def __init__(self, distance_matrix, neighbor_count=25):
+        self.distance_matrix = distance_matrix
+        self.neighbor_count = neighbor_count
+
+    # Splits packages between trucks. loads holds the packages already on each truck and capacities the number of
+    # packages each truck holds, in the same order. Returns (assigned, leftover): assigned holds the new packages for
+    # each truck in delivery order, and leftover the packages that didn't fit, grouped by route.
+    def assignPackages(self, depot, loads, capacities, packages):
+        seed_codes = [[package.location_code for package in load] for load in loads]
+        spaces = [capacity - len(load) for capacity, load in zip(capacities, loads)]
+        assigned = [[] for _ in loads]
+
+        # Packages for a location a truck already visits go on that truck while there's room
+        packages_by_location = {}
+        for package in packages:
+            packages_by_location.setdefault(package.location_code, []).append(package)
+        truck_by_location = {}
+        for truck_index, codes in enumerate(seed_codes):
+            for code in codes:
+                truck_by_location.setdefault(code, truck_index)
+        for code, location_packages in packages_by_location.items():
+            truck_index = truck_by_location.get(code)
+            if truck_index is not None and spaces[truck_index] > 0:
+                taken = location_packages[:spaces[truck_index]]
+                assigned[truck_index].extend(taken)
+                del location_packages[:len(taken)]
+                spaces[truck_index] = spaces[truck_index] - len(taken)
+
+        # Build the starting routes. A route is [node list, load, truck index or None]; nodes index node_codes and
+        # node_packages. Locations with more packages than the largest truck holds are split into several stops.
+        largest_capacity = max(capacities)
+        free_trucks = [truck_index for truck_index, codes in enumerate(seed_codes) if not codes]
+        route_capacity = max((capacities[truck_index] for truck_index in free_trucks), default=largest_capacity)
+        node_codes = []
+        node_packages = []
+        routes = []
+        route_by_node = []
+        for truck_index, codes in enumerate(seed_codes):
+            if not codes:
+                continue
+            route = [[], capacities[truck_index] - spaces[truck_index], truck_index]
+            for code in self.nearestNeighborOrder(depot, codes):
+                route[0].append(len(node_codes))
+                node_codes.append(code)
+                node_packages.append([])
+                route_by_node.append(route)
+            routes.append(route)
+        seed_node_count = len(node_codes)
+        for code, location_packages in packages_by_location.items():
+            if not location_packages:
+                continue
+            for start in range(0, len(location_packages), largest_capacity):
+                stop_packages = location_packages[start:start + largest_capacity]
+                route = [[len(node_codes)], len(stop_packages), None]
+                node_codes.append(code)
+                node_packages.append(stop_packages)
+                route_by_node.append(route)
+                routes.append(route)
+
+        # Join routes in order of largest saving
+        for saving, a, b in self.calculateSavings(depot, node_codes, seed_node_count):
+            route_a = route_by_node[a]
+            route_b = route_by_node[b]
+            if route_a is route_b or (route_a[2] is not None and route_b[2] is not None):
+                continue
+            nodes_a = route_a[0]
+            nodes_b = route_b[0]
+            if (nodes_a[0] != a and nodes_a[-1] != a) or (nodes_b[0] != b and nodes_b[-1] != b):
+                continue
+            truck_index = route_a[2] if route_a[2] is not None else route_b[2]
+            capacity = capacities[truck_index] if truck_index is not None else route_capacity
+            if route_a[1] + route_b[1] > capacity:
+                continue
+            if nodes_a[-1] != a:
+                nodes_a.reverse()
+            if nodes_b[0] != b:
+                nodes_b.reverse()
+            nodes_a.extend(nodes_b)
+            route_a[1] = route_a[1] + route_b[1]
+            route_a[2] = truck_index
+            for node in nodes_b:
+                route_by_node[node] = route_a
+            route_b[0] = []
+
+        # Hand out the routes. Trucks that had a fixed route keep it; free trucks take the largest routes that fit.
+        open_routes = []
+        for route in routes:
+            if not route[0]:
+                continue
+            if route[2] is not None:
+                for node in route[0]:
+                    assigned[route[2]].extend(node_packages[node])
+            else:
+                open_routes.append(route)
+        open_routes.sort(key=lambda route: route[1], reverse=True)
+        for truck_index in free_trucks:
+            for position, route in enumerate(open_routes):
+                if route[1] <= capacities[truck_index]:
+                    for node in route[0]:
+                        assigned[truck_index].extend(node_packages[node])
+                    del open_routes[position]
+                    break
+        leftover = []
+        for route in open_routes:
+            for node in route[0]:
+                leftover.extend(node_packages[node])
+        return assigned, leftover
+
+    # Returns (saving, a, b) for pairs of nodes that could be joined, largest saving first. Pairs where both nodes are
+    # already on trucks are left out, and so are pairs that save nothing.
+    def calculateSavings(self, depot, node_codes, seed_node_count):
+        matrix = self.distance_matrix
+        depot_distances = [matrix.lookupDistance(depot, code) for code in node_codes]
+        nodes = range(len(node_codes))
+        nodes_by_code = {}
+        for node, code in enumerate(node_codes):
+            nodes_by_code.setdefault(code, []).append(node)
+        if self.neighbor_count is not None:
+            neighbor_index = matrix.returnNeighborIndex(self.neighbor_count)
+            wanted = min(self.neighbor_count, len(node_codes) - 1)
+        pairs = set()
+        for a in range(seed_node_count, len(node_codes)):
+            if self.neighbor_count is None:
+                neighbors = nodes
+            else:
+                # nodes at the same location, then nodes at the closest locations
+                neighbors = list(nodes_by_code[node_codes[a]])
+                for code in neighbor_index.returnNeighbors(node_codes[a]):
+                    neighbors.extend(nodes_by_code.get(code, ()))
+                if len(neighbors) <= wanted:
+                    row = matrix.returnRow(node_codes[a])
+                    neighbors = heapq.nsmallest(self.neighbor_count + 1, nodes, key=lambda node: row[node_codes[node]])
+            for b in neighbors:
+                if b != a:
+                    pairs.add((a, b) if a < b else (b, a))
+        savings = []
+        for a, b in pairs:
+            saving = depot_distances[a] + depot_distances[b] - matrix.lookupDistance(node_codes[a], node_codes[b])
+            if saving > 0:
+                savings.append((saving, a, b))
+        savings.sort(reverse=True)
+        return savings
+
+    # Returns location codes in nearest neighbor order from the depot, without duplicates
+    def nearestNeighborOrder(self, depot, location_codes):
+        neighbor_index = self.distance_matrix.returnNeighborIndex()
+        remaining = DataStructures.RemainingSet(self.distance_matrix.size, location_codes)
+        ordered = []
+        current_location = depot
+        while remaining:
+            current_location = neighbor_index.findNearest(current_location, remaining)
+            remaining.discard(current_location)
+            ordered.append(current_location)
+        return ordered
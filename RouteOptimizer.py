@@ -0,0 +1,436 @@
+# Module for building and improving delivery routes. Routes are worked out on location codes (integers that index the
+# distance matrix) rather than on packages, so several packages bound for the same address only count as one stop.
+import heapq
+import time
+
+import DataStructures
+import SimClock
+
+
+# Class that produces a delivery order for a set of stops. A route always starts at the given starting location and
+# is treated as a closed tour (the truck returns to where it started), which matches how the trucks return to the
+# depot at the end of their run. Route construction is done in two steps:
+# 1. A seed route is built with the greedy "nearest neighbor" approach.
+# 2. The seed is improved with local search. 2-opt removes two edges and reconnects the route the other way around,
+# Or-opt moves a run of 1 to 3 consecutive stops to a better spot in the route. Every candidate move is priced in
+# constant time from the handful of edges it changes, and candidates are only drawn from each stop's closest
+# neighbors so a pass over the route is O(n * neighbor_count) rather than O(n^2).
+# Parameters:
+# 1. distance_matrix: a DataStructures.DistanceMatrix
+# 2. use_two_opt / use_or_opt: switch the individual improvement steps on or off. With both off the optimizer only
+# returns the nearest neighbor route.
+# 3. neighbor_count: how many of the closest stops are considered for each stop when looking for improving moves
+# 4. time_limit: maximum number of seconds that local search may run for a single route
+# 5. max_iterations: maximum number of improving moves applied to a single route
+# 6. route_cache: optional DataStructures.RouteCache for distance_matrix. Routes are looked up in it before being
+# worked out, keyed by the stops and the settings above, so a repeated set of stops is only routed once. A cache can be
+# shared between optimizers with different settings.
+class RouteOptimizer:
+    def __init__(self, distance_matrix, use_two_opt=True, use_or_opt=True, neighbor_count=8, time_limit=1.0,
+                 max_iterations=100000, route_cache=None):
+        self.distance_matrix = distance_matrix
+        self.use_two_opt = use_two_opt
+        self.use_or_opt = use_or_opt
+        self.neighbor_count = neighbor_count
+        self.time_limit = time_limit
+        self.max_iterations = max_iterations
+        self.route_cache = route_cache
+
+    # Returns the settings that decide what route the optimizer builds, as a tuple. Used in route cache keys.
+    def returnSettings(self):
+        return ('optimizer', self.use_two_opt, self.use_or_opt, self.neighbor_count, self.time_limit,
+                self.max_iterations)
+
+    # Takes a starting location and a list of packages. Returns the packages in the order they should be delivered.
+    # Packages that share a location are kept together, in the order they were given.
+    def optimizePackageList(self, starting_location, package_list):
+        packages_by_location = {}
+        for package in package_list:
+            packages_by_location.setdefault(package.location_code, []).append(package)
+        ordered_packages = packages_by_location.pop(starting_location, [])
+        for location_code in self.optimizeRoute(starting_location, list(packages_by_location)):
+            ordered_packages.extend(packages_by_location[location_code])
+        return ordered_packages
+
+    # Takes a starting location and a list of location codes. Returns the location codes in delivery order, not
+    # including the starting location. With a route cache, a route already worked out for the same stops is reused.
+    def optimizeRoute(self, starting_location, location_codes):
+        stops = [code for code in dict.fromkeys(location_codes) if code != starting_location]
+        if self.route_cache is None:
+            return self.buildRoute(starting_location, stops)
+        key = self.route_cache.buildKey(starting_location, stops, self.returnSettings())
+        cached = self.route_cache.findRoute(key)
+        if cached is not None:
+            return list(cached[0])
+        route = self.buildRoute(starting_location, stops)
+        self.route_cache.addRoute(key, route, self.routeLength(starting_location, route))
+        return route
+
+    # Builds a route through stops: nearest neighbor, then local search if it is switched on
+    def buildRoute(self, starting_location, stops):
+        route = self.nearestNeighborRoute(starting_location, stops)
+        if len(route) < 3 or not (self.use_two_opt or self.use_or_opt):
+            return route
+        tour = [starting_location] + route
+        self.improveTour(tour)
+        return tour[1:]
+
+    # Greedy route construction. From the current location always drive to the closest stop not yet visited. The next
+    # stop is found by walking the current location's entry in the matrix's neighbor index, so each step usually costs
+    # O(neighbor_count) rather than a scan of every stop left.
+    def nearestNeighborRoute(self, starting_location, location_codes):
+        neighbor_index = self.distance_matrix.returnNeighborIndex()
+        remaining = DataStructures.RemainingSet(self.distance_matrix.size, location_codes)
+        route = []
+        current_location = starting_location
+        while remaining:
+            current_location = neighbor_index.findNearest(current_location, remaining)
+            remaining.discard(current_location)
+            route.append(current_location)
+        return route
+
+    # Returns the length of a route that starts at starting_location and visits location_codes in order. If
+    # return_to_start is True the drive back to the starting location is included.
+    def routeLength(self, starting_location, location_codes, return_to_start=True):
+        lookup = self.distance_matrix.lookupDistance
+        total = 0
+        current_location = starting_location
+        for location_code in location_codes:
+            total = total + lookup(current_location, location_code)
+            current_location = location_code
+        if return_to_start:
+            total = total + lookup(current_location, starting_location)
+        return total
+
+    # For every stop on the tour, the closest other stops on the same tour, closest first. They are taken from the
+    # matrix's neighbor index where it has enough of them, and otherwise worked out from the tour.
+    def buildNeighborLists(self, tour):
+        neighbor_index = self.distance_matrix.returnNeighborIndex()
+        on_tour = DataStructures.RemainingSet(self.distance_matrix.size, tour)
+        wanted = min(self.neighbor_count, len(tour) - 1)
+        neighbors = {}
+        for location_code in tour:
+            closest = [other for other in neighbor_index.returnNeighbors(location_code) if other in on_tour]
+            if len(closest) < wanted:
+                row = self.distance_matrix.returnRow(location_code)
+                others = [other for other in tour if other != location_code]
+                closest = heapq.nsmallest(self.neighbor_count, others, key=row.__getitem__)
+            neighbors[location_code] = closest[:self.neighbor_count]
+        return neighbors
+
+    # Runs the enabled local search steps on a closed tour until no improving move is found or the time or iteration
+    # budget runs out. The tour is changed in place, and position 0 (the starting location) never moves.
+    def improveTour(self, tour):
+        neighbors = self.buildNeighborLists(tour)
+        deadline = time.perf_counter() + self.time_limit
+        iterations = 0
+        improved = True
+        while improved and iterations < self.max_iterations and time.perf_counter() < deadline:
+            improved = False
+            if self.use_two_opt:
+                moves = self.twoOpt(tour, neighbors, deadline, self.max_iterations - iterations)
+                iterations = iterations + moves
+                improved = moves > 0
+            if self.use_or_opt and iterations < self.max_iterations:
+                moves = self.orOpt(tour, neighbors, deadline, self.max_iterations - iterations)
+                iterations = iterations + moves
+                improved = improved or moves > 0
+        return iterations
+
+    # One pass of 2-opt over the tour. For each edge (a, b) and each close neighbor c of a with successor d, replacing
+    # edges (a, b) and (c, d) with (a, c) and (b, d) shortens the tour by
+    # d(a, b) + d(c, d) - d(a, c) - d(b, d)
+    # and the move is made by reversing the part of the tour between b and c. Returns the number of moves applied.
+    def twoOpt(self, tour, neighbors, deadline, max_moves):
+        lookup = self.distance_matrix.lookupDistance
+        size = len(tour)
+        position = {location_code: index for index, location_code in enumerate(tour)}
+        moves = 0
+        for i in range(size):
+            if moves >= max_moves or time.perf_counter() >= deadline:
+                break
+            a = tour[i]
+            b = tour[(i + 1) % size]
+            removed_ab = lookup(a, b)
+            for c in neighbors[a]:
+                added_ac = lookup(a, c)
+                # neighbors are sorted, so once a-c is no shorter than a-b no further neighbor can help
+                if added_ac >= removed_ab:
+                    break
+                j = position[c]
+                d = tour[(j + 1) % size]
+                if c == b or d == a:
+                    continue
+                if added_ac + lookup(b, d) - removed_ab - lookup(c, d) < -1e-9:
+                    first, last = (i + 1, j) if i < j else (j + 1, i)
+                    tour[first:last + 1] = tour[first:last + 1][::-1]
+                    for index in range(first, last + 1):
+                        position[tour[index]] = index
+                    moves = moves + 1
+                    break
+        return moves
+
+    # One pass of Or-opt over the tour. A segment of 1 to 3 consecutive stops is cut out (joining its predecessor p to
+    # its successor n) and put back between a close neighbor c and its successor e, either way around so that c is
+    # joined to the end of the segment it is close to. The change in length is
+    # d(c, first) + d(last, e) - d(c, e) - (d(p, first) + d(last, n) - d(p, n))
+    # with first and last swapped when the segment is reversed. Returns the number of moves applied.
+    def orOpt(self, tour, neighbors, deadline, max_moves):
+        lookup = self.distance_matrix.lookupDistance
+        size = len(tour)
+        position = {location_code: index for index, location_code in enumerate(tour)}
+        moves = 0
+        for segment_length in (1, 2, 3):
+            if size - 1 <= segment_length:
+                break
+            i = 1
+            while i + segment_length <= size:
+                if moves >= max_moves or time.perf_counter() >= deadline:
+                    return moves
+                first = tour[i]
+                last = tour[i + segment_length - 1]
+                p = tour[i - 1]
+                n = tour[(i + segment_length) % size]
+                removal_gain = lookup(p, first) + lookup(last, n) - lookup(p, n)
+                best_delta = -1e-9
+                best_move = None
+                for end_point, reverse in ((first, False), (last, True)):
+                    other_end = last if end_point is first else first
+                    for c in neighbors[end_point]:
+                        added = lookup(c, end_point)
+                        # neighbors are sorted, so once the new edge costs more than removing the segment saves no
+                        # further neighbor is worth trying
+                        if added >= removal_gain:
+                            break
+                        c_index = position[c]
+                        if c == p or i <= c_index < i + segment_length:
+                            continue
+                        e = tour[(c_index + 1) % size]
+                        delta = added + lookup(other_end, e) - lookup(c, e) - removal_gain
+                        if delta < best_delta:
+                            best_delta = delta
+                            best_move = (c, reverse)
+                if best_move is None:
+                    i = i + 1
+                    continue
+                c, reverse = best_move
+                segment = tour[i:i + segment_length]
+                del tour[i:i + segment_length]
+                insert_at = tour.index(c) + 1
+                tour[insert_at:insert_at] = segment[::-1] if reverse else segment
+                for index in range(min(i, insert_at), size):
+                    position[tour[index]] = index
+                moves = moves + 1
+        return moves
+
+
+# Class that builds routes which respect the packages' deadlines, so time sensitive and end of day packages can share
+# one route instead of the time sensitive ones being driven first. Routes are built by insertion: stops are added one
+# at a time, tightest deadline first, each at the place in the route where it adds the fewest miles without making it
+# or any later stop late. Two times are kept for every stop on the route:
+# 1. arrival: when the truck gets there, worked forward from the start time
+# 2. latest: the latest the truck could get there without any stop from there on missing its deadline, worked
+# backward from the end as min(deadline, latest of the next stop - travel time to it)
+# A stop can then be put between two stops in constant time: it must be reached by its own deadline, and the stop
+# after it must still be reached by its latest time. A stop that can't go anywhere on time is put where it is least
+# late and reported as a miss, since no order of this load gets it there on time.
+# Planned routes can also be changed a little at a time, which is much cheaper than planning them again when a single
+# package is added, cancelled or sent to a new address during the day: insertPackages adds packages to a planned route
+# and removePackages takes them off. Either way only the stops next to the change are then tried in other places
+# (local repair), the rest of the route is left as it was.
+# Parameters:
+# 1. distance_matrix: a DataStructures.DistanceMatrix
+class DeadlineRouter:
+    def __init__(self, distance_matrix):
+        self.distance_matrix = distance_matrix
+
+    # Takes a starting location and time (seconds since midnight), the truck speed and a list of packages. Returns
+    # (ordered, late): the packages in delivery order, and (package, planned arrival) for every package the route gets
+    # to after its deadline. Packages that share a location are kept together. The route ends at end_location (by
+    # default back where it started).
+    def planPackageList(self, starting_location, start_time, speed, package_list, end_location=None):
+        return self.insertPackages(starting_location, start_time, speed, [], package_list, end_location)
+
+    # Adds new_packages to a route that has already been planned. planned is the route so far as packages in delivery
+    # order, which is kept apart from where the new stops go (and the local repair around them). A new package for a
+    # location already on the route simply joins that stop, unless its deadline is earlier, in which case the stop is
+    # placed again. Returns (ordered, late) like planPackageList.
+    def insertPackages(self, starting_location, start_time, speed, planned, new_packages, end_location=None):
+        if end_location is None:
+            end_location = starting_location
+        route, windows, packages_by_location = self.splitRoute(starting_location, start_time, speed, planned)
+        moved = set()
+        for package in new_packages:
+            location_code = package.location_code
+            stop_packages = packages_by_location.setdefault(location_code, [])
+            stop_packages.append(package)
+            if location_code == starting_location:
+                continue
+            if location_code in route:
+                index = route.index(location_code)
+                if package.deadline_seconds >= windows[index]:
+                    continue
+                del route[index]
+                del windows[index]
+            moved.add(location_code)
+        deadlines = {location_code: min(package.deadline_seconds for package in packages_by_location[location_code])
+                     for location_code in moved}
+        self.insertStops(route, windows, start_time, speed, deadlines, end_location)
+        if planned:
+            self.repairRoute(route, windows, start_time, speed, self.findNeighbors(route, moved), end_location)
+        return self.joinRoute(route, start_time, speed, packages_by_location)
+
+    # Plans a route through location_codes, where deadlines holds the deadline (seconds since midnight) of the stop at
+    # the same position. Returns the location codes in delivery order, not including the starting location. This is
+    # planPackageList worked out on location codes only, so it can be run where there are no packages, such as a worker
+    # process (see ParallelPlanner); joinRoute turns the result back into packages.
+    def planRoute(self, starting_location, start_time, speed, location_codes, deadlines, end_location=None):
+        if end_location is None:
+            end_location = starting_location
+        deadline_by_location = {}
+        for location_code, deadline in zip(location_codes, deadlines):
+            if location_code != starting_location:
+                deadline_by_location[location_code] = min(deadline, deadline_by_location.get(location_code, deadline))
+        route = [starting_location]
+        windows = [float('inf')]
+        self.insertStops(route, windows, start_time, speed, deadline_by_location, end_location)
+        return route[1:]
+
+    # Puts new stops into a route, given as location code -> deadline. The tightest deadline goes first; among equal
+    # deadlines the farthest stop from the start goes first, so the route is laid out around the stops that are
+    # hardest to fit in. Any remaining tie is broken by location code, so the order never depends on how the stops
+    # were collected.
+    def insertStops(self, route, windows, start_time, speed, deadlines, end_location):
+        row = self.distance_matrix.returnRow(route[0])
+        for stop in sorted(deadlines, key=lambda location_code: (deadlines[location_code], -row[location_code],
+                                                                  location_code)):
+            self.insertStop(route, windows, start_time, speed, stop, deadlines[stop], end_location)
+
+    # Takes packages off a planned route, then tries the stops either side of each removed stop in other places.
+    # Returns (ordered, late) like planPackageList.
+    def removePackages(self, starting_location, start_time, speed, planned, removed_packages, end_location=None):
+        if end_location is None:
+            end_location = starting_location
+        removed = set(removed_packages)
+        remaining = [package for package in planned if package not in removed]
+        old_route = list(dict.fromkeys(package.location_code for package in planned))
+        route, windows, packages_by_location = self.splitRoute(starting_location, start_time, speed, remaining)
+        emptied = {location_code for location_code in old_route if location_code not in packages_by_location}
+        touched = self.findNeighbors([starting_location] + old_route, emptied)
+        self.repairRoute(route, windows, start_time, speed, touched, end_location)
+        return self.joinRoute(route, start_time, speed, packages_by_location)
+
+    # Turns a planned list of packages into a route of location codes (starting with starting_location), the deadline
+    # of each stop on it, and the packages for each location. Stops the route already gets to late are given no
+    # deadline, the same as when they were first placed.
+    def splitRoute(self, starting_location, start_time, speed, planned):
+        packages_by_location = {}
+        for package in planned:
+            packages_by_location.setdefault(package.location_code, []).append(package)
+        route = [starting_location]
+        route.extend(location_code for location_code in packages_by_location if location_code != starting_location)
+        windows = [float('inf')]
+        windows.extend(min(package.deadline_seconds for package in packages_by_location[location_code])
+                       for location_code in route[1:])
+        arrivals, _ = self.calculateTimes(route, windows, start_time, speed)
+        for index in range(1, len(route)):
+            if arrivals[index] > windows[index]:
+                windows[index] = float('inf')
+        return route, windows, packages_by_location
+
+    # Turns a route of location codes back into packages. Returns (ordered, late) like planPackageList.
+    def joinRoute(self, route, start_time, speed, packages_by_location):
+        arrivals, _ = self.calculateTimes(route, [float('inf')] * len(route), start_time, speed)
+        ordered_packages = list(packages_by_location.get(route[0], []))
+        late = []
+        for location_code, arrival in zip(route[1:], arrivals[1:]):
+            for package in packages_by_location[location_code]:
+                ordered_packages.append(package)
+                if arrival > package.deadline_seconds:
+                    late.append((package, arrival))
+        return ordered_packages, late
+
+    # Returns the location codes on the route next to any of the given location codes (which may no longer be on it),
+    # along with those still on it. Used to pick the stops local repair looks at.
+    def findNeighbors(self, route, location_codes):
+        touched = set()
+        for index in range(1, len(route)):
+            if route[index] in location_codes:
+                touched.update(route[max(index - 1, 1):index + 2])
+        return touched
+
+    # Puts one stop into a route (and its deadline into windows) at the cheapest place that keeps every stop on time,
+    # or where it is least late if there is no such place. Stops that will be late get no deadline in windows, so
+    # they don't hold up the rest of the route. Returns the miles the stop adds.
+    def insertStop(self, route, windows, start_time, speed, stop, deadline, end_location):
+        arrivals, latest = self.calculateTimes(route, windows, start_time, speed)
+        cost, position = self.findInsertion(route, arrivals, latest, speed, stop, deadline, end_location)
+        if cost is None:
+            deadline = float('inf')
+        route.insert(position, stop)
+        windows.insert(position, deadline)
+        return cost
+
+    # Returns (cost, position) for the cheapest place a stop can go in a route that ends at end_location without
+    # anything being late. If there is none, cost is None and position is where the stop is least late.
+    def findInsertion(self, route, arrivals, latest, speed, stop, deadline, end_location):
+        lookup = self.distance_matrix.lookupDistance
+        best_cost = None
+        best_position = None
+        least_late = None
+        least_late_position = len(route)
+        for index, previous in enumerate(route):
+            arrival = arrivals[index] + SimClock.travelSeconds(lookup(previous, stop), speed)
+            following = route[index + 1] if index + 1 < len(route) else end_location
+            if index + 1 < len(route) and \
+                    arrival + SimClock.travelSeconds(lookup(stop, following), speed) > latest[index + 1]:
+                continue
+            if arrival > deadline:
+                if least_late is None or arrival < least_late:
+                    least_late = arrival
+                    least_late_position = index + 1
+                continue
+            cost = lookup(previous, stop) + lookup(stop, following) - lookup(previous, following)
+            if best_cost is None or cost < best_cost:
+                best_cost = cost
+                best_position = index + 1
+        if best_position is None:
+            return None, least_late_position
+        return best_cost, best_position
+
+    # Local repair. Each of the given stops is taken out of the route and put back at its cheapest on time place, and
+    # the move is kept if it shortens the route. Stops that are late where they are, or not on the route, are left
+    # alone.
+    def repairRoute(self, route, windows, start_time, speed, location_codes, end_location):
+        lookup = self.distance_matrix.lookupDistance
+        for stop in location_codes:
+            if stop not in route or stop == route[0]:
+                continue
+            index = route.index(stop)
+            deadline = windows[index]
+            if deadline == float('inf'):
+                continue
+            previous = route[index - 1]
+            following = route[index + 1] if index + 1 < len(route) else end_location
+            removal_gain = lookup(previous, stop) + lookup(stop, following) - lookup(previous, following)
+            del route[index]
+            del windows[index]
+            arrivals, latest = self.calculateTimes(route, windows, start_time, speed)
+            cost, position = self.findInsertion(route, arrivals, latest, speed, stop, deadline, end_location)
+            if cost is None or cost >= removal_gain - 1e-9:
+                position = index
+            route.insert(position, stop)
+            windows.insert(position, deadline)
+
+    # Returns the arrival and latest times for every stop on a route (see the class comment)
+    def calculateTimes(self, route, windows, start_time, speed):
+        lookup = self.distance_matrix.lookupDistance
+        travel = [SimClock.travelSeconds(lookup(route[index], route[index + 1]), speed)
+                  for index in range(len(route) - 1)]
+        arrivals = [start_time]
+        for seconds in travel:
+            arrivals.append(arrivals[-1] + seconds)
+        latest = list(windows)
+        for index in range(len(route) - 2, -1, -1):
+            latest[index] = min(windows[index], latest[index + 1] - travel[index])
+        return arrivals, latest
@@ -0,0 +1,191 @@
+# Module for keeping a history of simulation runs in a local SQLite database, so the results of past runs can be looked
+# up (for audits, or to compare settings) without running them again. Each run stores:
+# 1. runs: one row with when it was recorded, the settings it was run with (as JSON), the total miles, how many
+# packages were delivered and late, and when the last truck finished
+# 2. truck_totals: one row per truck with its miles, packages delivered and finish time
+# 3. package_events: one row per package status change from the run's timeline (time, status, truck, and the truck's
+# odometer at the time)
+# A run is written in a single transaction, with every table's rows inserted by one executemany call, so recording a
+# run costs a few statements no matter how many packages it had.
+#
+# e.g.
+#     with RunHistory.RunHistory('history.sqlite') as history:
+#         run_id = history.recordRun(simulation, {'trucks': 2})
+#         print(history.returnRuns())
+import json
+import sqlite3
+import time
+
+import Package
+import SimClock
+
+# Database used when no path is given
+DEFAULT_PATH = 'runhistory.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    recorded_at TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    total_miles REAL NOT NULL,
+    packages INTEGER NOT NULL,
+    delivered INTEGER NOT NULL,
+    late INTEGER NOT NULL,
+    finish_time INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS truck_totals (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    truck_number INTEGER NOT NULL,
+    miles REAL NOT NULL,
+    delivered INTEGER NOT NULL,
+    finish_time INTEGER NOT NULL,
+    PRIMARY KEY (run_id, truck_number)
+);
+CREATE TABLE IF NOT EXISTS package_events (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    package_id INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    status_code INTEGER NOT NULL,
+    truck_number INTEGER,
+    odometer REAL
+);
+CREATE INDEX IF NOT EXISTS package_events_by_package ON package_events (run_id, package_id, time);
+"""
+
+# Names of the status codes, as stored in package_events
+STATUS_NAMES = {
+    Package.STATUS_AT_HUB: 'at hub',
+    Package.STATUS_IN_TRANSIT: 'in transit',
+    Package.STATUS_LOADED: 'loaded',
+    Package.STATUS_DELIVERED: 'delivered',
+    Package.STATUS_OTHER: 'other',
+    Package.STATUS_CANCELLED: 'cancelled',
+}
+
+
+# Returns the settings of a simulation that can be read from the simulation itself
+def returnSimulationSettings(simulation):
+    packages = simulation.new_packages
+    return {
+        'packages': packages.file,
+        'distances': packages.file_distances,
+        'addresses': packages.file_addresslist,
+        'num_addresses': packages.address_matrix.size,
+        'trucks': len(simulation.fleet),
+        'drivers': simulation.fleet.returnDriverCount(),
+        'capacity': simulation.max_num_package_per_truck,
+        'speed': simulation.fleet.trucks[0].speed if len(simulation.fleet) else None,
+        'routing': 'planned' if simulation.deadline_router is not None else 'nearest',
+    }
+
+
+# Class that reads and writes the run history database at path. The tables are created the first time a database is
+# opened. Rows come back from the query methods as dictionaries, with times as HH:MM:SS text.
+class RunHistory:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    # Writes a simulation that has been run to the end of the day. settings holds what it was run with; anything not
+    # given (or given as None) is read from the simulation (see returnSimulationSettings). Returns the new run's id.
+    def recordRun(self, simulation, settings=None):
+        run_settings = returnSimulationSettings(simulation)
+        run_settings.update((name, value) for name, value in (settings or {}).items() if value is not None)
+        store = simulation.new_packages.package_store
+        delivered = store.returnRows('status', Package.STATUS_DELIVERED)
+        late = len(store.returnLateRows())
+        finish_time = max((truck.truck_time for truck in simulation.fleet), default=SimClock.DAY_START)
+
+        delivered_by_truck = {}
+        for row in delivered:
+            delivered_by_truck[store.status_trucks[row]] = delivered_by_truck.get(store.status_trucks[row], 0) + 1
+        truck_rows = [(truck.truck_number, truck.miles, delivered_by_truck.get(truck.truck_number, 0), truck.truck_time)
+                      for truck in simulation.fleet]
+
+        timeline = simulation.timeline
+        ids = timeline.initial_store.ids
+        event_rows = [(ids[row], event_time, status_code, truck_number if truck_number >= 0 else None, odometer)
+                      for event_time, row, status_code, truck_number, odometer
+                      in zip(timeline.times, timeline.rows, timeline.status_codes, timeline.trucks,
+                             timeline.odometers)]
+
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO runs (recorded_at, settings, total_miles, packages, delivered, late, finish_time) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (time.strftime('%Y-%m-%d %H:%M:%S'), json.dumps(run_settings, sort_keys=True),
+                 simulation.total_distance_traveled, len(store), len(delivered), late, finish_time))
+            run_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO truck_totals (run_id, truck_number, miles, delivered, finish_time) VALUES (?, ?, ?, ?, ?)',
+                [(run_id,) + row for row in truck_rows])
+            self.connection.executemany(
+                'INSERT INTO package_events (run_id, package_id, time, status_code, truck_number, odometer) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(run_id,) + row for row in event_rows])
+        return run_id
+
+    # Returns the latest runs, newest first
+    def returnRuns(self, limit=20):
+        rows = self.connection.execute('SELECT * FROM runs ORDER BY run_id DESC LIMIT ?', (limit,))
+        return [returnRunRow(row) for row in rows]
+
+    # Returns one run, or None if there is no run with that id
+    def returnRun(self, run_id):
+        row = self.connection.execute('SELECT * FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        return None if row is None else returnRunRow(row)
+
+    # Returns the runs recorded with the given settings (e.g. findRuns(trucks=3)), newest first
+    def findRuns(self, **settings):
+        return [run for run in self.returnRuns(limit=-1)
+                if all(run['settings'].get(name) == value for name, value in settings.items())]
+
+    # Returns the per-truck totals of a run, by truck number
+    def returnTruckTotals(self, run_id):
+        rows = self.connection.execute('SELECT truck_number, miles, delivered, finish_time FROM truck_totals '
+                                       'WHERE run_id = ? ORDER BY truck_number', (run_id,))
+        return [dict(row, finish_time=SimClock.toTimeString(row['finish_time'])) for row in rows]
+
+    # Returns the status changes of a run in time order, for every package or for one package only
+    def returnPackageEvents(self, run_id, package_id=None):
+        query = 'SELECT package_id, time, status_code, truck_number, odometer FROM package_events WHERE run_id = ?'
+        parameters = [run_id]
+        if package_id is not None:
+            query = query + ' AND package_id = ?'
+            parameters.append(package_id)
+        rows = self.connection.execute(query + ' ORDER BY time, rowid', parameters)
+        return [returnEventRow(row) for row in rows]
+
+    # Returns the delivery of every delivered package of a run, by package id
+    def returnDeliveries(self, run_id):
+        rows = self.connection.execute('SELECT package_id, time, status_code, truck_number, odometer '
+                                       'FROM package_events WHERE run_id = ? AND status_code = ? ORDER BY package_id',
+                                       (run_id, Package.STATUS_DELIVERED))
+        return [returnEventRow(row) for row in rows]
+
+    # Deletes a run and everything recorded with it
+    def deleteRun(self, run_id):
+        with self.connection:
+            self.connection.execute('DELETE FROM runs WHERE run_id = ?', (run_id,))
+
+
+# Turns a row of the runs table into a dictionary
+def returnRunRow(row):
+    return dict(row, settings=json.loads(row['settings']), finish_time=SimClock.toTimeString(row['finish_time']))
+
+
+# Turns a row of the package_events table into a dictionary, adding the status name
+def returnEventRow(row):
+    return dict(row, time=SimClock.toTimeString(row['time']), status=STATUS_NAMES[row['status_code']])
@@ -1,8 +1,23 @@
 # test bed for the simulation process
 
+from array import array
+
+import Constraints
 import Package
 import Truck
 import DataStructures
+import SimClock
+import Timeline
+
+# Kinds of events handled by the simulation
+EVENT_ARRIVAL = 'arrival'  # a truck reaches a stop (or the depot) and delivers what it has for that stop
+EVENT_PACKAGE_AVAILABLE = 'package available'  # packages that were not at the depot arrive there
+EVENT_ADDRESS_CORRECTION = 'address correction'  # the correct address for a package becomes known
+EVENT_DEPOT_RELOAD = 'depot reload'  # a truck is called back to the depot to load packages
+EVENT_CANCELLATION = 'cancellation'  # a package is cancelled
+EVENT_PAUSE = 'pause'  # the simulation stops
+
+
 # Primary class that "runs" the truck delivery simulation. Instantiating and instance of the simulation requires the
 # following parameters:
 # 1. filename_of_packages: this is a csv file that includes all of the data for the packages to be delivered.
@@ -16,62 +31,133 @@ import DataStructures
 # correctly.
 # 4. num_of_addresses: How many addresses are included in the distance index
 # 5. max_num_package_per_truck : This is default of 16, but this could be altered if in the future truck capacity
-# changes.
+# changes. It is the capacity of each truck in the default fleet.
+# 6. route_optimizer: optional RouteOptimizer.RouteOptimizer. When given, routes are built with it (nearest neighbor
+# improved by local search) and trucks follow the planned order, instead of picking the nearest package at each stop.
+# 7. use_cache: if True the input files are parsed once and kept in a binary snapshot that later simulations reuse
+# (see InputCache)
+# 8. fleet: optional Truck.Fleet of trucks doing the deliveries. By default this is two trucks, each holding
+# max_num_package_per_truck packages.
+# 9. filename_of_constraints: optional csv file of special handling rules for the packages (which truck a package must
+# go on, packages that must go together, late packages, deadline changes and address corrections). See Constraints.
+# 10. packages / constraints: already loaded Package.PackagesToBeDelivered and Constraints.ConstraintRules objects. If
+# given they are used instead of loading the files.
+# 11. route_assigner: optional RouteAssigner.SavingsAssigner. When given, it decides which of the remaining packages
+# each truck is filled up with (see loadRemainingSpace), instead of cutting one nearest neighbor route into pieces.
+# 12. deadline_router: optional RouteOptimizer.DeadlineRouter. When given, each truck's time sensitive and regular
+# packages are planned as one route that respects their deadlines every time the truck is loaded, and the truck
+# follows that route instead of delivering all time sensitive packages first. Address corrections and cancellations
+# during the day then only change the affected stops of a truck's route, rather than planning it again.
+# 13. route_cache: optional DataStructures.RouteCache. Nearest neighbor routes are kept in it and reused when the same
+# stops are routed again, which happens a lot when many simulations of the same day are run. It can be shared by
+# simulations (and route optimizers) that use the same distances.
+# 14. route_planner: optional ParallelPlanner.ParallelPlanner. When given along with a deadline router, the routes of
+# all trucks loaded at the start of the day are planned at the same time on its worker processes, instead of one truck
+# after another.
 # Other data members which are created as class members include:
-# 1. packages_truck1(2) : These are packages that are loaded into the truck specified. They do not have any limitations
-# and it's assumed they can be delivered at any time of day.
-# 2. self.packages_with_no_restrictions: All packages start here. When the class is created, all packages are loaded
-# onto this list. They are moved into other lists as appropriate.
-# 3. packages_with_deadline_truck1(2): These packages need to be delivered by a certain time. They are prioritized
-# and will be delivered first.
-# 4. packages_not_available: Packages are moved to this list if they are not available at the depot, or if they are not
+# 1. self.packages_with_no_restrictions: All packages start here. When the class is created, all packages are loaded
+# onto this list. They are moved into other lists as appropriate. Packages loaded onto a truck are kept on that
+# truck's lists (packages, packages_with_deadline, packages_to_hold).
+# 2. packages_not_available: Packages are moved to this list if they are not available at the depot, or if they are not
 # ready to be loaded on to a truck.
-# 5. total_distance_traveled: This is an aggregate of distances traveled by all trucks.
+# 3. total_distance_traveled: This is an aggregate of distances traveled by all trucks.
+# 4. events: the queue of things that will happen during the day. The simulation runs by taking the next event off the
+# queue and handling it, so all trucks move forward on the same clock (current_time).
+# 5. held_packages: ids of packages that can't be delivered until their address is corrected
+# 6. constraints: the special handling rules, as a Constraints.ConstraintRules
+# 7. truck_by_group: the truck each group of packages that must go together was loaded on
+# 8. timeline: a Timeline.Timeline of every package status change and truck odometer reading during the run. It is
+# created when loadAndDeliver starts. After a full day has been run it can answer what things looked like at any time,
+# without running the simulation again.
+# 9. planned_misses: package id -> (truck number, planned arrival) for every package a deadline router could not fit
+# on its truck's route in time, as of the latest plan for that truck
+# 10. trucks_out: the trucks that have a driver, i.e. every truck away from the depot. A truck only leaves the depot
+# if the fleet has a driver free (see Truck.Fleet drivers); otherwise it joins trucks_waiting_for_driver, and gets
+# the first driver to come back.
+# 11. optimized_trucks: with a route optimizer (and no deadline router), the trucks whose regular packages have been
+# put in route order from where the truck was when it got to them (see chooseNextPackage)
 class Simulation:
     def __init__(self, filename_of_packages, filename_of_distances, filename_address_index,
-                 num_of_addresses, max_num_package_per_truck=16):
-        self.new_packages = Package.PackagesToBeDelivered(filename_of_packages, filename_of_distances,
-                                                          filename_address_index, num_of_addresses)
-        self.truck1 = Truck.Truck(1)
-        self.truck2 = Truck.Truck(2)
-        self.packages_truck1 = []  # packages on truck 1
-        self.packages_truck2 = []  # packages on truck 2
-        self.packages_with_deadline_truck1 = []  # packages that have a specific deadline for delivery
-        self.packages_with_deadline_truck2 = []
+                 num_of_addresses, max_num_package_per_truck=16, route_optimizer=None, use_cache=False, fleet=None,
+                 filename_of_constraints=None, packages=None, constraints=None, route_assigner=None,
+                 deadline_router=None, route_cache=None, route_planner=None):
+        if packages is None:
+            packages = Package.PackagesToBeDelivered(filename_of_packages, filename_of_distances,
+                                                     filename_address_index, num_of_addresses, use_cache)
+        self.new_packages = packages
+        if fleet is None:
+            fleet = Truck.Fleet(2, max_num_package_per_truck)
+        self.fleet = fleet
         self.packages_not_available = []  # packages that are not available at the depot
         self.packages_with_no_restrictions = self.new_packages.returnAllPackages()  # packages that have no delivery
                                                     # restrictions. to start, this is loaded with all packages
         self.total_distance_traveled = 0
         self.max_num_package_per_truck = max_num_package_per_truck
-
+        self.route_optimizer = route_optimizer
+        self.route_assigner = route_assigner
+        self.deadline_router = deadline_router
+        self.route_cache = route_cache
+        self.route_planner = route_planner
+        self.planned_misses = {}
+        self.events = DataStructures.EventQueue()
+        self.current_time = SimClock.DAY_START  # time of the event being handled
+        self.held_packages = set()  # ids of packages that can't be delivered until their address is corrected
+        if constraints is None:
+            constraints = Constraints.ConstraintRules(filename_of_constraints)
+        self.constraints = constraints
+        self.truck_by_group = {}
+        self.timeline = None
+        self.trucks_out = set()
+        self.trucks_waiting_for_driver = []
+        self.optimized_trucks = set()
 
     # Takes a list of packages. Returns the optimal order they should be delivered in, using a
     # greedy algorithm to compute. Returns a list of packages in the best order using a "nearest neighbor" approach.
-    # O(n^2)
+    # Packages are grouped by location, and each next location is found from the distance matrix's neighbor index, so
+    # building the order is close to linear in the number of locations. If the simulation has a route optimizer, it is
+    # used instead.
     def discoverShortestPathList(self, starting_location, package_list):
-        nearest_neighbor_list = []
-        while package_list:
-            nearest_neighbor = self.calculateClosestVertex(starting_location, package_list)
-            nearest_neighbor_list.append(nearest_neighbor)
-            starting_location = nearest_neighbor.location_code
-            package_list.remove(nearest_neighbor)
+        if self.route_optimizer is not None:
+            return self.route_optimizer.optimizePackageList(starting_location, package_list)
+        packages_by_location = {}
+        for package in package_list:
+            packages_by_location.setdefault(package.location_code, []).append(package)
+        nearest_neighbor_list = packages_by_location.pop(starting_location, [])
+        for location_code in self.findNearestNeighborRoute(starting_location, packages_by_location):
+            nearest_neighbor_list.extend(packages_by_location[location_code])
         return nearest_neighbor_list
 
-    # takes a location code,and a list of potential adjacent vertices. Returns the one that is closest
+    # Returns the nearest neighbor route from starting_location through location_codes, as a list of location codes.
+    # Routes are looked up in the route cache first, if there is one.
+    def findNearestNeighborRoute(self, starting_location, location_codes):
+        if self.route_cache is not None:
+            key = self.route_cache.buildKey(starting_location, location_codes, 'nearest neighbor')
+            cached = self.route_cache.findRoute(key)
+            if cached is not None:
+                return cached[0]
+        address_matrix = self.new_packages.address_matrix
+        neighbor_index = address_matrix.returnNeighborIndex()
+        remaining = DataStructures.RemainingSet(address_matrix.size, location_codes)
+        route = []
+        length = 0
+        current_location = starting_location
+        while remaining:
+            next_location = neighbor_index.findNearest(current_location, remaining)
+            remaining.discard(next_location)
+            route.append(next_location)
+            length = length + address_matrix.lookupDistance(current_location, next_location)
+            current_location = next_location
+        if self.route_cache is not None:
+            self.route_cache.addRoute(key, route, length + address_matrix.lookupDistance(current_location,
+                                                                                         starting_location))
+        return route
+
+    # takes a location code,and a list of potential adjacent vertices. Returns the one that is closest. The distance
+    # matrix does the comparison for all candidates in one call.
     def calculateClosestVertex(self, starting_location, potential_adjacent):
-        shortest_distance = 0
-        closest_vertex = 0
-        for i in range(len(potential_adjacent)):
-            distance = self.new_packages.address_matrix.lookupDistance(starting_location,
-                                                                       potential_adjacent[i].location_code)
-            if shortest_distance == 0 and closest_vertex == 0:
-                shortest_distance = distance
-                closest_vertex = potential_adjacent[i]
-            else:
-                if shortest_distance > distance:
-                    shortest_distance = distance
-                    closest_vertex = potential_adjacent[i]
-        return closest_vertex
+        location_codes = [package.location_code for package in potential_adjacent]
+        closest = self.new_packages.address_matrix.findClosest(starting_location, location_codes)
+        return potential_adjacent[closest]
 
     # Move a package from one list to another list. Package id is used rather than the actual package object, mostly
     # so that it is easy for an employee to potentially adjust where packages go by their number, rather than
@@ -82,246 +168,461 @@ class Simulation:
         source_list.remove(package)
         dest_list.append(package)
 
-    # if a package has been loaded on a truck, its status is updated. Runs this on all trucks in a ready status,
-    # so it only needs to be run after packages have been newly loaded.
+    # if a package has been loaded on a truck, its status is updated. Runs this on all trucks in the fleet, so it only
+    # needs to be run after packages have been newly loaded.
     def updateStatusToLoadedOnTruck(self):
-        for package in self.truck1.packages:
-            package.updateDeliveryStatus('Loaded on truck 1 for delivery')
-        for package in self.truck2.packages:
-            package.updateDeliveryStatus('Loaded on truck 2 for delivery')
-        for package in self.packages_with_deadline_truck1:
-            package.updateDeliveryStatus('Loaded on truck 1 for delivery')
-        for package in self.packages_with_deadline_truck2:
-            package.updateDeliveryStatus('Loaded on truck 2 for delivery')
-
-
-
-    # Manages the loading of trucks and their delivery. End_time is the time after which the simulation will
-    # end. If no time is entered end of day is assumed (19:00). In this case, packages are loaded in an order
-    # that allows the application to meet the requirements as specified. It would be easy to create additional
-    # functionality that would allow more flexibility. This implementaiton is offered as a proof of concept.
-    def loadAndDeliver(self, end_time='19:00'):
-        # Load packages that must be on specific trucks
-        # 3, 18,  36, 38 only on truck 2
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_truck2, 3)
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_truck2, 18)
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_truck2, 36)
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_truck2, 38)
-
-        # 13, 14, 15, 16, 19, 20 must be delivered together so they will go on truck 1. 13, 14, 16, 20
-        # are early packages)
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_truck1, 19)
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_with_deadline_truck1, 15)
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_with_deadline_truck1, 13)
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_with_deadline_truck1, 14)
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_with_deadline_truck1, 16)
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_with_deadline_truck1, 20)
-
-
-        # 29, 30, 31, 34, 37, 40 by 10:30 am, split evenly between two trucks. (25 arrives late)Run through
-        # optimization first, so that the order is as beneficial as possible.
-        # 6 is a unique case, because it needs to delivered by 10:30 but won't be available until 9:05, so it's
-        # not included heree
-        list_adjacent = [1, 29, 30, 31, 34, 37, 40]
-        adjacent_packages = []
-        while list_adjacent:
-            for i in range(len(self.packages_with_no_restrictions)):
-                if self.packages_with_no_restrictions[i].id == list_adjacent[0]:
-                    adjacent_packages.append(self.packages_with_no_restrictions[i])
-                    list_adjacent.remove(self.packages_with_no_restrictions[i].id)
-
-        ordered_list = self.discoverShortestPathList(0, adjacent_packages)
-        # split the list in half, and distribute amongst the two trucks.
-        mid = len(ordered_list) // 2
-        list1 = ordered_list[mid:]
-        list2 = ordered_list[:mid]
-
-        # Load the time sensitive lists onto the trucks
-        for item in list1:
-            self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_with_deadline_truck1,
-                                                 item.id)
-        for item in list2:
-            self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_with_deadline_truck2,
-                                                 item.id)
-
-
-        # Remove packages that are not available at first load
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_not_available, 6)
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_not_available, 25)
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_not_available, 28)
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_not_available, 32)
-        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_not_available, 9)
-        for package in self.packages_not_available:
-            package.updateDeliveryStatus(f"Awaiting package at hub - in Transit")
-        # See how many openings are left
-        # truck 1
-        total_num_packages_remaining_truck1 = len(self.packages_truck1 + self.packages_with_deadline_truck1)
-        total_num_packages_remaining_truck2 = len(self.packages_truck2 + self.packages_with_deadline_truck2)
-
-        total_num_packages_to_pull = total_num_packages_remaining_truck1 + total_num_packages_remaining_truck2
-        # peel of some packages from the remaining ones
-        to_deliver = []
-        for i in range(total_num_packages_to_pull):
-            to_deliver.append(self.packages_with_no_restrictions[i])
-        self.packages_with_no_restrictions = self.packages_with_no_restrictions[total_num_packages_to_pull:]
-
-        # Take of list of packages and send them through the optimization algorithm. This serves the purpose of grouping
-        # packages more closely to one another - hopefully avoiding the trucks having to cross paths more often than
-        # necessary.
+        for truck in self.fleet:
+            self.updateTruckStatusToLoaded(truck)
+
+    # Marks every package on a truck as loaded on that truck
+    def updateTruckStatusToLoaded(self, truck):
+        for package_list in (truck.packages_with_deadline, truck.packages, truck.packages_to_hold):
+            for package in package_list:
+                package.markLoaded(truck.truck_number)
+                self.timeline.recordStatus(self.current_time, package, truck.truck_number, truck.miles)
+
+    # Fills every truck in the fleet up to its capacity from packages_with_no_restrictions. The packages are first put
+    # in route order, so each truck gets a run of packages that are close to one another. With a route assigner, the
+    # packages are instead split into clusters around what each truck already carries, and packages that don't fit go
+    # back on packages_with_no_restrictions cluster by cluster, ready for the next trip.
+    def loadRemainingSpace(self, trucks):
+        if self.route_assigner is not None:
+            loads = [truck.packages_with_deadline + truck.packages + truck.packages_to_hold for truck in trucks]
+            capacities = [truck.capacity for truck in trucks]
+            assigned, self.packages_with_no_restrictions = self.route_assigner.assignPackages(
+                0, loads, capacities, self.packages_with_no_restrictions)
+            for truck, packages in zip(trucks, assigned):
+                self.addToTruck(truck, packages)
+            return
+        spaces = [max(truck.returnSpaceRemaining(), 0) for truck in trucks]
+        to_deliver = self.packages_with_no_restrictions[:sum(spaces)]
+        self.packages_with_no_restrictions = self.packages_with_no_restrictions[len(to_deliver):]
         optimized_list = self.discoverShortestPathList(0, to_deliver)
-
-        # Split the optimized list into two lists, of the correct size for each truck
-        list_truck1 = optimized_list[:total_num_packages_remaining_truck1]
-        list_truck2 = optimized_list[total_num_packages_remaining_truck1:]
-
-        # Load truck 1
-        while list_truck1:
-            self.movePackageFromOneListToAnother(list_truck1, self.packages_truck1, list_truck1[0].id)
-
-
-        #  and truck 2
-        while list_truck2:
-            self.movePackageFromOneListToAnother(list_truck2, self.packages_truck2, list_truck2[0].id)
-
-        # copy lists over to the truck's list
-        self.truck1.packages = self.packages_truck1
-        self.truck2.packages = self.packages_truck2
+        start = 0
+        for truck, space in zip(trucks, spaces):
+            self.addToTruck(truck, optimized_list[start:start + space])
+            start = start + space
+
+    # Puts packages on the right lists of a truck (see returnTruckListName), keeping their order
+    def addToTruck(self, truck, packages):
+        for package in packages:
+            getattr(truck, self.returnTruckListName(package)).append(package)
+
+    # Manages the loading of trucks and their delivery. End_time is the time after which the simulation will end,
+    # either in seconds since midnight or as a military time string. If no time is entered end of day is assumed
+    # (19:00). The trucks are loaded according to the special handling rules:
+    # 1. Packages that are late to the depot are set aside, and an event is scheduled for when they arrive.
+    # 2. Packages with a wrong address are held until the correction, which is scheduled as an event.
+    # 3. Packages that must go together are loaded onto one truck, and packages that must go on a specific truck are
+    # loaded onto it.
+    # 4. The remaining time sensitive packages are put in route order and split between the trucks.
+    # 5. The remaining space on every truck is filled.
+    # The rest of the day (late packages, address corrections, reloading at the depot) is then run by runEvents.
+    def loadAndDeliver(self, end_time=SimClock.SIMULATION_END):
+        end_time = SimClock.toSeconds(end_time)
+        rules = self.constraints
+        trucks = list(self.fleet)
+        for package_id, truck_number in rules.truck_by_package.items():
+            if truck_number not in self.fleet.trucks_by_number:
+                raise ValueError(f"Package {package_id} must go on truck {truck_number}, which is not in the fleet")
+
+        for package_id, deadline in rules.deadline_by_package.items():
+            self.new_packages.returnPackageByID(package_id).updateDeadline(deadline)
+        self.current_time = SimClock.DAY_START
+        self.timeline = Timeline.Timeline(self.new_packages.package_store)
+
+        # Set aside packages that are not at the depot yet, and schedule their arrival
+        arrivals = {}
+        for package_id, available_time in rules.available_by_package.items():
+            if available_time > SimClock.DAY_START:
+                self.movePackageFromOneListToAnother(self.packages_with_no_restrictions, self.packages_not_available,
+                                                     package_id)
+                arrivals.setdefault(available_time, []).append(package_id)
+        for package in self.packages_not_available:
+            package.markInTransit()
+            self.timeline.recordStatus(self.current_time, package)
+        for available_time, package_ids in arrivals.items():
+            self.events.addEvent(available_time, EVENT_PACKAGE_AVAILABLE, package_ids)
+
+        # Hold packages with a wrong address until the correction comes in
+        for package_id, (correction_time, address, city, zip) in rules.correction_by_package.items():
+            self.held_packages.add(package_id)
+            self.events.addEvent(correction_time, EVENT_ADDRESS_CORRECTION, (package_id, address, city, zip))
+
+        # Schedule cancellations
+        for package_id, cancellation_time in rules.cancellation_by_package.items():
+            self.events.addEvent(cancellation_time, EVENT_CANCELLATION, package_id)
+
+        # Load packages that must go together onto one truck (the truck one of them is restricted to, if any), then
+        # packages that must be on specific trucks
+        for group, package_ids in rules.members_by_group.items():
+            members = [package for package in self.packages_with_no_restrictions if package.id in package_ids]
+            if not members:
+                continue
+            restricted = [rules.returnTruckRestriction(package.id) for package in members
+                          if rules.returnTruckRestriction(package.id) is not None]
+            if restricted:
+                truck = self.fleet.returnTruck(restricted[0])
+            else:
+                truck = max(trucks, key=lambda candidate: candidate.returnSpaceRemaining())
+            if len(members) > truck.returnSpaceRemaining():
+                raise ValueError(f"Packages {sorted(package.id for package in members)} must go together, but truck "
+                                 f"{truck.truck_number} only has room for {truck.returnSpaceRemaining()} more")
+            self.truck_by_group[group] = truck
+            for package in members:
+                self.loadPackage(truck, package)
+        for package in list(self.packages_with_no_restrictions):
+            truck_number = rules.returnTruckRestriction(package.id)
+            if truck_number is not None:
+                truck = self.fleet.returnTruck(truck_number)
+                if truck.returnSpaceRemaining() < 1:
+                    raise ValueError(f"Package {package.id} must go on truck {truck_number}, which is already full "
+                                     f"({truck.capacity} packages)")
+                self.loadPackage(truck, package)
+
+        # The remaining packages that need to be delivered by a certain time are run through optimization first, so
+        # that the order is as beneficial as possible. The ordered list is split into consecutive runs, one per truck,
+        # starting with the last truck.
+        time_sensitive = [package for package in self.packages_with_no_restrictions
+                          if package.deadline_seconds < SimClock.END_OF_DAY]
+        ordered_list = self.discoverShortestPathList(0, time_sensitive)
+        start = 0
+        for index, truck in enumerate(reversed(trucks)):
+            end = len(ordered_list) * (index + 1) // len(trucks)
+            for package in ordered_list[start:end]:
+                self.loadPackage(truck, package)
+            start = end
+
+        # Fill the remaining space on every truck. Take of list of packages and send them through the optimization
+        # algorithm. This serves the purpose of grouping packages more closely to one another - hopefully avoiding the
+        # trucks having to cross paths more often than necessary.
+        self.loadRemainingSpace(trucks)
 
         # Now that everything is loaded, update the statuses of the loaded trucks.
         self.updateStatusToLoadedOnTruck()
-
-        # Truck two will report to depot to pick up package 9 (appended last because of a delayed
-        # address 10:05). Add 6, 25, 28, 32 available at 9:05. Truck 2 will run the simulation until 9:05
-        # or until the given end_time, whichever is earlier.
-        self.runIndividualTruckSimulation(self.truck1, self.packages_with_deadline_truck1, end_time)
-        if self.determineIfTimeIsAfter('09:05', end_time):
-            self.runIndividualTruckSimulation(self.truck2, self.packages_with_deadline_truck2, '09:05')
+        if self.route_planner is not None:
+            self.planTruckRoutes(trucks)
         else:
-            self.runIndividualTruckSimulation(self.truck2, self.packages_with_deadline_truck2, end_time)
-
-        # This stops the simulation from running and subsequently loading truck 2 again if the given end time
-        # falls before 9:05
-        if self.determineIfTimeIsAfter(end_time, '09:05'):
-            return
-
-        # Add the late packages to truck 2
-        self.movePackageFromOneListToAnother(self.packages_not_available, self.packages_with_deadline_truck2, 6)
-        self.movePackageFromOneListToAnother(self.packages_not_available, self.packages_with_deadline_truck2, 25)
-        self.movePackageFromOneListToAnother(self.packages_not_available, self.truck2.packages, 28)
-        self.movePackageFromOneListToAnother(self.packages_not_available, self.truck2.packages, 32)
-        self.movePackageFromOneListToAnother(self.packages_not_available, self.truck2.packages_to_hold, 9)
-        self.truck2.packages_to_hold[0].updateDeliveryStatus('Loaded on truck 2 for delivery')
-
-        # if there is any space remaining, load truck 2 until it's full.
-        truck_space = self.max_num_package_per_truck - (len(self.packages_with_deadline_truck2) +
-                                                        len(self.truck2.packages) + len(self.truck2.packages_to_hold))
-        to_load = self.packages_with_no_restrictions[:truck_space]
-
-        # Optimize the route
-        optimize = self.discoverShortestPathList(0, to_load)
-        for package in optimize:
-            self.truck2.packages.append(package)
-            self.packages_with_no_restrictions.remove(package)
-
-        # Update load status
-        self.updateStatusToLoadedOnTruck()
-
-        # Deliver until the given end time
-        self.runIndividualTruckSimulation(self.truck2, self.packages_with_deadline_truck2, end_time)
-
-    # Run a delivery simulation. Truck is the truck object doing the delivery. Special_handling is a list of
-    # packages that must be run first . Time is the spot after which the simulation
-    # should stop. So if the time from 8:00 to 8:15 were to be reviewed, this would be looking for times after 8:00
-    def runIndividualTruckSimulation(self, truck, special_handling, time):
-        # deliver time sensitive packages first
-        # Hand deliver the earliest delivery, so that it makes it on time.
-        current_location = 0  # At depot
-        delivered = []  # tracks delivered packages so they can be removed from the appropriate list.
-        # There is a package that needs to be updated so these variables will manage that
-        update_address = True
-        update_time = '10:20'
-        # Delivers all special handling (ie early) packages until there are either no packages on this list remaining,
-        # or, the time given has elapsed. The application checks the time at each delivery point, but will not stop while
-        # on route
-        while special_handling:
-            next_destination = self.calculateClosestVertex(current_location, special_handling)
-            self.deliverPackage(truck, next_destination, current_location)
-            current_location = next_destination.location_code
-            special_handling.remove(next_destination)
-            if truck.determineIfTimeIsAfter(time):
-                self.returnToDepotAddMiles(truck, current_location)
+            for truck in trucks:
+                self.planTruckRoute(truck)
+
+        # Send out the trucks and run the day until the given end time
+        for truck in trucks:
+            self.dispatchTruck(truck)
+        self.runEvents(end_time)
+
+    # Moves a package from packages_with_no_restrictions onto the right list on a truck: held packages are delivered
+    # last, time sensitive packages first, and everything else in between.
+    def loadPackage(self, truck, package):
+        self.movePackageFromOneListToAnother(self.packages_with_no_restrictions,
+                                             getattr(truck, self.returnTruckListName(package)), package.id)
+
+    # Returns the name of the truck list a package should be loaded onto
+    def returnTruckListName(self, package):
+        if package.id in self.held_packages:
+            return 'packages_to_hold'
+        if package.deadline_seconds < SimClock.END_OF_DAY:
+            return 'packages_with_deadline'
+        return 'packages'
+
+    # Runs the simulation: handles events in time order until there are none left, or the end time is reached. Events
+    # at exactly the end time are still handled.
+    def runEvents(self, end_time=SimClock.SIMULATION_END):
+        self.events.addEvent(SimClock.toSeconds(end_time), EVENT_PAUSE, priority=1)
+        while self.events:
+            self.current_time, kind, data = self.events.popEvent()
+            if kind == EVENT_PAUSE:
                 return
-            if truck.determineIfTimeIsAfter(update_time) and update_address:
-                address_to_update = self.new_packages.packageHash.findDataInHashTable(9)
-                address_to_update.updateAddress('410 S State St', 'Salt Lake City', '84111')
-                update_address = False
-        for item in delivered:
-            if item in special_handling:
-                special_handling.remove(item)
-        # Deliver the remaining packages using some optimization to reduce overall mileage
-        # for packages in truck.packages:
-        while truck.packages:
-            next_stop = self.calculateClosestVertex(current_location, truck.packages)
-            truck_time = self.deliverPackage(truck, next_stop, current_location)
-            current_location = next_stop.location_code
-            truck.packages.remove(next_stop)
-            if truck.determineIfTimeIsAfter(time):
-                return
-            if truck.determineIfTimeIsAfter(update_time) and update_address == True:
-                address_to_update = self.new_packages.packageHash.findDataInHashTable(9)
-                address_to_update.updateAddress('410 S State St', 'Salt Lake City', '84111', 20)
-                update_address = False
-
-        # Finally deliver packages that needed to be held for later delivery
-        for item in truck.packages_to_hold:
-            truck_time = self.deliverPackage(truck, item, current_location)
-            current_location = item.location_code
-            truck.packages_to_hold.remove(item)
-            if truck.determineIfTimeIsAfter(time):
-                return
-            if truck.determineIfTimeIsAfter(update_time) and update_address == True:
-                address_to_update = self.new_packages.packageHash.findDataInHashTable(9)
-                address_to_update.updateAddress('410 S State St', 'Salt Lake City', '84111', 20)
-                update_address = False
-
-        # If we reach the end before time, return to the depot
-        self.returnToDepotAddMiles(truck, current_location)
-
-    # Deliver package. Update truck time and distance traveled. Update package status, and return current truck time
-    def deliverPackage(self, truck, package, current_location):
-        distance_traveled = self.new_packages.address_matrix.lookupDistance(current_location, package.location_code)
-        truck_time = truck.deliverPackage(distance_traveled)
+            if kind == EVENT_ARRIVAL:
+                self.handleArrival(*data)
+            elif kind == EVENT_PACKAGE_AVAILABLE:
+                self.handlePackageAvailable(data)
+            elif kind == EVENT_ADDRESS_CORRECTION:
+                self.handleAddressCorrection(*data)
+            elif kind == EVENT_DEPOT_RELOAD:
+                self.handleDepotReload(data)
+            elif kind == EVENT_CANCELLATION:
+                self.cancelPackage(data)
+
+    # A truck reaches destination (a location code). Every package on the truck for that location is delivered, then the
+    # truck heads for its next stop.
+    def handleArrival(self, truck, destination):
+        distance_traveled = self.new_packages.address_matrix.lookupDistance(truck.location_code, destination)
+        truck.deliverPackage(distance_traveled)
         self.updateTotalMiles(distance_traveled)
-        package.updateDeliveryStatus(f"Delivered at {truck.truck_time}, On Truck {truck.truck_number}")
-
-        return truck_time
+        truck.location_code = destination
+        truck.en_route = False
+        self.timeline.recordOdometer(self.current_time, truck.truck_number, truck.miles)
+        if destination != 0:
+            for package_list in (truck.packages_with_deadline, truck.packages, truck.packages_to_hold):
+                delivered = [package for package in package_list
+                             if package.location_code == destination and package.id not in self.held_packages]
+                for package in delivered:
+                    self.deliverPackage(truck, package)
+                    package_list.remove(package)
+        else:
+            self.releaseDriver(truck)
+        self.dispatchTruck(truck)
+
+    # Packages have arrived at the depot. Each one is given to a truck: the truck it is restricted to, or the truck the
+    # rest of its group is on, or otherwise the truck with the fewest time sensitive packages left that has room for
+    # it. The trucks are called back to collect them.
+    def handlePackageAvailable(self, package_ids):
+        trucks_to_reload = []
+        for package_id in package_ids:
+            package = self.new_packages.returnPackageByID(package_id)
+            if package not in self.packages_not_available:
+                continue  # cancelled before it arrived
+            self.packages_not_available.remove(package)
+            truck_number = self.constraints.returnTruckRestriction(package_id)
+            group = self.constraints.returnGroup(package_id)
+            if truck_number is not None:
+                truck = self.fleet.returnTruck(truck_number)
+            elif group in self.truck_by_group:
+                truck = self.truck_by_group[group]
+            else:
+                truck = self.chooseTruckForPickup()
+            if group is not None:
+                self.truck_by_group.setdefault(group, truck)
+            truck.pickups.append((package, self.returnTruckListName(package)))
+            if truck not in trucks_to_reload:
+                trucks_to_reload.append(truck)
+        for truck in trucks_to_reload:
+            self.events.addEvent(self.current_time, EVENT_DEPOT_RELOAD, truck)
+
+    # Returns the truck that should collect a package that has just arrived at the depot: the one with the fewest time
+    # sensitive packages left to deliver, among the trucks that still have room. Ties go to the lowest truck number.
+    def chooseTruckForPickup(self):
+        trucks = [truck for truck in self.fleet if truck.returnLoadCount() + len(truck.pickups) < truck.capacity]
+        if not trucks:
+            trucks = list(self.fleet)
+        return min(trucks, key=lambda truck: len(truck.packages_with_deadline))
+
+    # A truck is asked to come back to the depot. If it is on the road it finishes its current stop first.
+    def handleDepotReload(self, truck):
+        truck.return_to_depot = True
+        self.wakeTruck(truck)
+
+    # The correct address for a package is now known. The package can now be delivered, and any truck that was waiting
+    # on it sets off again. With a deadline router, the package is taken off its truck's route and put back in at its
+    # new address.
+    def handleAddressCorrection(self, package_id, address, city, zip):
+        package = self.new_packages.returnPackageByID(package_id)
+        truck = self.removeFromTruck(package) if self.deadline_router is not None else None
+        location_code = self.new_packages.location_index.get(address, package.location_code)
+        package.updateAddress(address, city, zip, location_code)
+        self.timeline.recordAddress(self.current_time, package)
+        self.held_packages.discard(package_id)
+        if truck is not None:
+            self.insertIntoRoute(truck, [package])
+        for truck in self.fleet:
+            self.wakeTruck(truck)
+
+    # Cancels a package that hasn't been delivered yet: it is taken off whichever truck or list it is on and marked as
+    # cancelled. Trucks that were only waiting on it are woken up. Returns True if the package was cancelled.
+    def cancelPackage(self, package_id):
+        package = self.new_packages.returnPackageByID(package_id)
+        if package is None or package.store.status_codes[package.row] in (Package.STATUS_DELIVERED,
+                                                                           Package.STATUS_CANCELLED):
+            return False
+        self.removeFromTruck(package)
+        for truck in self.fleet:
+            truck.pickups = [(waiting, list_name) for waiting, list_name in truck.pickups if waiting != package]
+        for package_list in (self.packages_with_no_restrictions, self.packages_not_available):
+            if package in package_list:
+                package_list.remove(package)
+        self.held_packages.discard(package_id)
+        self.planned_misses.pop(package_id, None)
+        package.markCancelled()
+        self.timeline.recordStatus(self.current_time, package)
+        for truck in self.fleet:
+            self.wakeTruck(truck)
+        return True
+
+    # Takes a package off the truck it is loaded on. With a deadline router, the truck's route is repaired around the
+    # stop that was removed. Returns the truck, or None if the package isn't on one.
+    def removeFromTruck(self, package):
+        for truck in self.fleet:
+            if package in truck.packages and self.deadline_router is not None:
+                location_code, start_time = self.returnRouteStart(truck)
+                ordered, late = self.deadline_router.removePackages(location_code, start_time, truck.speed,
+                                                                    truck.packages, [package], 0)
+                truck.packages[:] = ordered
+                self.updatePlannedMisses(truck, late)
+                return truck
+            for package_list in (truck.packages_with_deadline, truck.packages, truck.packages_to_hold):
+                if package in package_list:
+                    package_list.remove(package)
+                    return truck
+        return None
+
+    # If a truck is waiting (not driving), decide where it goes next. A truck that sets off leaves now, so its clock is
+    # moved up to the current time; a truck that still has nothing to do keeps its clock where it was.
+    def wakeTruck(self, truck):
+        if not truck.en_route:
+            waiting_since = truck.truck_time
+            truck.truck_time = max(truck.truck_time, self.current_time)
+            self.dispatchTruck(truck)
+            if not truck.en_route:
+                truck.truck_time = waiting_since
+
+    # Decides where a truck that is not driving goes next, and schedules its arrival there. A truck that has been called
+    # back goes to the depot. At the depot it loads anything waiting for it, and only sets off if it gets a driver.
+    # Otherwise it drives to its next package, or back to the depot once it has nothing left to deliver. A truck with
+    # nothing to do waits where it is.
+    def dispatchTruck(self, truck):
+        if truck.location_code == 0 and (truck.return_to_depot or truck.pickups or
+                                         (truck.returnLoadCount() == 0 and self.packages_with_no_restrictions)):
+            self.reloadTruck(truck)
+        if truck.location_code == 0 and self.chooseNextPackage(truck) is not None and not self.takeDriver(truck):
+            return
+        if truck.return_to_depot and truck.location_code != 0:
+            self.scheduleArrival(truck, 0)
+            return
+        next_stop = self.chooseNextPackage(truck)
+        if next_stop is not None:
+            self.scheduleArrival(truck, next_stop.location_code)
+        elif truck.location_code != 0 and not truck.packages_to_hold:
+            self.scheduleArrival(truck, 0)
+
+    # Gives a truck at the depot a driver, if it doesn't have one and one is free. Returns True if the truck has a
+    # driver. A truck that doesn't get one is put in line for the next driver back. With a deadline router, a truck that
+    # had to wait plans its route again from the time it actually leaves.
+    def takeDriver(self, truck):
+        if truck in self.trucks_out:
+            return True
+        if len(self.trucks_out) >= self.fleet.returnDriverCount():
+            if truck not in self.trucks_waiting_for_driver:
+                self.trucks_waiting_for_driver.append(truck)
+            return False
+        self.trucks_out.add(truck)
+        if truck in self.trucks_waiting_for_driver:
+            self.trucks_waiting_for_driver.remove(truck)
+            self.planTruckRoute(truck)
+        return True
+
+    # A truck is back at the depot, so its driver is free. The driver goes to the trucks that have been waiting
+    # longest; the truck that came back gets a driver again afterwards if there is one left.
+    def releaseDriver(self, truck):
+        self.trucks_out.discard(truck)
+        for waiting in list(self.trucks_waiting_for_driver):
+            self.wakeTruck(waiting)
+
+    # Schedules a truck's arrival at a location, based on the distance from where it is now and its speed
+    def scheduleArrival(self, truck, destination):
+        distance = self.new_packages.address_matrix.lookupDistance(truck.location_code, destination)
+        arrival_time = truck.truck_time + SimClock.travelSeconds(distance, truck.speed) if distance > 0 else \
+            truck.truck_time
+        truck.en_route = True
+        truck.destination = destination
+        truck.arrival_time = arrival_time
+        self.events.addEvent(arrival_time, EVENT_ARRIVAL, (truck, destination))
+
+    # Returns the next package a truck should deliver, or None if it has nothing it can deliver. Time sensitive packages
+    # go first (closest first), then the regular packages (closest first, or in planned order when there is a route
+    # optimizer or deadline router), and finally the packages that were held back, once they can be delivered. With a
+    # route optimizer the regular packages are put in order when the first of them is picked, starting from where the
+    # truck is then (usually its last time sensitive stop) rather than from the depot.
+    def chooseNextPackage(self, truck):
+        if truck.packages_with_deadline:
+            return self.calculateClosestVertex(truck.location_code, truck.packages_with_deadline)
+        if truck.packages:
+            if self.deadline_router is not None:
+                return truck.packages[0]
+            if self.route_optimizer is not None:
+                if truck not in self.optimized_trucks:
+                    truck.packages[:] = self.route_optimizer.optimizePackageList(truck.location_code, truck.packages)
+                    self.optimized_trucks.add(truck)
+                return truck.packages[0]
+            return self.calculateClosestVertex(truck.location_code, truck.packages)
+        for package in truck.packages_to_hold:
+            if package.id not in self.held_packages:
+                return package
+        return None
+
+    # Loads a truck at the depot: first anything waiting for it, then as many packages without restrictions as fit.
+    def reloadTruck(self, truck):
+        truck.return_to_depot = False
+        for package, list_name in truck.pickups:
+            getattr(truck, list_name).append(package)
+        truck.pickups = []
+        self.loadRemainingSpace([truck])
+        if self.deadline_router is not None:
+            self.planTruckRoute(truck)
+        # the new load is put in route order once the truck gets to its regular packages (see chooseNextPackage)
+        self.optimized_trucks.discard(truck)
+        self.updateTruckStatusToLoaded(truck)
+
+    # With a deadline router, puts a truck's time sensitive and regular packages on one route. planned is the part of
+    # the truck's load that already has a planned route; everything else on the truck is added to it.
+    def planTruckRoute(self, truck, planned=()):
+        if self.deadline_router is None:
+            return
+        planned = list(planned)
+        already_planned = set(planned)
+        new_packages = [package for package in truck.packages_with_deadline + truck.packages
+                        if package not in already_planned]
+        truck.packages_with_deadline[:] = []
+        truck.packages[:] = planned
+        self.insertIntoRoute(truck, new_packages)
+
+    # With a deadline router, plans the routes of several trucks at once on the route planner. Each truck's stops are
+    # sent as location codes and package deadlines, and the routes that come back are turned into package orders here.
+    # Gives the same routes as planTruckRoute does one truck at a time.
+    def planTruckRoutes(self, trucks):
+        if self.deadline_router is None:
+            return
+        jobs = []
+        for truck in trucks:
+            packages = truck.packages_with_deadline + truck.packages
+            location_code, start_time = self.returnRouteStart(truck)
+            jobs.append((location_code, start_time, truck.speed,
+                         array('l', (package.location_code for package in packages)),
+                         array('l', (package.deadline_seconds for package in packages)), 0))
+        routes = self.route_planner.planRoutes(jobs)
+        for truck, (location_code, start_time, speed, _, _, _), route in zip(trucks, jobs, routes):
+            packages_by_location = {}
+            for package in truck.packages_with_deadline + truck.packages:
+                packages_by_location.setdefault(package.location_code, []).append(package)
+            ordered, late = self.deadline_router.joinRoute([location_code] + list(route), start_time, speed,
+                                                           packages_by_location)
+            truck.packages_with_deadline[:] = []
+            truck.packages[:] = ordered
+            self.updatePlannedMisses(truck, late)
+
+    # Adds packages to the planned route of a truck, using the deadline router. Routes always end back at the depot.
+    def insertIntoRoute(self, truck, packages):
+        location_code, start_time = self.returnRouteStart(truck)
+        ordered, late = self.deadline_router.insertPackages(location_code, start_time, truck.speed, truck.packages,
+                                                            packages, 0)
+        truck.packages[:] = ordered
+        self.updatePlannedMisses(truck, late)
+
+    # Returns the location and time a truck's route is planned from: the stop it is driving to and when it gets there,
+    # or where it is now if it isn't driving
+    def returnRouteStart(self, truck):
+        if truck.en_route:
+            return truck.destination, truck.arrival_time
+        return truck.location_code, max(truck.truck_time, self.current_time)
+
+    # Replaces the planned misses for a truck with the (package, planned arrival) pairs of its latest plan
+    def updatePlannedMisses(self, truck, late):
+        for package_id, (truck_number, _) in list(self.planned_misses.items()):
+            if truck_number == truck.truck_number:
+                del self.planned_misses[package_id]
+        for package, arrival in late:
+            self.planned_misses[package.id] = (truck.truck_number, arrival)
+
+    # Deliver package. Update the package status with the truck's current time
+    def deliverPackage(self, truck, package):
+        package.markDelivered(truck.truck_time, truck.truck_number)
+        self.timeline.recordStatus(truck.truck_time, package, truck.truck_number, truck.miles)
 
     # adds distance to the total miles traveled for both trucks. Is incremented everytime a delivery is made, or when
     # a truck returns to the depot
     def updateTotalMiles(self, distance):
         self.total_distance_traveled = self.total_distance_traveled + distance
 
-    # Calculates the number of miles needed to get from the current location back to the depot. Increments the mileage
-    # of the truck and it's clock. Adds mileage to the total distance traveled during the simulation
-    def returnToDepotAddMiles(self, truck, current_location):
-        distance_traveled = self.new_packages.address_matrix.lookupDistance(current_location, 0)
-        truck_time = truck.deliverPackage(distance_traveled)
-        self.updateTotalMiles(distance_traveled)
-
-    # determines if time 2 is later than time 1
+    # determines if time 2 is later than time 1 (or the same time). Both times are in seconds since midnight.
     def determineIfTimeIsAfter(self, time1, time2):
-        hour_time1, minute_time1 = map(int, time1.split(':'))
-        hour_time2, minute_time2 = map(int, time2.split(':'))
-
-        if hour_time2 > hour_time1:
-            return True
-        else:
-            if hour_time2 < hour_time1:  # if given hour is before objects hour
-                return False
-            else:
-                if minute_time2 < minute_time1:  # if given minute is before objects minutes
-                    return False
-                else:
-                    return True
-
-
+        return time2 >= time1
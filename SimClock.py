@@ -0,0 +1,49 @@
+# Module for working with simulation times. Internally every time in the simulation (truck clocks, deadlines, times
+# packages become available, pause times) is an integer number of seconds since midnight. Strings are only used when
+# reading input and when showing a time to the user, so the conversions all live here.
+
+# Deadline used for packages marked "EOD" (end of day)
+END_OF_DAY = 17 * 3600
+# Time the simulation runs until when no pause time is given
+SIMULATION_END = 19 * 3600
+# Time the trucks leave the depot in the morning
+DAY_START = 8 * 3600
+
+
+# Converts a military time string ("HH:MM" or "HH:MM:SS") to seconds since midnight. Integers are assumed to already
+# be in seconds and are returned unchanged, so callers can pass either form.
+def toSeconds(time_value):
+    if isinstance(time_value, int):
+        return time_value
+    parts = time_value.strip().split(':')
+    hour = int(parts[0])
+    minute = int(parts[1]) if len(parts) > 1 else 0
+    second = int(parts[2]) if len(parts) > 2 else 0
+    return hour * 3600 + minute * 60 + second
+
+
+# Converts seconds since midnight to a "HH:MM:SS" string for display
+def toTimeString(seconds):
+    hour, remainder = divmod(int(seconds), 3600)
+    minute, second = divmod(remainder, 60)
+    return f"{hour:02d}:{minute:02d}:{second:02d}"
+
+
+# Converts a deadline as given in the package file ("10:30 AM", "9:00 AM", "EOD") to seconds since midnight
+def deadlineToSeconds(deadline):
+    deadline = deadline.strip()
+    if deadline.upper() == 'EOD':
+        return END_OF_DAY
+    time_part, _, meridiem = deadline.partition(' ')
+    seconds = toSeconds(time_part)
+    meridiem = meridiem.upper()
+    if meridiem == 'PM' and seconds < 12 * 3600:
+        seconds = seconds + 12 * 3600
+    elif meridiem == 'AM' and seconds >= 12 * 3600:
+        seconds = seconds - 12 * 3600
+    return seconds
+
+
+# Returns the number of seconds it takes to drive a distance (miles) at a given speed (miles per hour)
+def travelSeconds(distance, speed):
+    return round(distance / speed * 3600)
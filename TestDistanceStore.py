@@ -0,0 +1,131 @@
+# Tests for the packed distance matrix and the distance store file. Run with python -m unittest TestDistanceStore
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import DataStructures
+import DistanceStore
+import Package
+
+FILES = ('packages.csv', 'distances.csv', 'addresslist.csv')
+
+
+# Returns a DistanceMatrix and a PackedDistanceMatrix holding the same random distances between size locations
+def buildMatrices(size, seed=0):
+    generator = random.Random(seed)
+    dense = DataStructures.DistanceMatrix(size)
+    packed = DataStructures.PackedDistanceMatrix(size)
+    for row_index in range(size):
+        distances = [round(generator.uniform(0.5, 30), 1) for _ in range(row_index)] + [0.0]
+        dense.addRowToMatrix(row_index, distances)
+        packed.addRowToMatrix(row_index, distances)
+    return dense, packed
+
+
+# Tests that the packed matrix, in memory or in a distance store file, gives the same distances as the full matrix
+class PackedDistanceMatrixTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # Checks every lookup, row and block of rows of matrix against dense. Packed values are 4 byte floats, so they
+    # are compared to 5 places.
+    def assertSameDistances(self, dense, matrix):
+        size = dense.size
+        for source in range(size):
+            for dest in range(size):
+                self.assertAlmostEqual(matrix.lookupDistance(source, dest), dense.lookupDistance(source, dest), 5)
+            for dest, distance in enumerate(matrix.returnRow(source)):
+                self.assertAlmostEqual(distance, dense.lookupDistance(source, dest), 5)
+        for start in range(size):
+            for stop in range(start, size + 1):
+                expected = dense.returnRows(start, stop)
+                rows = matrix.returnRows(start, stop)
+                self.assertEqual(len(rows), len(expected))
+                for distance, expected_distance in zip(rows, expected):
+                    self.assertAlmostEqual(distance, expected_distance, 5)
+
+    def testInMemory(self):
+        for size in (1, 2, 3, 12):
+            with self.subTest(size=size):
+                dense, packed = buildMatrices(size)
+                self.assertSameDistances(dense, packed)
+
+    def testDistanceStoreFile(self):
+        dense, packed = buildMatrices(12)
+        path = os.path.join(self.directory.name, 'distances.tdsdist')
+
+        def loadRows(matrix):
+            for row_index in range(12):
+                matrix.addRowToMatrix(row_index, [packed.lookupDistance(row_index, dest)
+                                                  for dest in range(row_index + 1)])
+        DistanceStore.buildDistanceFile(path, 12, loadRows).close()
+        stored = DistanceStore.openDistanceFile(path)
+        try:
+            self.assertSameDistances(dense, stored)
+        finally:
+            stored.close()
+
+    # The neighbor index built from the packed matrix matches the one built from the full matrix
+    def testNeighborIndex(self):
+        dense, packed = buildMatrices(40, seed=3)
+        self.assertEqual(DataStructures.NeighborIndex(packed, 5).neighbors,
+                         DataStructures.NeighborIndex(dense, 5).neighbors)
+
+
+# Tests that a distance store is only reused for the distance csv it was built from, as that file is now
+class DistanceStoreUpToDateTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename_distances = os.path.join(self.directory.name, 'distances.csv')
+        shutil.copyfile('distances.csv', self.filename_distances)
+        self.path = os.path.join(self.directory.name, 'distances.tdsdist')
+        packages = Package.PackagesToBeDelivered(FILES[0], self.filename_distances, FILES[2], 27,
+                                                 distance_store=self.path)
+        packages.address_matrix.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testUnchanged(self):
+        self.assertTrue(DistanceStore.isUpToDate(self.path, 27, self.filename_distances))
+        self.assertFalse(DistanceStore.isUpToDate(self.path, 26, self.filename_distances))
+
+    def testDifferentPath(self):
+        other = os.path.join(self.directory.name, 'other.csv')
+        shutil.copy2(self.filename_distances, other)
+        self.assertFalse(DistanceStore.isUpToDate(self.path, 27, other))
+
+    def testDifferentSize(self):
+        stat = os.stat(self.filename_distances)
+        with open(self.filename_distances, 'a', encoding='utf-8') as writer:
+            writer.write('\n')
+        os.utime(self.filename_distances, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertFalse(DistanceStore.isUpToDate(self.path, 27, self.filename_distances))
+
+    def testDifferentModificationTime(self):
+        stat = os.stat(self.filename_distances)
+        os.utime(self.filename_distances, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+        self.assertFalse(DistanceStore.isUpToDate(self.path, 27, self.filename_distances))
+
+    # A store built from one csv is rebuilt, not reused, when it is opened for a different csv
+    def testRebuiltForDifferentCsv(self):
+        filename_ones = os.path.join(self.directory.name, 'ones.csv')
+        with open(filename_ones, 'w', encoding='utf-8') as writer:
+            for row_index in range(27):
+                writer.write(','.join(['1.0'] * row_index + ['0']) + '\n')
+        packages = Package.PackagesToBeDelivered(FILES[0], filename_ones, FILES[2], 27, distance_store=self.path)
+        try:
+            self.assertEqual(packages.address_matrix.lookupDistance(0, 1), 1.0)
+        finally:
+            packages.address_matrix.close()
+        self.assertTrue(DistanceStore.isUpToDate(self.path, 27, filename_ones))
+        self.assertFalse(DistanceStore.isUpToDate(self.path, 27, self.filename_distances))
+
+
+if __name__ == '__main__':
+    unittest.main()
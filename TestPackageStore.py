@@ -0,0 +1,99 @@
+# Tests for the package store and its indexes. Run with python -m unittest TestPackageStore
+import unittest
+
+import Package
+import SimClock
+
+FILES = ('packages.csv', 'distances.csv', 'addresslist.csv')
+
+
+# Tests that the indexes of the store of the sample day stay in step with its columns as packages change
+class PackageStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.packages = Package.PackagesToBeDelivered(*FILES, 27)
+        self.store = self.packages.package_store
+
+    # Checks every index of store against a scan of the column it is built from
+    def assertIndexesMatchColumns(self, store):
+        for name, column_name in store.INDEXES.items():
+            column = getattr(store, column_name)
+            expected = {}
+            for row, value in enumerate(column):
+                if name != 'truck' or value >= 0:
+                    expected.setdefault(value, set()).add(row)
+            with self.subTest(index=name):
+                self.assertEqual({value: set(rows) for value, rows in store.indexes[name].items()}, expected)
+                for value, rows in expected.items():
+                    self.assertEqual(set(store.returnRows(name, value)), rows)
+                    self.assertEqual(store.countRows(name, value), len(rows))
+
+    def testSetStatus(self):
+        first = self.packages.returnPackageByID(1)
+        second = self.packages.returnPackageByID(2)
+        at_hub = self.store.countRows('status', Package.STATUS_AT_HUB)
+        first.markLoaded(1)
+        second.markLoaded(1)
+        self.assertEqual(self.store.returnRows('truck', 1), [first.row, second.row])
+        self.assertEqual(self.store.countRows('status', Package.STATUS_LOADED), 2)
+        self.assertEqual(self.store.countRows('status', Package.STATUS_AT_HUB), at_hub - 2)
+
+        first.markDelivered(SimClock.toSeconds('09:00'), 1)
+        self.assertEqual(self.store.returnRows('status', Package.STATUS_DELIVERED), [first.row])
+        self.assertEqual(self.store.returnRows('status', Package.STATUS_LOADED), [second.row])
+        self.assertEqual(self.store.returnRows('truck', 1), [first.row, second.row])
+
+        # a status with no truck takes the row out of the truck index, and empty entries are dropped
+        second.updateDeliveryStatus('Damaged')
+        self.assertEqual(self.store.returnRows('truck', 1), [first.row])
+        self.assertEqual(self.store.returnRows('status', Package.STATUS_OTHER), [second.row])
+        self.assertNotIn(Package.STATUS_LOADED, self.store.indexes['status'])
+        self.assertNotIn(-1, self.store.indexes['truck'])
+        self.assertIndexesMatchColumns(self.store)
+
+    def testSetAddress(self):
+        package = self.packages.returnPackageByID(9)
+        old_zip = self.store.zip_codes[package.row]
+        old_location = package.location_code
+        package.updateAddress('410 S State St', 'Salt Lake City', '84111', 19)
+        new_zip = self.store.strings.codes['84111']
+        self.assertIn(package.row, self.store.returnRows('zip', new_zip))
+        self.assertNotIn(package.row, self.store.returnRows('zip', old_zip))
+        self.assertIn(package.row, self.store.returnRows('location', 19))
+        self.assertNotIn(package.row, self.store.returnRows('location', old_location))
+        self.assertIn(package, self.packages.returnPackagesByZip('84111'))
+        self.assertIn(package, self.packages.returnPackagesByLocation(19))
+        self.assertIndexesMatchColumns(self.store)
+
+    def testSetDeadline(self):
+        package = self.packages.returnPackageByID(9)
+        package.updateDeadline('9:00 AM')
+        rows = self.store.returnRowsDueBy(SimClock.toSeconds('09:00'))
+        self.assertIn(package.row, rows)
+        self.assertEqual(self.store.deadline_seconds[rows[0]], min(self.store.deadline_seconds))
+        self.assertIndexesMatchColumns(self.store)
+
+    # Changes to a copy leave the original's columns and indexes alone
+    def testCopy(self):
+        package = self.packages.returnPackageByID(1)
+        copy = self.store.copy()
+        copy.setStatus(package.row, Package.STATUS_LOADED, truck_number=2)
+        self.assertEqual(self.store.status_codes[package.row], Package.STATUS_AT_HUB)
+        self.assertEqual(self.store.returnRows('truck', 2), [])
+        self.assertEqual(copy.returnRows('truck', 2), [package.row])
+        self.assertIndexesMatchColumns(self.store)
+        self.assertIndexesMatchColumns(copy)
+
+    # Rebuilding the indexes from the columns gives the same indexes that were kept up to date along the way
+    def testRebuildIndexes(self):
+        self.packages.returnPackageByID(3).markLoaded(2)
+        self.packages.returnPackageByID(4).markDelivered(SimClock.toSeconds('10:00'), 1)
+        self.packages.returnPackageByID(5).updateAddress('410 S State St', 'Salt Lake City', '84111', 19)
+        indexes = {name: {value: set(rows) for value, rows in index.items()}
+                   for name, index in self.store.indexes.items()}
+        self.store.rebuildIndexes()
+        self.assertEqual({name: {value: set(rows) for value, rows in index.items()}
+                          for name, index in self.store.indexes.items()}, indexes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# Tests for the package status reports. Run with python -m unittest TestReportWriter
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import Package
+import ReportWriter
+import SimClock
+
+FILES = ('packages.csv', 'distances.csv', 'addresslist.csv')
+
+
+# Tests the order, fields and formats of reports on the packages of the sample day
+class ReportWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.packages = Package.PackagesToBeDelivered(*FILES, 27)
+        self.store = self.packages.package_store
+
+    # Marks the package with the given id as delivered by truck_number at time (HH:MM)
+    def deliver(self, package_id, truck_number, time):
+        self.packages.returnPackageByID(package_id).markDelivered(SimClock.toSeconds(time), truck_number)
+
+    def testOrderById(self):
+        ids = [row['package_id'] for row in ReportWriter.generatePackageRows(self.store, ['package_id'])]
+        self.assertEqual(ids, sorted(self.store.ids))
+        self.assertEqual(len(ids), len(self.store))
+
+    def testOrderByRow(self):
+        ids = [row['package_id'] for row in ReportWriter.generatePackageRows(self.store, ['package_id'], 'row')]
+        self.assertEqual(ids, list(self.store.ids))
+
+    # Packages come by truck, delivered ones in delivery order, then the ones still on the truck by id, and packages
+    # without a truck last, by id
+    def testOrderByTruck(self):
+        self.deliver(7, 2, '09:30')
+        self.deliver(3, 2, '09:10')
+        self.deliver(5, 1, '10:00')
+        self.packages.returnPackageByID(4).markLoaded(1)
+        self.packages.returnPackageByID(2).markLoaded(1)
+        rows = list(ReportWriter.generatePackageRows(self.store, ['package_id', 'truck'], 'truck'))
+        self.assertEqual([(row['package_id'], row['truck']) for row in rows[:5]],
+                         [(5, 1), (2, 1), (4, 1), (3, 2), (7, 2)])
+        others = [row['package_id'] for row in rows[5:]]
+        self.assertEqual(others, sorted(set(self.store.ids) - {2, 3, 4, 5, 7}))
+        self.assertTrue(all(row['truck'] is None for row in rows[5:]))
+
+    # Rows hold the chosen fields, in the chosen order, after any extra fields
+    def testFieldSelection(self):
+        self.deliver(1, 1, '08:46')
+        rows = ReportWriter.generatePackageRows(self.store, ['status', 'package_id', 'delivery_time'],
+                                                extra={'run': 3})
+        first = next(rows)
+        self.assertEqual(list(first), ['run', 'status', 'package_id', 'delivery_time'])
+        self.assertEqual(first, {'run': 3, 'status': 'Delivered at 08:46:00, On Truck 1', 'package_id': 1,
+                                 'delivery_time': '08:46:00'})
+        self.assertIsNone(next(rows)['delivery_time'])
+
+    def testDefaultFields(self):
+        row = next(ReportWriter.generatePackageRows(self.store))
+        self.assertEqual(tuple(row), ReportWriter.PACKAGE_FIELDS)
+        package = self.packages.returnPackageByID(1)
+        self.assertEqual((row['address'], row['city'], row['zip'], row['deadline'], row['status']),
+                         (package.address, package.city, package.zip, package.deadline, 'at the hub'))
+
+    def testUnknownNames(self):
+        with self.assertRaises(ValueError):
+            list(ReportWriter.generatePackageRows(self.store, ['package_id', 'colour']))
+        with self.assertRaises(ValueError):
+            list(ReportWriter.generatePackageRows(self.store, order='zip'))
+        with self.assertRaises(ValueError):
+            ReportWriter.writePackageReport(self.store, 'xml', os.devnull)
+
+    def testCsvReport(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.csv')
+            count = ReportWriter.writePackageReport(self.store, 'csv', path, ['package_id', 'zip'], 'row')
+            with open(path, newline='', encoding='utf-8') as reader:
+                lines = list(csv.reader(reader))
+        self.assertEqual(count, len(self.store))
+        self.assertEqual(lines[0], ['package_id', 'zip'])
+        self.assertEqual([int(line[0]) for line in lines[1:]], list(self.store.ids))
+
+    def testJsonLinesReport(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.jsonl')
+            ReportWriter.writePackageReport(self.store, 'jsonl', path, ['package_id', 'truck'])
+            with open(path, encoding='utf-8') as reader:
+                rows = [json.loads(line) for line in reader]
+        self.assertEqual(rows[0], {'package_id': 1, 'truck': None})
+        self.assertEqual(len(rows), len(self.store))
+
+    # A sink with a small buffer writes out the same text as one that collects everything first
+    def testSinkBuffering(self):
+        outputs = []
+        for buffer_rows in (1, 7, ReportWriter.BUFFER_ROWS):
+            stream = io.StringIO()
+            sink = ReportWriter.TextSink(stream, ReportWriter.TEXT_FIELDS, buffer_rows)
+            sink.writeRows(ReportWriter.generatePackageRows(self.store, ReportWriter.TEXT_FIELDS))
+            sink.close()
+            outputs.append(stream.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+        self.assertEqual(outputs[0].count('\n'), len(self.store))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+# Tests for the run history database. Run with python -m unittest TestRunHistory
+import os
+import tempfile
+import unittest
+
+import Package
+import RouteAssigner
+import RouteOptimizer
+import RunHistory
+import Sim
+
+FILES = ('packages.csv', 'distances.csv', 'addresslist.csv')
+
+
+# Returns a simulation of the sample day, with its special handling rules, run to the end of the day
+def runSampleDay(routing='planned'):
+    simulation = Sim.Simulation(*FILES, 27, 16, filename_of_constraints='constraints.csv')
+    if routing == 'planned':
+        distance_matrix = simulation.new_packages.address_matrix
+        simulation.route_assigner = RouteAssigner.SavingsAssigner(distance_matrix)
+        simulation.deadline_router = RouteOptimizer.DeadlineRouter(distance_matrix)
+    simulation.loadAndDeliver()
+    return simulation
+
+
+# Tests that record runs of the sample day in a database in a temporary directory and read them back
+class RunHistoryTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.planned = runSampleDay('planned')
+        cls.nearest = runSampleDay('nearest')
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.history = RunHistory.RunHistory(os.path.join(self.directory.name, 'history.sqlite'))
+
+    def tearDown(self):
+        self.history.close()
+        self.directory.cleanup()
+
+    def testRecordRun(self):
+        run_id = self.history.recordRun(self.planned, {'constraints': 'constraints.csv', 'trucks': None})
+        run = self.history.returnRun(run_id)
+        store = self.planned.new_packages.package_store
+        self.assertAlmostEqual(run['total_miles'], self.planned.total_distance_traveled)
+        self.assertEqual((run['packages'], run['delivered'], run['late']), (len(store), len(store), 0))
+        self.assertEqual(run['settings']['routing'], 'planned')
+        self.assertEqual(run['settings']['constraints'], 'constraints.csv')
+        # a setting given as None is read from the simulation instead
+        self.assertEqual(run['settings']['trucks'], len(self.planned.fleet))
+        totals = self.history.returnTruckTotals(run_id)
+        self.assertEqual(run['finish_time'], max(total['finish_time'] for total in totals))
+        self.assertIsNone(self.history.returnRun(run_id + 1))
+
+    def testTruckTotals(self):
+        run_id = self.history.recordRun(self.planned)
+        totals = self.history.returnTruckTotals(run_id)
+        self.assertEqual([total['truck_number'] for total in totals],
+                         [truck.truck_number for truck in self.planned.fleet])
+        self.assertAlmostEqual(sum(total['miles'] for total in totals), self.planned.total_distance_traveled, 5)
+        self.assertEqual(sum(total['delivered'] for total in totals), len(self.planned.new_packages.package_store))
+
+    def testPackageEvents(self):
+        run_id = self.history.recordRun(self.planned)
+        events = self.history.returnPackageEvents(run_id)
+        self.assertEqual(len(events), len(self.planned.timeline.times))
+        self.assertEqual([event['time'] for event in events], sorted(event['time'] for event in events))
+
+        package_events = self.history.returnPackageEvents(run_id, package_id=9)
+        self.assertTrue(package_events)
+        self.assertTrue(all(event['package_id'] == 9 for event in package_events))
+        self.assertEqual(package_events[-1]['status'], 'delivered')
+        store = self.planned.new_packages.package_store
+        package = self.planned.new_packages.returnPackageByID(9)
+        self.assertEqual(package_events[-1]['truck_number'], store.status_trucks[package.row])
+
+    def testDeliveries(self):
+        run_id = self.history.recordRun(self.planned)
+        deliveries = self.history.returnDeliveries(run_id)
+        store = self.planned.new_packages.package_store
+        self.assertEqual([delivery['package_id'] for delivery in deliveries], sorted(store.ids))
+        for delivery in deliveries:
+            self.assertEqual(delivery['status_code'], Package.STATUS_DELIVERED)
+            self.assertIsNotNone(delivery['truck_number'])
+
+    # Runs come back newest first, and can be found by their settings
+    def testReturnAndFindRuns(self):
+        first = self.history.recordRun(self.planned)
+        second = self.history.recordRun(self.nearest)
+        third = self.history.recordRun(self.planned, {'trucks': 2, 'constraints': 'none'})
+        self.assertEqual([run['run_id'] for run in self.history.returnRuns()], [third, second, first])
+        self.assertEqual([run['run_id'] for run in self.history.returnRuns(limit=2)], [third, second])
+        self.assertEqual([run['run_id'] for run in self.history.findRuns(routing='planned')], [third, first])
+        self.assertEqual([run['run_id'] for run in self.history.findRuns(routing='nearest')], [second])
+        self.assertEqual([run['run_id'] for run in self.history.findRuns(routing='planned', constraints='none')],
+                         [third])
+        self.assertEqual(self.history.findRuns(trucks=5), [])
+        self.assertGreater(self.history.returnRun(second)['total_miles'], self.history.returnRun(first)['total_miles'])
+
+    # Deleting a run deletes its truck totals and package events with it, and leaves other runs alone
+    def testDeleteRun(self):
+        first = self.history.recordRun(self.planned)
+        second = self.history.recordRun(self.nearest)
+        self.history.deleteRun(first)
+        self.assertIsNone(self.history.returnRun(first))
+        self.assertEqual(self.history.returnTruckTotals(first), [])
+        self.assertEqual(self.history.returnPackageEvents(first), [])
+        self.assertEqual([run['run_id'] for run in self.history.returnRuns()], [second])
+        self.assertTrue(self.history.returnPackageEvents(second))
+
+    # Runs recorded through one connection are there when the database is opened again
+    def testReopen(self):
+        run_id = self.history.recordRun(self.planned)
+        with RunHistory.RunHistory(self.history.path) as history:
+            self.assertEqual(history.returnRun(run_id), self.history.returnRun(run_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# Regression tests for the simulation's special handling rules. Run with python -m unittest TestSimulation
+import os
+import tempfile
+import unittest
+
+import Package
+import RouteAssigner
+import RouteOptimizer
+import Sim
+import SimClock
+import Truck
+
+FILES = ('packages.csv', 'distances.csv', 'addresslist.csv')
+
+
+# Tests that build a simulation of the sample day with a rules file written for the test
+class SimulationRulesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # Returns a simulation of the sample day with the given rules lines, with planned or nearest neighbor routing
+    def buildSimulation(self, rules, routing='planned', fleet=None, simulation_class=Sim.Simulation):
+        filename_constraints = os.path.join(self.directory.name, 'constraints.csv')
+        with open(filename_constraints, 'w', encoding='utf-8') as writer:
+            writer.write('\n'.join(rules) + '\n')
+        simulation = simulation_class(*FILES, 27, 16, fleet=fleet, filename_of_constraints=filename_constraints)
+        if routing == 'planned':
+            distance_matrix = simulation.new_packages.address_matrix
+            simulation.route_assigner = RouteAssigner.SavingsAssigner(distance_matrix)
+            simulation.deadline_router = RouteOptimizer.DeadlineRouter(distance_matrix)
+        return simulation
+
+    # A package with a wrong address that is at the depot from the start is held on its truck until the correction,
+    # then delivered to the new address
+    def testAddressCorrectionWithoutLateArrival(self):
+        for routing in ('planned', 'nearest'):
+            with self.subTest(routing=routing):
+                simulation = self.buildSimulation(['9,address,10:20,410 S State St,Salt Lake City,84111'], routing)
+                simulation.loadAndDeliver()
+                store = simulation.new_packages.package_store
+                package = simulation.new_packages.returnPackageByID(9)
+                self.assertEqual(store.countRows('status', Package.STATUS_DELIVERED), len(store))
+                self.assertEqual(package.address, '410 S State St')
+                self.assertGreaterEqual(store.status_times[package.row], SimClock.toSeconds('10:20'))
+
+    # A group of packages larger than a truck can hold is reported rather than overloading the truck
+    def testGroupLargerThanTruck(self):
+        rules = [f"{package_id},group,A" for package_id in range(1, 21)]
+        for routing in ('planned', 'nearest'):
+            with self.subTest(routing=routing):
+                with self.assertRaises(ValueError):
+                    self.buildSimulation(rules, routing).loadAndDeliver()
+
+    # More packages restricted to a truck than it can hold are reported rather than overloading the truck
+    def testTruckRestrictionsOverCapacity(self):
+        rules = [f"{package_id},truck,1" for package_id in range(1, 18)]
+        with self.assertRaises(ValueError):
+            self.buildSimulation(rules).loadAndDeliver()
+
+    # On the sample day, following the route optimizer's order drives no further than picking the nearest package at
+    # every stop, and delivers nothing late
+    def testRouteOptimizerNotLongerThanNearest(self):
+        with open('constraints.csv', encoding='utf-8') as reader:
+            rules = reader.read().splitlines()
+        miles = {}
+        for optimized in (False, True):
+            simulation = self.buildSimulation(rules, 'nearest')
+            if optimized:
+                simulation.route_optimizer = RouteOptimizer.RouteOptimizer(simulation.new_packages.address_matrix)
+            simulation.loadAndDeliver()
+            store = simulation.new_packages.package_store
+            self.assertEqual(store.countRows('status', Package.STATUS_DELIVERED), len(store))
+            self.assertEqual(store.returnLateRows(), [])
+            miles[optimized] = simulation.total_distance_traveled
+        self.assertLessEqual(miles[True], miles[False])
+
+    # With fewer drivers than trucks, no more trucks than drivers are ever away from the depot, and every package is
+    # still delivered
+    def testDriverLimit(self):
+        test = self
+
+        # Checks the number of trucks out every time one sets off
+        class CheckedSimulation(Sim.Simulation):
+            def scheduleArrival(self, truck, destination):
+                test.assertIn(truck, self.trucks_out)
+                test.assertLessEqual(len(self.trucks_out), self.fleet.returnDriverCount())
+                super().scheduleArrival(truck, destination)
+
+        for routing in ('planned', 'nearest'):
+            for drivers in (1, 2):
+                with self.subTest(routing=routing, drivers=drivers):
+                    simulation = self.buildSimulation([], routing, Truck.Fleet(3, 16, drivers=drivers),
+                                                      CheckedSimulation)
+                    simulation.loadAndDeliver()
+                    store = simulation.new_packages.package_store
+                    self.assertEqual(store.countRows('status', Package.STATUS_DELIVERED), len(store))
+                    self.assertFalse(simulation.trucks_waiting_for_driver)
+
+
+if __name__ == '__main__':
+    unittest.main()
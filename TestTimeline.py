@@ -0,0 +1,63 @@
+# Tests for looking up the state of the packages at a past time. Run with python -m unittest TestTimeline
+import unittest
+
+import Package
+import SimClock
+import Timeline
+
+FILES = ('packages.csv', 'distances.csv', 'addresslist.csv')
+
+
+# Tests that record status changes for packages of the sample day and read them back
+class TimelineTest(unittest.TestCase):
+    def setUp(self):
+        self.packages = Package.PackagesToBeDelivered(*FILES, 27)
+        self.timeline = Timeline.Timeline(self.packages.package_store)
+
+    # Records the current status of a package at the given time (HH:MM)
+    def record(self, time, package, truck_number=-1):
+        self.timeline.recordStatus(SimClock.toSeconds(time), package, truck_number)
+
+    # A status set as free text is given back as that text, and later statuses replace it
+    def testStatusText(self):
+        package = self.packages.returnPackageByID(1)
+        package.updateDeliveryStatus('Damaged - returned to the hub')
+        self.record('09:00', package)
+        other = self.packages.returnPackageByID(2)
+        other.updateDeliveryStatus('Held for inspection')
+        self.record('09:15', other)
+        package.markDelivered(SimClock.toSeconds('10:00'), 1)
+        self.record('10:00', package, 1)
+
+        self.assertEqual(self.timeline.returnPackagesAt(SimClock.toSeconds('08:30')).returnStatusText(package.row),
+                         'at the hub')
+        self.assertEqual(self.timeline.returnPackagesAt(SimClock.toSeconds('09:30')).returnStatusText(package.row),
+                         'Damaged - returned to the hub')
+        self.assertEqual(self.timeline.returnPackagesAt(SimClock.toSeconds('10:00')).returnStatusText(package.row),
+                         'Delivered at 10:00:00, On Truck 1')
+        self.assertEqual(self.timeline.returnPackagesAt(SimClock.toSeconds('09:30')).returnStatusText(other.row),
+                         'Held for inspection')
+
+    # Status changes and address changes are looked up separately for each package
+    def testStatusAndAddress(self):
+        first = self.packages.returnPackageByID(1)
+        second = self.packages.returnPackageByID(2)
+        first.markLoaded(2)
+        self.record('08:00', first, 2)
+        second.markInTransit()
+        self.record('08:00', second)
+        second.updateAddress('410 S State St', 'Salt Lake City', '84111', 1)
+        self.timeline.recordAddress(SimClock.toSeconds('10:20'), second)
+
+        store = self.timeline.returnPackagesAt(SimClock.toSeconds('09:00'))
+        self.assertEqual(store.status_codes[first.row], Package.STATUS_LOADED)
+        self.assertEqual(store.status_trucks[first.row], 2)
+        self.assertEqual(store.status_codes[second.row], Package.STATUS_IN_TRANSIT)
+        self.assertNotEqual(store.strings.lookup(store.address_codes[second.row]), '410 S State St')
+        store = self.timeline.returnPackagesAt(SimClock.toSeconds('10:20'))
+        self.assertEqual(store.strings.lookup(store.address_codes[second.row]), '410 S State St')
+        self.assertEqual(store.location_codes[second.row], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
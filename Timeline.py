@@ -0,0 +1,84 @@
+# Module for recording what happened during a simulation run, so the state of the packages and trucks at any time of
+# the day can be looked up afterwards without running the simulation again.
+from array import array
+from bisect import bisect_right
+
+import Package
+
+
+# Class that records every status change (and address change) of every package, and the odometer of every truck, as
+# the simulation runs. Events are handled in time order, so each record is appended at the end and the records are
+# already sorted by time. Status changes are kept in parallel arrays (time, package row, status code, status text code,
+# truck, truck odometer); each package also keeps the positions and times of its own records, so looking up a package at a given
+# time is a binary search over that package's record times only.
+# package_store is the store of the packages being simulated, as it was before the simulation started. It is copied, so
+# later changes to the original don't affect the timeline.
+class Timeline:
+    def __init__(self, package_store):
+        self.initial_store = package_store.copy()
+        self.times = array('l')
+        self.rows = array('l')
+        self.status_codes = array('b')
+        self.status_text_codes = array('l')  # string code of the status text of STATUS_OTHER records, otherwise -1
+        self.trucks = array('l')
+        self.odometers = array('d')
+        self.records_by_row = {}  # package row -> positions of its status records
+        self.record_times_by_row = {}  # package row -> times of its status records
+        self.address_changes_by_row = {}  # package row -> list of (time, address, city, zip, location code)
+        self.address_change_times_by_row = {}  # package row -> times of its address changes
+        self.odometer_times = {}  # truck number -> times the truck's odometer was recorded
+        self.odometer_miles = {}  # truck number -> miles on the truck's odometer at those times
+
+    # Records a package status change. odometer is the miles driven by the package's truck at that time.
+    def recordStatus(self, time, package, truck_number=-1, odometer=0.0):
+        self.records_by_row.setdefault(package.row, []).append(len(self.times))
+        self.record_times_by_row.setdefault(package.row, array('l')).append(time)
+        self.times.append(time)
+        self.rows.append(package.row)
+        self.status_codes.append(package.store.status_codes[package.row])
+        self.status_text_codes.append(package.store.status_text_codes[package.row])
+        self.trucks.append(truck_number)
+        self.odometers.append(odometer)
+
+    # Records a package's new address. The package must already have been updated.
+    def recordAddress(self, time, package):
+        self.address_changes_by_row.setdefault(package.row, []).append(
+            (time, package.address, package.city, package.zip, package.location_code))
+        self.address_change_times_by_row.setdefault(package.row, array('l')).append(time)
+
+    # Records the miles driven by a truck at a given time
+    def recordOdometer(self, time, truck_number, miles):
+        self.odometer_times.setdefault(truck_number, array('l')).append(time)
+        self.odometer_miles.setdefault(truck_number, array('d')).append(miles)
+
+    # Returns a PackageStore holding every package as it was at the given time (seconds since midnight). Changes
+    # recorded at exactly that time are included.
+    def returnPackagesAt(self, time):
+        store = self.initial_store.copy()
+        times = self.times
+        for row, positions in self.records_by_row.items():
+            count = bisect_right(self.record_times_by_row[row], time)
+            if count:
+                position = positions[count - 1]
+                text_code = self.status_text_codes[position]
+                store.setStatus(row, self.status_codes[position],
+                                times[position] if self.status_codes[position] == Package.STATUS_DELIVERED else -1,
+                                self.trucks[position], store.strings.lookup(text_code) if text_code >= 0 else None)
+        for row, changes in self.address_changes_by_row.items():
+            count = bisect_right(self.address_change_times_by_row[row], time)
+            if count:
+                _, address, city, zip, location_code = changes[count - 1]
+                store.setAddress(row, address, city, zip, location_code)
+        return store
+
+    # Returns the miles a truck had driven by the given time
+    def returnTruckMilesAt(self, truck_number, time):
+        times = self.odometer_times.get(truck_number)
+        if not times:
+            return 0
+        count = bisect_right(times, time)
+        return self.odometer_miles[truck_number][count - 1] if count else 0
+
+    # Returns the miles driven by all trucks together by the given time
+    def returnTotalMilesAt(self, time):
+        return sum(self.returnTruckMilesAt(truck_number, time) for truck_number in self.odometer_times)
@@ -1,40 +1,55 @@
 # Module to manage trucks individually and in aggregate.
 import DataStructures
+import SimClock
 
 # Class to manage each individual truck throughout the delivery process. "packages" represent all packages that are
-# loaded on the truck that DO NOT have time constraints. packages_to_hold are packages that need to be held for delivery
+# loaded on the truck that DO NOT have time constraints. packages_with_deadline are packages that must be delivered by
+# a certain time, and are delivered first. packages_to_hold are packages that need to be held for delivery
 # The simulation algorithm will leave those deliveries for end of day.
+# capacity is the most packages the truck can carry at once, speed is its average speed in miles per hour, and
+# start_time is when it leaves the depot (seconds since midnight). pickups are packages that have arrived at the depot
+# for this truck, and are loaded the next time the truck is there.
 class Truck:
-    def __init__(self, truck_number=-1, miles=0, location='Depot'):
+    def __init__(self, truck_number=-1, miles=0, location='Depot', capacity=16, speed=18,
+                 start_time=SimClock.DAY_START):
         self.truck_number = truck_number  # a truck number
         self.miles = miles  # aggregate of miles driven. Starts at zero
         self.packages = []  # List of packages with no special instructions
+        self.packages_with_deadline = []
         self.packages_to_hold = []
-        self.truck_time = "08:00:00"  # "local time" on the truck
+        self.capacity = capacity
+        self.speed = speed
+        self.start_time = start_time
+        self.truck_time = start_time  # "local time" on the truck, in seconds since midnight
+        self.location_code = 0  # where the truck is (or last was). Starts at the depot
+        self.en_route = False  # True while the truck is driving to its next stop
+        self.destination = 0  # location code of the stop the truck is driving to, while en_route
+        self.arrival_time = start_time  # time the truck gets to destination, while en_route
+        self.return_to_depot = False  # True if the truck has been asked to come back to the depot
+        self.pickups = []  # (package, list name) pairs waiting at the depot to be loaded onto this truck
 
     # Given a time as a parameter, determines if the time entered as a parameter is after the trucks clock time.
-    # if so returns true, else returns false. Assumes time given is military time, with leading zeroes included
+    # if so returns true, else returns false. The time is given in seconds since midnight (military time strings are
+    # also accepted).
     def determineIfTimeIsAfter(self, delivery_time):
-        hour, minute = map(int, delivery_time.split(':'))
-
-        given_time = self.truck_time[:5]
-        given_hour, given_minute = map(int, given_time.split(':'))
-
-        if given_hour > hour:
-            return True
-        else:
-            if given_hour < hour:  # if given hour is before objects hour
-                return False
-            else:
-                if given_minute < minute:  # if given minute is before objects minutes
-                    return False
-                else:
-                    return True
+        return self.truck_time >= SimClock.toSeconds(delivery_time)
+
+    # Returns the truck clock formatted for display
+    def returnTruckTime(self):
+        return SimClock.toTimeString(self.truck_time)
 
     # Returns the list of packages to be delivered
     def returnPackages(self):
         return self.packages
 
+    # Returns the number of packages currently loaded on the truck
+    def returnLoadCount(self):
+        return len(self.packages) + len(self.packages_with_deadline) + len(self.packages_to_hold)
+
+    # Returns how many more packages fit on the truck
+    def returnSpaceRemaining(self):
+        return self.capacity - self.returnLoadCount()
+
     # Returns the number of miles driven by the truck in a given work day
     def returnMiles(self):
         return self.miles
@@ -49,59 +64,14 @@ class Truck:
 
     # Increments the truck clock. minutes are the number of minutes that should be added to the clock.
     def addTimeToClock(self, minutes):
-        hour = 0
-        minute = 0
-        seconds = 0
-        if minutes > 60:
-            hour = int(minutes / 60)
-        minute = int(minutes % 60)
-        left_over = minutes - ((hour * 60) + minute)
-        seconds = int(left_over * 60)
-        existing_hour = int(self.truck_time[:2])
-        existing_minute = int(self.truck_time[3:5])
-        existing_second = int(self.truck_time[7:9])
-
-        new_hour = hour + existing_hour
-        new_minute = minute + existing_minute
-        new_second = seconds + existing_second
-
-        if new_second > 60:
-            num = new_second % 60
-            new_second = num
-            new_minute = new_minute + 1
-
-        if new_minute > 60:
-            num = new_minute % 60
-            new_minute = num
-            new_hour = new_hour + 1
-
-        # Convert back to string
-        if new_second < 10:
-            string_second = "0" + str(new_second)
-        else:
-            string_second = str(new_second)
-
-        if new_minute < 10:
-            string_minute = "0" + str(new_minute)
-        else:
-            string_minute = str(new_minute)
-
-        if new_hour < 10:
-            string_hour = "0" + str(new_hour)
-        else:
-            string_hour = str(new_hour)
-
-        combined_time_string = string_hour + ":" + string_minute + ":" + string_second
-        self.truck_time = combined_time_string
+        self.truck_time = self.truck_time + round(minutes * 60)
 
     # Updates distance traveled and clock time for a truck. Takes the distance traveled as a parameter. Returns the
     # truck time
     def deliverPackage(self, distance):
         self.miles = self.miles + distance
-        time_elapsed = distance / 18
-        minutes = time_elapsed * 60
         if distance > 0:
-            self.addTimeToClock(minutes)
+            self.truck_time = self.truck_time + SimClock.travelSeconds(distance, self.speed)
         return self.truck_time
 
     # removes packages from the list to be delivered once they are delivered.
@@ -110,3 +80,45 @@ class Truck:
             for package in self.packages:
                 if item == package:
                     self.packages.remove(item)
+
+
+# Class to manage a group of trucks that deliver from the same depot. The trucks are numbered from 1. By default every
+# truck gets the same capacity, speed and start time; trucks with their own settings can be added with addTruck.
+# drivers is how many trucks can be out at once. By default there is a driver for every truck; with fewer, a loaded
+# truck waits at the depot until a driver comes back with another truck.
+class Fleet:
+    def __init__(self, num_trucks=2, capacity=16, speed=18, start_time=SimClock.DAY_START, drivers=None):
+        if drivers is not None and drivers < 1:
+            raise ValueError(f"A fleet needs at least one driver, not {drivers}")
+        self.trucks = []
+        self.trucks_by_number = {}
+        self.drivers = drivers
+        for truck_number in range(1, num_trucks + 1):
+            self.addTruck(Truck(truck_number, capacity=capacity, speed=speed, start_time=start_time))
+
+    # Adds a truck to the fleet
+    def addTruck(self, truck):
+        self.trucks.append(truck)
+        self.trucks_by_number[truck.truck_number] = truck
+
+    # Returns the truck with the given number
+    def returnTruck(self, truck_number):
+        return self.trucks_by_number[truck_number]
+
+    # Returns the miles driven by all trucks together
+    def returnTotalMiles(self):
+        return sum(truck.miles for truck in self.trucks)
+
+    # Returns the number of drivers, which is the number of trucks unless a smaller number was given
+    def returnDriverCount(self):
+        return len(self.trucks) if self.drivers is None else min(self.drivers, len(self.trucks))
+
+    # Returns the total number of packages the fleet can carry at once
+    def returnTotalCapacity(self):
+        return sum(truck.capacity for truck in self.trucks)
+
+    def __iter__(self):
+        return iter(self.trucks)
+
+    def __len__(self):
+        return len(self.trucks)
@@ -1,12 +1,32 @@
 # Final Project for Data Structures and Algorithsm II - C950
 # Created by: Elizabeth R. Yarrow
 # Student ID: 001172177
+import sys
+
+import CommandLine
+import Instrumentation
 import MenuControl
 
 # Press the green button in the gutter to run the script.
 if __name__ == '__main__':
+    parser = CommandLine.buildParser()
+    options = parser.parse_args()
+    if options.profile:
+        Instrumentation.enable(profile=True)
+
+    # Without the menu: run the simulations asked for, write the report and stop. The profile report goes to standard
+    # error so it doesn't mix with the output. Wrong fields or a wrong batch file are usage errors (exit status 2); runs
+    # that failed and were skipped give exit status 1.
+    if CommandLine.isNonInteractive(options):
+        try:
+            failures = CommandLine.run(options)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+        if options.profile:
+            Instrumentation.disable().printReport(sys.stderr)
+        sys.exit(1 if failures else 0)
 
-    menu = MenuControl.MainMenu()
+    menu = MenuControl.MainMenu(options.history)
     print(menu.title)
 
     choice = 0
@@ -41,6 +61,5 @@ if __name__ == '__main__':
         if choice == 4:
             print("Goodbye!")
 
-
-
-
+    if options.profile:
+        Instrumentation.disable().printReport()